@@ -14,6 +14,7 @@ Features:
 """
 
 import os
+import io
 import sys
 import json
 import time
@@ -22,14 +23,30 @@ import traceback
 import ctypes
 import platform
 import difflib
+import mmap
 import threading
+import atexit
+import asyncio
+import shlex
+import getpass
 import queue
+import secrets
 import random
+import itertools
+import heapq
+import operator
+import functools
+import hashlib
+import importlib
+import importlib.util
 import re
 import shutil
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Callable, FrozenSet
 from pathlib import Path
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_COMPLETED, wait
 import sys
 sys.stdout.reconfigure(encoding='utf-8')
 sys.stderr.reconfigure(encoding='utf-8')
@@ -74,23 +91,119 @@ class Color:
     
     RESET = '\033[0m'
 
+# ISO timestamp at one-second resolution, rebuilt only when the second changes
+_TS_CACHE = (0, "")
+
+def _now_iso():
+    global _TS_CACHE
+    t = int(time.time())
+    if t != _TS_CACHE[0]:
+        _TS_CACHE = (t, datetime.fromtimestamp(t).isoformat())
+    return _TS_CACHE[1]
+
+# Same idea at millisecond resolution, for chat timestamps that order sessions
+_TS_MS_CACHE = (0, "")
+
+def _now_iso_ms():
+    global _TS_MS_CACHE
+    t = time.time_ns() // 1_000_000
+    if t != _TS_MS_CACHE[0]:
+        _TS_MS_CACHE = (t, datetime.fromtimestamp(t / 1000).isoformat(timespec='microseconds'))
+    return _TS_MS_CACHE[1]
+
+# Summary statuses are interned so show_summary can compare them by identity
+STATUS_OK = sys.intern("✅")
+STATUS_FAIL = sys.intern("❌")
+STATUS_WARN = sys.intern("⚠️")
+STATUS_STOPPED = sys.intern("⏸️")
+STATUS_SKIPPED = sys.intern("⏭️")
+STATUS_ANALYZED = sys.intern("🔍")
+
+# Summary categories, derived once from the action text when an entry is added
+CATEGORY_INSTALL = "install"
+CATEGORY_CREATE = "create"
+CATEGORY_MODIFY = "modify"
+CATEGORY_OTHER = ""
+
+def _summary_category(action):
+    action = action.lower()
+    if "install" in action:
+        return CATEGORY_INSTALL
+    if "create" in action:
+        return CATEGORY_CREATE
+    if "modif" in action:
+        return CATEGORY_MODIFY
+    return CATEGORY_OTHER
+
+@dataclass(slots=True)
+class SummaryEntry:
+    """One line of the post-execution summary"""
+    action: str
+    target: str
+    status: str
+    details: str
+    timestamp: str
+    category: str = CATEGORY_OTHER
+
 class UI:
     """Handles all user interface interactions and styling with silent mode."""
     GHOST_MODE = False
     SILENT_ERRORS = True
-    LAST_PROGRESS_LENGTH = 0
+    PROGRESS_VISIBLE = False
     EXECUTION_SUMMARY = []
+    _buf = io.StringIO()
+    
+    # Pre-rendered styled fragments (built once, reused on every call)
+    _PREFIX_SYSTEM = f"{Color.DIM}▸ {Color.CYAN}[System]{Color.DIM}:{Color.RESET} "
+    _PREFIX_USER = f"👤 {Color.BLUE}[You]:{Color.RESET} "
+    _PREFIX_SUCCESS = "✅ "
+    _PREFIX_ERROR = "❌ "
+    _PREFIX_WARNING = "⚠️  "
+    _PREFIX_NOTE = "📝 "
+    _SEP_CYAN = f"{Color.CYAN}{'━'*50}{Color.RESET}"
+    _SEP_DIM = f"{Color.DIM}{'━'*50}{Color.RESET}"
+    _RULE_50 = f"{Color.DIM}{'='*50}{Color.RESET}"
+    _RULE_60 = f"{Color.DIM}{'='*60}{Color.RESET}"
+    _RULE = f"{Color.DIM}{'-'*40}{Color.RESET}"
+    _DIFF_COLORS = {'+': Color.GREEN, '-': Color.RED, '@': Color.BLUE}
+    _ACTION_COLORS = {'CREATE': Color.GREEN, 'MODIFY': Color.YELLOW, 'DELETE': Color.RED}
+    
+    _SPINNER_FRAMES = ("⠋", "⠙", "⠹", "⠸", "⠼", "⠴", "⠦", "⠧", "⠇", "⠏")
+    _SPINNER = itertools.cycle(_SPINNER_FRAMES)
+    _ERASE_LINE = "\r\x1b[2K"  # CR + CSI EL: erase the whole current line
+    _CLEAR_SCREEN = "\x1b[H\x1b[2J\x1b[3J"  # home, erase display, drop scrollback (like `clear`)
+    
+    # Progress redraws are capped at ~20 Hz; skipped messages wait in _PENDING_PROGRESS
+    # and are drawn by a timer at the end of the interval, even if no update follows
+    _PROGRESS_MIN_INTERVAL = 0.05
+    _LAST_DRAW_TS = 0.0
+    _PENDING_PROGRESS = None
+    _LAST_PROGRESS = None  # text currently on the progress line; redrawing it is skipped
+    _PROGRESS_TIMER = None
+    _PROGRESS_LOCK = threading.RLock()  # the trailing redraw runs on the timer's thread
+    
+    @staticmethod
+    def _emit(text=""):
+        """Queue a line in the output buffer (written on flush)"""
+        UI._buf.write(text)
+        UI._buf.write("\n")
+    
+    @staticmethod
+    def flush():
+        """Write everything queued by _emit in a single stdout write"""
+        data = UI._buf.getvalue()
+        if data:
+            sys.stdout.write(data)
+            sys.stdout.flush()
+            UI._buf.seek(0)
+            UI._buf.truncate()
     
     @staticmethod
-    def add_to_summary(action, target, status="✅", details=""):
+    def add_to_summary(action, target, status=STATUS_OK, details=""):
         """Add entry to execution summary"""
-        UI.EXECUTION_SUMMARY.append({
-            "action": action,
-            "target": target,
-            "status": status,
-            "details": details,
-            "timestamp": datetime.now().isoformat()
-        })
+        UI.EXECUTION_SUMMARY.append(SummaryEntry(
+            action, target, sys.intern(status), details, _now_iso(), _summary_category(action)
+        ))
     
     @staticmethod
     def clear_summary():
@@ -103,62 +216,66 @@ class UI:
         if not UI.EXECUTION_SUMMARY or UI.GHOST_MODE:
             return
         
-        print(f"\n{Color.CYAN}{'━'*50}{Color.RESET}")
-        print(f"{Color.BOLD}📊 Execution Summary:{Color.RESET}")
-        print(f"{Color.DIM}{'━'*50}{Color.RESET}")
+        UI._emit("\n" + UI._SEP_CYAN)
+        UI._emit(f"{Color.BOLD}📊 Execution Summary:{Color.RESET}")
+        UI._emit(UI._SEP_DIM)
         
         successes = 0
         failures = 0
         installed = []
         created = []
         modified = []
+        reset, dim = Color.RESET, Color.DIM
+        
+        by_category = {CATEGORY_INSTALL: installed, CATEGORY_CREATE: created, CATEGORY_MODIFY: modified}
         
         for entry in UI.EXECUTION_SUMMARY:
-            status_color = Color.GREEN if "✅" in entry["status"] else Color.RED if "❌" in entry["status"] else Color.YELLOW
-            print(f"{status_color}{entry['status']}{Color.RESET} {entry['action']}: {entry['target']}")
+            status = entry.status
+            is_ok = status is STATUS_OK
+            is_fail = status is STATUS_FAIL
+            status_color = Color.GREEN if is_ok else Color.RED if is_fail else Color.YELLOW
+            UI._emit(f"{status_color}{status}{reset} {entry.action}: {entry.target}")
             
-            if entry["details"]:
-                print(f"   {Color.DIM}{entry['details']}{Color.RESET}")
+            if entry.details:
+                UI._emit(f"   {dim}{entry.details}{reset}")
             
             # Categorize
-            if "✅" in entry["status"]:
+            if is_ok:
                 successes += 1
-                if "install" in entry["action"].lower():
-                    installed.append(entry["target"])
-                elif "create" in entry["action"].lower():
-                    created.append(entry["target"])
-                elif "modif" in entry["action"].lower():
-                    modified.append(entry["target"])
-            elif "❌" in entry["status"]:
+                bucket = by_category.get(entry.category)
+                if bucket is not None:
+                    bucket.append(entry.target)
+            elif is_fail:
                 failures += 1
         
-        print(f"{Color.DIM}{'━'*50}{Color.RESET}")
+        UI._emit(UI._SEP_DIM)
         
         # Show statistics
-        print(f"\n{Color.BOLD}📈 Statistics:{Color.RESET}")
-        print(f"  {Color.GREEN}✓ Successes: {successes}{Color.RESET} | {Color.RED}✗ Failures: {failures}{Color.RESET}")
+        UI._emit(f"\n{Color.BOLD}📈 Statistics:{Color.RESET}")
+        UI._emit(f"  {Color.GREEN}✓ Successes: {successes}{Color.RESET} | {Color.RED}✗ Failures: {failures}{Color.RESET}")
         
         if installed:
-            print(f"\n{Color.GREEN}📦 Installed Packages:{Color.RESET}")
+            UI._emit(f"\n{Color.GREEN}📦 Installed Packages:{Color.RESET}")
             for pkg in installed:
-                print(f"  • {pkg}")
+                UI._emit(f"  • {pkg}")
         
         if created:
-            print(f"\n{Color.BLUE}📄 Created Files:{Color.RESET}")
+            UI._emit(f"\n{Color.BLUE}📄 Created Files:{Color.RESET}")
             for file in created[:10]:
-                print(f"  • {file}")
+                UI._emit(f"  • {file}")
             if len(created) > 10:
-                print(f"  {Color.DIM}... and {len(created)-10} more{Color.RESET}")
+                UI._emit(f"  {Color.DIM}... and {len(created)-10} more{Color.RESET}")
         
         if modified:
-            print(f"\n{Color.YELLOW}✏️  Modified Files:{Color.RESET}")
+            UI._emit(f"\n{Color.YELLOW}✏️  Modified Files:{Color.RESET}")
             for file in modified[:10]:
-                print(f"  • {file}")
+                UI._emit(f"  • {file}")
             if len(modified) > 10:
-                print(f"  {Color.DIM}... and {len(modified)-10} more{Color.RESET}")
+                UI._emit(f"  {Color.DIM}... and {len(modified)-10} more{Color.RESET}")
         
-        print(f"\n{Color.CYAN}{'━'*50}{Color.RESET}")
-        print(f"{Color.GREEN}✨ Task completed successfully!{Color.RESET}\n")
+        UI._emit("\n" + UI._SEP_CYAN)
+        UI._emit(f"{Color.GREEN}✨ Task completed successfully!{Color.RESET}\n")
+        UI.flush()
         
         # Clear summary for next task
         UI.clear_summary()
@@ -174,61 +291,127 @@ class UI:
         """Single-line progress updates"""
         if UI.GHOST_MODE:
             return
+        with UI._PROGRESS_LOCK:
+            if UI.PROGRESS_VISIBLE and message == UI._LAST_PROGRESS:
+                UI._PENDING_PROGRESS = None
+                return
             
-        # Clear previous line
-        clear = " " * UI.LAST_PROGRESS_LENGTH
-        print(f"\r{clear}\r", end="", flush=True)
-        
-        # Show new progress with spinner
-        spinner = random.choice(["⠋", "⠙", "⠹", "⠸", "⠼", "⠴", "⠦", "⠧", "⠇", "⠏"])
-        display_msg = f"{Color.CYAN}{spinner}{Color.RESET} {message}"
-        print(f"\r{display_msg}", end="", flush=True)
-        UI.LAST_PROGRESS_LENGTH = len(display_msg)
+            now = time.monotonic()
+            remaining = UI._PROGRESS_MIN_INTERVAL - (now - UI._LAST_DRAW_TS)
+            if remaining > 0:
+                UI._PENDING_PROGRESS = message
+                if UI._PROGRESS_TIMER is None:
+                    # Trailing edge: the last message before a long blocking call still gets drawn
+                    UI._PROGRESS_TIMER = threading.Timer(remaining, UI._trailing_progress)
+                    UI._PROGRESS_TIMER.daemon = True
+                    UI._PROGRESS_TIMER.start()
+                return
+            UI._LAST_DRAW_TS = now
+            UI._PENDING_PROGRESS = None
+                
+            # Erase the previous line and draw the new one in a single write
+            spinner = next(UI._SPINNER)
+            sys.stdout.write(f"{UI._ERASE_LINE}{Color.CYAN}{spinner}{Color.RESET} {message}")
+            sys.stdout.flush()
+            UI.PROGRESS_VISIBLE = True
+            UI._LAST_PROGRESS = message
+    
+    @staticmethod
+    def _trailing_progress():
+        with UI._PROGRESS_LOCK:
+            UI._PROGRESS_TIMER = None
+            UI.flush_progress()
+    
+    @staticmethod
+    def flush_progress():
+        """Draw the last throttled progress message, if any"""
+        with UI._PROGRESS_LOCK:
+            message = UI._PENDING_PROGRESS
+            if message is not None:
+                UI._LAST_DRAW_TS = 0.0
+                UI.update_progress(message)
     
     @staticmethod
     def clear_progress():
         """Clear progress line"""
-        if UI.LAST_PROGRESS_LENGTH > 0:
-            print(f"\r{' ' * UI.LAST_PROGRESS_LENGTH}\r", end="", flush=True)
-            UI.LAST_PROGRESS_LENGTH = 0
+        with UI._PROGRESS_LOCK:
+            UI._PENDING_PROGRESS = None
+            UI._LAST_PROGRESS = None
+            UI._LAST_DRAW_TS = 0.0
+            if UI.PROGRESS_VISIBLE:
+                sys.stdout.write(UI._ERASE_LINE)
+                sys.stdout.flush()
+                UI.PROGRESS_VISIBLE = False
 
     @staticmethod
     def log(text, color=Color.RESET, force=False):
         if not UI.GHOST_MODE or force:
             UI.clear_progress()
-            print(f"{color}{text}{Color.RESET}")
+            UI._emit(f"{color}{text}{Color.RESET}")
+            UI.flush()
 
     @staticmethod
     def print_agent(text, model_name="XEDA"):
         if not UI.GHOST_MODE:
             UI.clear_progress()
-            print(f"\n{Color.GREEN}│{Color.RESET}")
-            print(f"{Color.GREEN}└─▶ [{model_name}]{Color.RESET} {text}")
+            UI._emit(f"\n{Color.GREEN}│{Color.RESET}")
+            UI._emit(f"{Color.GREEN}└─▶ [{model_name}]{Color.RESET} {text}")
+            UI.flush()
+
+    @staticmethod
+    def start_agent_stream(model_name="XEDA"):
+        """Open an agent reply that stream_agent_text() fills in as tokens arrive"""
+        if not UI.GHOST_MODE:
+            UI.clear_progress()
+            UI._emit(f"\n{Color.GREEN}│{Color.RESET}")
+            UI._buf.write(f"{Color.GREEN}└─▶ [{model_name}]{Color.RESET} ")
+            UI.flush()
+
+    @staticmethod
+    def stream_agent_text(text):
+        if not UI.GHOST_MODE:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+    @staticmethod
+    def end_agent_stream():
+        if not UI.GHOST_MODE:
+            sys.stdout.write("\n")
+            sys.stdout.flush()
 
     @staticmethod
     def print_system(text):
-        UI.log(f"{Color.DIM}▸ {Color.CYAN}[System]{Color.DIM}:{Color.RESET} {text}",Color.DIM)
+        UI.log(UI._PREFIX_SYSTEM + text, Color.DIM)
 
     @staticmethod
     def print_user(text):
-        UI.log(f"👤 {Color.BLUE}[You]:{Color.RESET} {text}", Color.BLUE)
+        UI.log(UI._PREFIX_USER + text, Color.BLUE)
 
     @staticmethod
     def print_success(text):
-        UI.log(f"✅ {text}{Color.RESET}", Color.GREEN, force=True)
+        UI.log(UI._PREFIX_SUCCESS + text + Color.RESET, Color.GREEN, force=True)
 
     @staticmethod
     def print_error(text, silent=True):
         if not silent:
-            UI.log(f"❌ {text}{Color.RESET}", Color.RED, force=True)
+            UI.log(UI._PREFIX_ERROR + text + Color.RESET, Color.RED, force=True)
 
     @staticmethod
     def print_warning(text):
-        UI.log(f"⚠️  {text}{Color.RESET}", Color.YELLOW, force=True)
+        UI.log(UI._PREFIX_WARNING + text + Color.RESET, Color.YELLOW, force=True)
     
     @staticmethod
     def print_note(text):
-        UI.log(f"📝 {text}{Color.RESET}", Color.CYAN, force=True)
+        UI.log(UI._PREFIX_NOTE + text + Color.RESET, Color.CYAN, force=True)
+
+    @staticmethod
+    def ask(question):
+        """Clear the progress line, ask a question and return the answer lowercased ('' on EOF)"""
+        UI.clear_progress()
+        try:
+            return input(question).strip().lower()
+        except EOFError:
+            return ""
 
     @staticmethod
     def input_prompt(path):
@@ -250,41 +433,49 @@ class UI:
         conf_color = Color.GREEN if confidence >= 80 else Color.YELLOW if confidence >= 50 else Color.RED
         
         UI.clear_progress()
-        UI.log(f"\n{Color.YELLOW}📋 Execution Plan {Color.DIM}(Model: {model_name} | Confidence: {conf_color}{confidence}%{Color.DIM} | Risk: {risk}){Color.RESET}")
+        if UI.GHOST_MODE:
+            return
+        
+        UI._emit(f"\n{Color.YELLOW}📋 Execution Plan {Color.DIM}(Model: {model_name} | Confidence: {conf_color}{confidence}%{Color.DIM} | Risk: {risk}){Color.RESET}")
         
         if analysis:
-            UI.log(f"\n{Color.CYAN}🔍 Deep Analysis:{Color.RESET}")
-            UI.log(f"{Color.DIM}{analysis}{Color.RESET}")
+            UI._emit(f"\n{Color.CYAN}🔍 Deep Analysis:{Color.RESET}")
+            UI._emit(f"{Color.DIM}{analysis}{Color.RESET}")
         
         if dependencies:
-            UI.log(f"\n{Color.MAGENTA}📦 Dependencies:{Color.RESET}")
+            UI._emit(f"\n{Color.MAGENTA}📦 Dependencies:{Color.RESET}")
             for dep in dependencies:
-                UI.log(f"  • {dep}")
+                UI._emit(f"  • {dep}")
 
         if suggestion:
-            UI.log(f"\n{Color.CYAN}💡 Teammate Tip: {suggestion}{Color.RESET}")
+            UI._emit(f"\n{Color.CYAN}💡 Teammate Tip: {suggestion}{Color.RESET}")
 
-        UI.log(f"\n{Color.DIM}----------------------------------------{Color.RESET}")
+        UI._emit("\n" + UI._RULE)
+        emit = UI._emit
+        action_colors = UI._ACTION_COLORS
+        reset, dim, magenta, cyan = Color.RESET, Color.DIM, Color.MAGENTA, Color.CYAN
         for i, step in enumerate(steps, 1):
-            action = step.get('action', '???').upper()
-            target = step.get('path') or step.get('command') or "Unknown"
-            desc = step.get('description', '')
-            reasoning = step.get('reasoning', '')
+            get = step.get
+            action = get('action', '???').upper()
+            target = get('path') or get('command') or "Unknown"
+            desc = get('description', '')
+            reasoning = get('reasoning', '')
             
-            color = Color.GREEN if action == 'CREATE' else Color.YELLOW if action == 'MODIFY' else Color.RED if action == 'DELETE' else Color.CYAN
-            UI.log(f" {i}. {color}{action:<8}{Color.RESET} {target}")
-            UI.log(f"    └─ {Color.DIM}{desc}{Color.RESET}")
+            color = action_colors.get(action, cyan)
+            emit(f" {i}. {color}{action:<8}{reset} {target}")
+            emit(f"    └─ {dim}{desc}{reset}")
             if reasoning:
-                UI.log(f"      {Color.MAGENTA}🤔 {reasoning}{Color.RESET}")
-        UI.log(f"{Color.DIM}----------------------------------------{Color.RESET}\n")
+                emit(f"      {magenta}🤔 {reasoning}{reset}")
+        UI._emit(UI._RULE + "\n")
+        UI.flush()
     
     @staticmethod
     def show_diff(file_path, old_content, new_content, model_name="AI"):
         if UI.GHOST_MODE: return
         
         UI.clear_progress()
-        print(f"\n{Color.YELLOW}🔍 Diff Preview (by {model_name}) for: {Color.BOLD}{file_path}{Color.RESET}")
-        print(f"{Color.DIM}----------------------------------------{Color.RESET}")
+        UI._emit(f"\n{Color.YELLOW}🔍 Diff Preview (by {model_name}) for: {Color.BOLD}{file_path}{Color.RESET}")
+        UI._emit(UI._RULE)
         
         diff = difflib.unified_diff(
             old_content.splitlines(),
@@ -292,16 +483,21 @@ class UI:
             lineterm=''
         )
         
+        colors = UI._DIFF_COLORS
+        dim, reset = Color.DIM, Color.RESET
+        parts = []
         for line in diff:
-            if line.startswith('+') and not line.startswith('+++'):
-                print(f"{Color.GREEN}{line}{Color.RESET}")
-            elif line.startswith('-') and not line.startswith('---'):
-                print(f"{Color.RED}{line}{Color.RESET}")
-            elif line.startswith('@'):
-                print(f"{Color.BLUE}{line}{Color.RESET}")
+            if line[:3] in ('+++', '---'):
+                color = dim
             else:
-                print(f"{Color.DIM}{line}{Color.RESET}")
-        print(f"{Color.DIM}----------------------------------------{Color.RESET}\n")
+                color = colors.get(line[:1], dim)
+            parts.append(color)
+            parts.append(line)
+            parts.append(reset)
+            parts.append("\n")
+        UI._buf.write("".join(parts))
+        UI._emit(UI._RULE + "\n")
+        UI.flush()
 
 # ==============================================================================
 # 1. PACKAGE MANAGER - AUTO INSTALLATION SYSTEM
@@ -358,120 +554,152 @@ class PackageManager:
         }
     }
     
-    # في class PackageManager، أعد كتابة دالة detect_missing_package:
-
-@staticmethod
-def detect_missing_package(error_output: str, command: str) -> tuple:
-    """Detect missing package from error output"""
-    error_lower = error_output.lower()
-    command_lower = command.lower()
-    
-    # تحسين اكتشاف npm
-    if 'npm' in command_lower or 'node' in command_lower or 'npx' in command_lower:
-        # تحقق من رسائل الخطأ الشائعة
-        error_patterns = [
-            'npm: command not found',
-            'npm: not found',
-            'npm: no such file or directory',
-            'node: command not found',
-            'node: not found'
-        ]
-        
-        for pattern in error_patterns:
-            if pattern in error_lower:
-                return 'npm', 'nodejs', "Node.js package manager"
+    # أنماط الأخطاء المعروفة - تُبنى مرة واحدة عند تحميل الكلاس
+    _NPM_ERRORS = frozenset({
+        'npm: command not found',
+        'npm: not found',
+        'npm: no such file or directory',
+        'node: command not found',
+        'node: not found'
+    })
+    _PIP_ERRORS = frozenset({
+        'pip: command not found',
+        'pip3: command not found',
+        'python: command not found',
+        'python3: command not found'
+    })
+    _PKG_PATTERNS = tuple(re.compile(p, re.IGNORECASE) for p in (
+        r"package '([^']+)' is not installed",
+        r"module '([^']+)' not found",
+        r"could not find module '([^']+)'",
+        r"command '([^']+)' not found"
+    ))
     
-    # تحسين اكتشاف pip
-    if 'pip' in command_lower or 'python' in command_lower:
-        error_patterns = [
-            'pip: command not found',
-            'pip3: command not found',
-            'python: command not found',
-            'python3: command not found'
-        ]
+    # Platform-specific installers for the managers themselves
+    _SYSTEM = platform.system().lower()
+    _INSTALL_COMMANDS = {
+        'npm': {
+            'windows': 'winget install OpenJS.NodeJS',
+            'linux': 'curl -fsSL https://deb.nodesource.com/setup_lts.x | sudo -E bash - && sudo apt-get install -y nodejs',
+            'darwin': 'brew install node'
+        },
+        'pip': {
+            'windows': 'python -m ensurepip --upgrade',
+            'linux': 'sudo apt update && sudo apt install python3-pip',
+            'darwin': 'brew install python'
+        },
+        'docker': {
+            'windows': 'winget install Docker.DockerDesktop',
+            'linux': 'curl -fsSL https://get.docker.com | sudo sh',
+            'darwin': 'brew install docker'
+        },
+        'git': {
+            'windows': 'winget install Git.Git',
+            'linux': 'sudo apt update && sudo apt install git',
+            'darwin': 'brew install git'
+        }
+    }
+    
+    @staticmethod
+    def detect_missing_package(error_output: str, command: str) -> tuple:
+        """Detect missing package from error output"""
+        error_lower = error_output.lower()
+        command_lower = command.lower()
+        
+        # تحسين اكتشاف npm
+        if 'npm' in command_lower or 'node' in command_lower or 'npx' in command_lower:
+            if any(pattern in error_lower for pattern in PackageManager._NPM_ERRORS):
+                return 'npm', 'nodejs', "Node.js package manager"
         
-        for pattern in error_patterns:
-            if pattern in error_lower:
+        # تحسين اكتشاف pip
+        if 'pip' in command_lower or 'python' in command_lower:
+            if any(pattern in error_lower for pattern in PackageManager._PIP_ERRORS):
                 return 'pip', 'python3-pip', "Python package installer"
+        
+        # اكتشاف docker
+        if 'docker' in command_lower:
+            if 'docker: command not found' in error_lower:
+                return 'docker', 'docker-ce', "Docker container platform"
+        
+        # اكتشاف git
+        if 'git' in command_lower:
+            if 'git: command not found' in error_lower:
+                return 'git', 'git', "Git version control"
+        
+        # محاولة استخراج اسم الباكج من رسالة الخطأ
+        for rx in PackageManager._PKG_PATTERNS:
+            match = rx.search(error_output)
+            if match:
+                pkg_name = match.group(1)
+                # تحديد مدير الباكج بناءً على السياق
+                if '.' in pkg_name or pkg_name.startswith('@'):
+                    return 'npm', pkg_name, f"Node.js package: {pkg_name}"
+                elif any(char.isupper() for char in pkg_name):
+                    return 'pip', pkg_name, f"Python package: {pkg_name}"
+        
+        return None, None, None
     
-    # اكتشاف docker
-    if 'docker' in command_lower:
-        if 'docker: command not found' in error_lower:
-            return 'docker', 'docker-ce', "Docker container platform"
-    
-    # اكتشاف git
-    if 'git' in command_lower:
-        if 'git: command not found' in error_lower:
-            return 'git', 'git', "Git version control"
+    @staticmethod
+    def _check_argv(check_cmd: str) -> list:
+        """Split a check command and resolve its executable (None if not on PATH)"""
+        argv = shlex.split(check_cmd)
+        executable = shutil.which(argv[0]) if argv else None
+        if not executable:
+            return None
+        argv[0] = executable
+        return argv
     
-    # محاولة استخراج اسم الباكج من رسالة الخطأ
-    patterns = [
-        r"package '([^']+)' is not installed",
-        r"module '([^']+)' not found",
-        r"could not find module '([^']+)'",
-        r"command '([^']+)' not found"
-    ]
+    @staticmethod
+    def find_executables(names) -> dict:
+        """name -> path for each of names found on PATH; one pass over PATH instead of a which() per name"""
+        windows = PackageManager._SYSTEM == 'windows'
+        wanted = {name.lower() for name in names} if windows else set(names)
+        if windows:
+            # Same extension preference as shutil.which within a directory
+            exts = [ext.lower() for ext in os.environ.get('PATHEXT', '.COM;.EXE;.BAT;.CMD').split(os.pathsep) if ext]
+            rank = {ext: i for i, ext in enumerate(exts)}
+        found = {}
+        for directory in os.get_exec_path():
+            if not directory or len(found) == len(wanted):
+                continue
+            try:
+                entries = os.scandir(directory)
+            except OSError:
+                continue
+            best = {}
+            with entries:
+                for entry in entries:
+                    if windows:
+                        stem, ext = os.path.splitext(entry.name.lower())
+                        if stem in wanted and stem not in found and ext in rank:
+                            if stem not in best or rank[ext] < best[stem][0]:
+                                best[stem] = (rank[ext], entry.path)
+                    elif entry.name in wanted and entry.name not in found:
+                        try:
+                            if entry.is_file() and os.access(entry.path, os.X_OK):
+                                found[entry.name] = entry.path
+                        except OSError:
+                            pass
+            for stem, (_, path) in best.items():
+                found[stem] = path
+        return found
     
-    for pattern in patterns:
-        match = re.search(pattern, error_output, re.IGNORECASE)
-        if match:
-            pkg_name = match.group(1)
-            # تحديد مدير الباكج بناءً على السياق
-            if '.' in pkg_name or pkg_name.startswith('@'):
-                return 'npm', pkg_name, f"Node.js package: {pkg_name}"
-            elif any(char.isupper() for char in pkg_name):
-                return 'pip', pkg_name, f"Python package: {pkg_name}"
-    
-    return None, None, None
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def is_package_manager_installed(manager: str) -> bool:
-        """Check if a package manager is installed"""
+        """Check if a package manager is on PATH (cached for the session)"""
         if manager not in PackageManager.PACKAGE_MANAGERS:
             return False
         
-        check_cmd = PackageManager.PACKAGE_MANAGERS[manager]['check']
-        try:
-            result = subprocess.run(
-                check_cmd,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            return result.returncode == 0
-        except:
-            return False
+        # A PATH lookup is enough here; running each check command would spawn a process per manager
+        return PackageManager._check_argv(PackageManager.PACKAGE_MANAGERS[manager]['check']) is not None
     
     @staticmethod
     def install_package_manager(manager: str) -> tuple:
         """Install a package manager"""
-        install_commands = {
-            'npm': {
-                'windows': 'winget install OpenJS.NodeJS',
-                'linux': 'curl -fsSL https://deb.nodesource.com/setup_lts.x | sudo -E bash - && sudo apt-get install -y nodejs',
-                'darwin': 'brew install node'
-            },
-            'pip': {
-                'windows': 'python -m ensurepip --upgrade',
-                'linux': 'sudo apt update && sudo apt install python3-pip',
-                'darwin': 'brew install python'
-            },
-            'docker': {
-                'windows': 'winget install Docker.DockerDesktop',
-                'linux': 'curl -fsSL https://get.docker.com | sudo sh',
-                'darwin': 'brew install docker'
-            },
-            'git': {
-                'windows': 'winget install Git.Git',
-                'linux': 'sudo apt update && sudo apt install git',
-                'darwin': 'brew install git'
-            }
-        }
-        
-        system = platform.system().lower()
-        
-        if manager in install_commands and system in install_commands[manager]:
-            cmd = install_commands[manager][system]
+        system = PackageManager._SYSTEM
+        cmd = PackageManager._INSTALL_COMMANDS.get(manager, {}).get(system)
+        if cmd:
             return True, cmd
         
         return False, f"Automatic installation not available for {manager} on {system}"
@@ -485,8 +713,31 @@ def detect_missing_package(error_output: str, command: str) -> tuple:
         cmd_template = PackageManager.PACKAGE_MANAGERS[manager]['global_install' if is_global else 'install']
         return f"{cmd_template} {package}"
     
+    @staticmethod
+    async def _run_shell(cmd: str) -> tuple:
+        """Run a shell command and return (returncode, stdout, stderr)"""
+        proc = await asyncio.create_subprocess_shell(
+            cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await proc.communicate()
+        return proc.returncode, stdout.decode(errors='replace'), stderr.decode(errors='replace')
+    
     @staticmethod
     def handle_missing_dependency(error_output: str, failed_command: str, store):
+        """Synchronous wrapper around handle_missing_dependency_async"""
+        coro = PackageManager.handle_missing_dependency_async(error_output, failed_command, store)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coro)
+        # asyncio.run refuses to nest; inside a running loop, run it on a worker thread
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(asyncio.run, coro).result()
+    
+    @staticmethod
+    async def handle_missing_dependency_async(error_output: str, failed_command: str, store):
         """Handle missing dependency and ask for installation permission"""
         manager, package, description = PackageManager.detect_missing_package(error_output, failed_command)
         
@@ -501,7 +752,7 @@ def detect_missing_package(error_output: str, command: str) -> tuple:
             if UI.GHOST_MODE:
                 return None
             
-            response = input(f"{Color.YELLOW}Install {manager.upper()}? (y/n): {Color.RESET}").lower()
+            response = (await asyncio.to_thread(input, f"{Color.YELLOW}Install {manager.upper()}? (y/n): {Color.RESET}")).lower()
             if response != 'y':
                 return None
             
@@ -511,16 +762,17 @@ def detect_missing_package(error_output: str, command: str) -> tuple:
                 return None
             
             UI.print_system(f"Installing {manager.upper()}...")
-            result = subprocess.run(install_cmd, shell=True, capture_output=True, text=True)
+            returncode, _, stderr = await PackageManager._run_shell(install_cmd)
             
-            if result.returncode == 0:
+            if returncode == 0:
+                PackageManager.is_package_manager_installed.cache_clear()
                 UI.print_success(f"✅ {manager.upper()} installed successfully")
                 store.log(f"Installed package manager: {manager}", "INFO")
-                UI.add_to_summary(f"Installed {manager.upper()}", manager, "✅", "Package manager installed")
+                UI.add_to_summary(f"Installed {manager.upper()}", manager, STATUS_OK, "Package manager installed")
                 return True
             else:
                 UI.print_error(f"Failed to install {manager}")
-                store.log(f"Failed to install {manager}: {result.stderr}", "ERROR")
+                store.log(f"Failed to install {manager}: {stderr}", "ERROR")
                 return False
         
         # Package is missing, not the manager
@@ -530,7 +782,7 @@ def detect_missing_package(error_output: str, command: str) -> tuple:
         if UI.GHOST_MODE:
             return None
         
-        response = input(f"{Color.YELLOW}Install {package}? (y/n): {Color.RESET}").lower()
+        response = (await asyncio.to_thread(input, f"{Color.YELLOW}Install {package}? (y/n): {Color.RESET}")).lower()
         if response != 'y':
             return None
         
@@ -540,48 +792,165 @@ def detect_missing_package(error_output: str, command: str) -> tuple:
             return None
         
         UI.print_system(f"Installing {package}...")
-        result = subprocess.run(install_cmd, shell=True, capture_output=True, text=True)
+        returncode, _, stderr = await PackageManager._run_shell(install_cmd)
         
-        if result.returncode == 0:
+        if returncode == 0:
             UI.print_success(f"✅ {package} installed successfully")
             store.log(f"Installed package: {package} via {manager}", "INFO")
-            UI.add_to_summary(f"Installed package", package, "✅", f"via {manager}")
+            UI.add_to_summary(f"Installed package", package, STATUS_OK, f"via {manager}")
             return True
         else:
             UI.print_error(f"Failed to install {package}")
-            store.log(f"Failed to install {package}: {result.stderr}", "ERROR")
-            UI.add_to_summary(f"Failed to install", package, "❌", result.stderr[:100])
+            store.log(f"Failed to install {package}: {stderr}", "ERROR")
+            UI.add_to_summary(f"Failed to install", package, STATUS_FAIL, stderr[:100])
             return False
 
 # ==============================================================================
 # 2. PERSISTENCE & CONFIGURATION
 # ==============================================================================
 
-# Try to import all available AI libraries
-AI_ENGINES = {}
+# orjson is optional; the stdlib json module is the fallback
 try:
-    import google.generativeai as genai
-    from google.api_core import exceptions as google_exceptions
-    AI_ENGINES['gemini'] = True
+    import orjson
 except ImportError:
-    AI_ENGINES['gemini'] = False
+    orjson = None
 
-try:
-    from openai import OpenAI
-    AI_ENGINES['deepseek'] = True
-except ImportError:
-    AI_ENGINES['deepseek'] = False
+def _json_bytes(obj):
+    """Serialize obj as indented UTF-8 JSON"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+        except TypeError:
+            pass
+    return json.dumps(obj, indent=2, ensure_ascii=False).encode('utf-8')
 
+# msgpack is optional; chats use it only when config "chats_format" is "msgpack"
 try:
-    import groq
-    AI_ENGINES['groq'] = True
+    import msgpack
 except ImportError:
-    AI_ENGINES['groq'] = False
+    msgpack = None
+
+def _json_line(obj):
+    """Serialize obj as one compact JSON line (for append-only logs)"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj) + b"\n"
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8') + b"\n"
+
+def _json_loads(data):
+    """Parse JSON from bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _read_json(path):
+    """Parse a JSON file straight from its bytes"""
+    return _json_loads(Path(path).read_bytes())
+
+def _count_lines(text):
+    """Same as len(text.splitlines()) for \n / \r\n text, without building the list"""
+    return text.count("\n") + (1 if text and not text.endswith("\n") else 0)
+
+def _preview(value, limit=50):
+    """str(value)[:limit] for a string or list of strings, without stringifying all of a long entry"""
+    if isinstance(value, str):
+        return value[:limit]
+    if not isinstance(value, list):
+        return str(value)[:limit]
+    pieces, size = ["["], 1
+    for part in value:
+        if size >= limit:
+            break
+        piece = repr(part[:limit] if isinstance(part, str) else part)
+        if size > 1:
+            piece = ", " + piece
+        pieces.append(piece)
+        size += len(piece)
+    else:
+        pieces.append("]")
+    return "".join(pieces)[:limit]
+
+def _atomic_write(path, data):
+    """Write bytes to a temp file, then rename it over path"""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+# AI libraries are optional. Availability is probed with find_spec (nothing
+# is executed); the SDK itself is imported on first use through _get_engine().
+_ENGINE_SPECS = {
+    'gemini': 'google.generativeai',
+    'deepseek': 'openai',
+    'groq': 'groq'
+}
+_ENGINE_PACKAGES = {
+    'gemini': 'google-generativeai',
+    'deepseek': 'openai',
+    'groq': 'groq'
+}
+_ENGINE_MODULES = {}
+
+def _module_available(module_name):
+    try:
+        return importlib.util.find_spec(module_name) is not None
+    except (ImportError, ValueError):
+        return False
+
+AI_ENGINES = {engine: _module_available(module) for engine, module in _ENGINE_SPECS.items()}
+
+def _get_engine(engine_name):
+    """Import (once) and return the SDK module backing an AI engine"""
+    module = _ENGINE_MODULES.get(engine_name)
+    if module is None:
+        module = _ENGINE_MODULES[engine_name] = importlib.import_module(_ENGINE_SPECS[engine_name])
+    return module
+
+_HTTP_CLIENT = None
+_HTTP_LOCK = threading.Lock()
+
+def _orjson_client_class(httpx):
+    """httpx.Client subclass that encodes json= request bodies with orjson, when available"""
+    if orjson is None:
+        return httpx.Client
+    
+    class OrjsonClient(httpx.Client):
+        def build_request(self, method, url, *, json=None, content=None, headers=None, **kwargs):
+            if json is not None and content is None:
+                try:
+                    content = orjson.dumps(json)
+                except TypeError:
+                    pass  # let httpx's stdlib encoder have it
+                else:
+                    json = None
+                    headers = httpx.Headers(headers)
+                    headers["Content-Type"] = "application/json"
+            return super().build_request(method, url, json=json, content=content, headers=headers, **kwargs)
+    
+    return OrjsonClient
+
+def _shared_http_client():
+    """One keep-alive httpx pool shared by the OpenAI-style SDKs; None leaves the SDK default"""
+    global _HTTP_CLIENT
+    with _HTTP_LOCK:
+        if _HTTP_CLIENT is None and _module_available('httpx'):
+            import httpx
+            _HTTP_CLIENT = _orjson_client_class(httpx)(
+                http2=_module_available('h2'),  # HTTP/2 needs the optional h2 package
+                limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+                # The SDKs use this instead of their own 600 s default. Non-streaming completions send
+                # nothing until the whole answer is ready, so the read timeout stays at that scale
+                timeout=httpx.Timeout(600.0, connect=5.0, write=10.0, pool=5.0)
+            )
+            atexit.register(_HTTP_CLIENT.close)
+    return _HTTP_CLIENT
 
 class PersistenceLayer:
     """Manages saving/loading configs, history, and logs with Multi-Model support."""
     
-    APP_DIR = os.path.join(os.path.expanduser("~"), ".xeda_terminal")
+    APP_DIR = Path.home() / ".xeda_terminal"
     
     DEFAULT_CONFIG = {
         "active_engine": "groq",
@@ -597,23 +966,50 @@ class PersistenceLayer:
         "ghost_mode": False,
         "silent_errors": True,
         "fallback_enabled": True,
+        "hedge_requests": False,
+        "hedge_delay": 2.0,
+        "intent_backend": "llm",
+        "max_concurrency": 4,
         "auto_install": True,
+        "chats_format": "json",
         "model_stats": {},
         "installed_packages": [],
         "installation_history": [],
         "error_log": []
     }
 
+    # Minimum seconds between routine (non-forced) saves
+    SAVE_INTERVAL = 2.0
+
     def __init__(self):
+        self._dirty = False
+        # Counts as just saved: an error logged while loading must not save() before self.config exists
+        self._last_save_ts = time.monotonic()
+        # Engines update stats from worker threads; save() must not see a half-updated dict
+        self._state_lock = threading.RLock()
+        self._save_timer = None
+        self._written = {}  # path -> digest of the bytes last written there
         self._ensure_dir()
-        self.config_path = os.path.join(self.APP_DIR, "config.json")
-        self.history_path = os.path.join(self.APP_DIR, "history.json")
-        self.log_path = os.path.join(self.APP_DIR, "system.log")
-        self.error_path = os.path.join(self.APP_DIR, "errors.json")
-        
-        self.config = self._load_config_safely()
-        self.history = self._load_json(self.history_path, [])
-        self.error_log = self._load_json(self.error_path, [])
+        self.config_path = self.APP_DIR / "config.json"
+        self.history_path = self.APP_DIR / "history.json"
+        self.log_path = self.APP_DIR / "system.log"
+        self.error_path = self.APP_DIR / "errors.json"
+        self.intent_cache_path = self.APP_DIR / "intent_cache.json"
+        
+        # One buffered handle for system.log; ERROR entries are flushed right away
+        self._log_lock = threading.Lock()
+        self._log_fh = open(self.log_path, 'a', buffering=8192, encoding='utf-8')
+        atexit.register(self._log_fh.close)
+        
+        # One directory listing instead of a stat per file
+        existing = {entry.name for entry in os.scandir(self.APP_DIR)}
+        
+        self.error_log = deque(
+            self._load_json(self.error_path, []) if "errors.json" in existing else [],
+            maxlen=100
+        )
+        self.config = self._load_config_safely("config.json" in existing)
+        self.history = self._load_json(self.history_path, []) if "history.json" in existing else []
         self.last_plan_cache = None
         
         # Initialize model stats if not present
@@ -622,64 +1018,118 @@ class PersistenceLayer:
         
         # Set UI silent mode
         UI.SILENT_ERRORS = self.config.get("silent_errors", True)
+        
+        # Whatever the debounce held back is written on interpreter exit
+        atexit.register(self.flush)
 
     def _ensure_dir(self):
-        if not os.path.exists(self.APP_DIR):
-            os.makedirs(self.APP_DIR, exist_ok=True)
+        self.APP_DIR.mkdir(parents=True, exist_ok=True)
 
-    def _load_config_safely(self):
+    def _load_config_safely(self, exists=True):
         config = self.DEFAULT_CONFIG.copy()
         
-        if os.path.exists(self.config_path):
+        if exists:
             try:
-                with open(self.config_path, 'r', encoding='utf-8') as f:
-                    loaded = json.load(f)
-                    
-                    # Handle legacy configs
-                    if "api_key" in loaded and "gemini_api_key" not in loaded:
-                        loaded["gemini_api_key"] = loaded["api_key"]
-                    
-                    for key, value in loaded.items():
-                        config[key] = value
+                loaded = _read_json(self.config_path)
+                
+                # Handle legacy configs
+                if "api_key" in loaded and "gemini_api_key" not in loaded:
+                    loaded["gemini_api_key"] = loaded["api_key"]
+                
+                for key, value in loaded.items():
+                    config[key] = value
             except Exception as e:
                 self.log_error(f"Config reset due to corruption ({e})", silent=True)
         
+        # Keys parsed from JSON are fresh strings; intern the ones used for lookups
+        engine = config.get("active_engine")
+        if isinstance(engine, str):
+            config["active_engine"] = sys.intern(engine)
+        stats = config.get("model_stats")
+        if isinstance(stats, dict):
+            config["model_stats"] = {
+                sys.intern(name): {sys.intern(k): v for k, v in entry.items()} if isinstance(entry, dict) else entry
+                for name, entry in stats.items()
+            }
+        
         return config
 
     def _load_json(self, path, default):
-        if os.path.exists(path):
-            try:
-                with open(path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return default
-        return default
+        try:
+            return _read_json(path)
+        except (OSError, ValueError):
+            return default
+
+    def load_intent_cache(self):
+        """Saved [normalized input, intent] pairs, least recently used first"""
+        return self._load_json(self.intent_cache_path, [])
+
+    def save_intent_cache(self, pairs):
+        try:
+            _atomic_write(self.intent_cache_path, _json_bytes(pairs))
+        except OSError as e:
+            self.log_error(f"Failed to save intent cache: {e}", "intent_cache", silent=True)
 
     def save(self):
+        """Write config, history and errors to disk right away"""
         try:
-            with open(self.config_path, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, indent=2)
-            with open(self.history_path, 'w', encoding='utf-8') as f:
-                json.dump(self.history, f, indent=2)
-            with open(self.error_path, 'w', encoding='utf-8') as f:
-                json.dump(self.error_log[-100:], f, indent=2)
+            with self._state_lock:
+                self._dirty = False
+                self._last_save_ts = time.monotonic()
+                self._write_if_changed(self.config_path, _json_bytes(self.config))
+                self._write_if_changed(self.history_path, _json_bytes(self.history))
+                self._write_if_changed(self.error_path, _json_bytes(list(self.error_log)))
         except Exception as e:
             self.log_error(f"Failed to save state: {e}", silent=True)
 
+    def _write_if_changed(self, path, data):
+        """Rewrite path only when data differs from what this process last wrote there"""
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        if self._written.get(path) != digest:
+            _atomic_write(path, data)
+            self._written[path] = digest
+
+    def flush(self):
+        """Save only if there are changes that have not been written yet"""
+        if self._dirty:
+            self.save()
+
+    def _mark_dirty(self):
+        """Record a change; save at most once every SAVE_INTERVAL seconds"""
+        self._dirty = True
+        if time.monotonic() - self._last_save_ts >= self.SAVE_INTERVAL:
+            self.save()
+
+    def _schedule_save(self):
+        """Record a change and leave the write to a background timer (SAVE_INTERVAL later)"""
+        self._dirty = True
+        with self._state_lock:
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(self.SAVE_INTERVAL, self._timed_flush)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def _timed_flush(self):
+        with self._state_lock:
+            self._save_timer = None
+            self.flush()
+
     def log(self, message, level="INFO", model=None):
         try:
-            timestamp = datetime.now().isoformat()
+            timestamp = _now_iso()
             model_tag = f" [{model}]" if model else ""
             entry = f"[{timestamp}]{model_tag} [{level}] {message}\n"
-            with open(self.log_path, 'a', encoding='utf-8') as f:
-                f.write(entry)
+            with self._log_lock:
+                self._log_fh.write(entry)
+                if level == "ERROR":
+                    self._log_fh.flush()
         except:
             pass
 
     def log_error(self, error_message, context="", silent=True):
         """Log error internally without showing user"""
         error_entry = {
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": _now_iso(),
             "error": str(error_message),
             "context": context,
             "silent": silent
@@ -689,14 +1139,12 @@ class PersistenceLayer:
         # Also log to system log
         self.log(f"ERROR: {error_message} [{context}]", "ERROR")
         
-        # Save errors periodically
-        if len(self.error_log) % 10 == 0:
-            self.save()
+        self._mark_dirty()
     
     def track_installation(self, package, manager, success=True):
         """Track package installation attempts"""
         entry = {
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": _now_iso(),
             "package": package,
             "manager": manager,
             "success": success
@@ -707,34 +1155,37 @@ class PersistenceLayer:
                 self.config.setdefault("installed_packages", []).append(package)
         
         self.config.setdefault("installation_history", []).append(entry)
-        self.save()
+        self._mark_dirty()
     
     def is_package_installed(self, package):
         """Check if package was previously installed"""
         return package in self.config.get("installed_packages", [])
 
     def update_model_stat(self, model_name, success=True, tokens_used=0):
-        """Update statistics for a model"""
-        if model_name not in self.config["model_stats"]:
-            self.config["model_stats"][model_name] = {
-                "requests": 0,
-                "successes": 0,
-                "failures": 0,
-                "tokens_used": 0,
-                "last_used": datetime.now().isoformat()
-            }
-        
-        stats = self.config["model_stats"][model_name]
-        stats["requests"] += 1
-        stats["tokens_used"] += tokens_used
-        stats["last_used"] = datetime.now().isoformat()
-        
-        if success:
-            stats["successes"] += 1
-        else:
-            stats["failures"] += 1
+        """Update statistics for a model (in memory; written by the background save)"""
+        model_name = sys.intern(model_name)
+        with self._state_lock:
+            if model_name not in self.config["model_stats"]:
+                self.config["model_stats"][model_name] = {
+                    "requests": 0,
+                    "successes": 0,
+                    "failures": 0,
+                    "tokens_used": 0,
+                    "last_used": _now_iso()
+                }
+            
+            stats = self.config["model_stats"][model_name]
+            stats["requests"] += 1
+            stats["tokens_used"] += tokens_used
+            stats["last_used"] = _now_iso()
+            
+            if success:
+                stats["successes"] += 1
+            else:
+                stats["failures"] += 1
         
-        self.save()
+        # Engine calls must not wait on a config write
+        self._schedule_save()
 
     def get_available_engines(self):
         """Return list of available AI engines"""
@@ -764,12 +1215,17 @@ class PersistenceLayer:
             return True, f"Switched to {engine_name.upper()}"
         return False, f"Engine {engine_name} not available"
 
+    def set_config(self, key, value):
+        """Change a setting; the write is batched by the save timer and flushed at exit"""
+        with self._state_lock:
+            self.config[key] = value
+        self._schedule_save()
+
     def update_workspace(self, path):
         try:
             abs_path = os.path.abspath(os.path.expanduser(path))
             if os.path.exists(abs_path):
-                self.config["workspace"] = abs_path
-                self.save()
+                self.set_config("workspace", abs_path)
                 return True, abs_path
         except Exception as e:
             self.log_error(f"Workspace update failed: {e}", path, silent=True)
@@ -784,17 +1240,42 @@ class ChatSession:
     def __init__(self, chat_id=None, title="New Chat", created_at=None):
         self.chat_id = chat_id or self.generate_chat_id()
         self.title = title
-        self.created_at = created_at or datetime.now().isoformat()
-        self.last_activity = datetime.now().isoformat()
-        self.messages = []  # List of {"role": "user/model", "parts": [message]}
+        now = _now_iso_ms()
+        self.created_at = created_at or now
+        self.last_activity = now
+        self._messages = []  # List of {"role": "user/model", "parts": [message]}; None = not loaded yet
+        self._message_count = None  # count from the index while messages are unloaded
+        self.on_load = None  # called after the log is read (ChatManager's hot-set bookkeeping)
         self.file_path = None
-        
+        self.log_path = None  # <chat_id>.jsonl, one message per line
+        self._log_fh = None
+        self._index_entry = None  # encoded to_index() JSON, reused until the chat changes
+        
+    @property
+    def messages(self):
+        if self._messages is None:
+            self.load_messages()
+        return self._messages
+    
+    @messages.setter
+    def messages(self, value):
+        self._messages = value
+        self._index_entry = None
+    
+    @property
+    def messages_loaded(self):
+        return self._messages is not None
+    
+    @property
+    def message_count(self):
+        if self._messages is None and self._message_count is not None:
+            return self._message_count
+        return len(self.messages)
+    
     @staticmethod
     def generate_chat_id():
         """Generate a unique chat ID"""
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        random_suffix = ''.join(random.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=6))
-        return f"chat_{timestamp}_{random_suffix}"
+        return f"chat_{datetime.now():%Y%m%d%H%M%S}_{secrets.token_hex(3)}"
     
     def to_dict(self):
         """Convert chat session to dictionary for serialization"""
@@ -815,20 +1296,106 @@ class ChatSession:
             created_at=data.get("created_at")
         )
         chat.last_activity = data.get("last_activity", chat.created_at)
-        chat.messages = data.get("messages", [])
+        if "messages" in data:
+            chat.messages = data["messages"]
+        else:
+            # Index entry: message bodies are read from the log on first access
+            chat.messages = None
+            chat._message_count = data.get("message_count")
         return chat
     
+    def to_index(self):
+        """Metadata kept in the chat index (messages live in the .jsonl log)"""
+        return {
+            "chat_id": self.chat_id,
+            "title": self.title,
+            "created_at": self.created_at,
+            "last_activity": self.last_activity,
+            "message_count": self.message_count,
+            "log_file": self.log_path.name if self.log_path else None
+        }
+    
+    def index_entry(self):
+        """Compact JSON of to_index(), re-encoded only after the chat changes"""
+        if self._index_entry is None:
+            self._index_entry = _json_line(self.to_index()).rstrip()
+        return self._index_entry
+    
+    def invalidate_index(self):
+        self._index_entry = None
+    
+    def _encode(self, message):
+        """One log record: a msgpack object for .mpk logs, a JSON line otherwise"""
+        if self.log_path.suffix == ".mpk":
+            return msgpack.packb(message, use_bin_type=True)
+        return _json_line(message)
+    
+    def load_messages(self):
+        """Read the message log; a torn last record from a crash is skipped"""
+        messages = []
+        try:
+            with open(self.log_path, 'rb') as f:
+                if self.log_path.suffix == ".mpk":
+                    try:
+                        messages.extend(msgpack.Unpacker(f, raw=False))
+                    except ValueError:
+                        pass
+                else:
+                    for line in f:
+                        if line.strip():
+                            try:
+                                messages.append(_json_loads(line))
+                            except ValueError:
+                                continue
+        except FileNotFoundError:
+            pass
+        self.messages = messages
+        if self.on_load is not None:
+            self.on_load(self)
+    
+    def unload(self):
+        """Drop message bodies from memory; they are already on disk"""
+        if self._messages is not None:
+            self._message_count = len(self._messages)
+            self._messages = None
+        self.close()
+    
+    def _append_to_log(self, message):
+        if self.log_path is None:
+            return
+        if self._log_fh is None:
+            self._log_fh = open(self.log_path, 'ab')
+        self._log_fh.write(self._encode(message))
+        self._log_fh.flush()
+    
+    def compact(self):
+        """Rewrite the message log from the in-memory messages"""
+        if self.log_path is None:
+            return
+        self.close()
+        _atomic_write(self.log_path, b"".join(self._encode(msg) for msg in self.messages))
+    
+    def close(self):
+        if self._log_fh is not None:
+            self._log_fh.close()
+            self._log_fh = None
+    
     def add_message(self, role, content):
         """Add a message to the chat"""
-        self.messages.append({
+        now = _now_iso_ms()
+        message = {
             "role": role,
             "parts": [content],
-            "timestamp": datetime.now().isoformat()
-        })
-        self.last_activity = datetime.now().isoformat()
+            "timestamp": now
+        }
+        self.messages.append(message)
+        self._append_to_log(message)
+        self.last_activity = now
+        self._index_entry = None
         
         if self.title == "New Chat" and role == "user":
-            words = content.split()[:5]
+            # maxsplit stops scanning after the fifth word, however long the message is
+            words = content.split(None, 5)[:5]
             self.title = " ".join(words)[:30]
             if len(content) > 30:
                 self.title += "..."
@@ -843,60 +1410,183 @@ class ChatSession:
             "title": self.title,
             "created": self.created_at,
             "last_activity": self.last_activity,
-            "message_count": len(self.messages)
+            "message_count": self.message_count
         }
 
 
+_by_last_activity = operator.attrgetter("last_activity")
+
+
 class ChatManager:
     """Manages chat sessions with persistent storage"""
     
     def __init__(self, persistence: PersistenceLayer):
         self.store = persistence
-        self.chats_file = os.path.join(persistence.APP_DIR, "chats.json")
+        self.chats_dir = persistence.APP_DIR / "chats"
+        self.use_msgpack = persistence.config.get("chats_format") == "msgpack" and msgpack is not None
+        self.index_file = self.chats_dir / ("index.mpk" if self.use_msgpack else "index.json")
+        self.chats_file = os.path.join(persistence.APP_DIR, "chats.json")  # legacy single-file store
         self.sessions = {}
         self.current_chat_id = None
+        
+        # Chats whose messages are in memory, least recently used first
+        self._hot = OrderedDict()
+        
+        # Index writes are coalesced: at most one per SAVE_DELAY, plus a final flush at exit
+        self._dirty = False
+        self._save_lock = threading.Lock()
+        self._flush_timer = None
+        atexit.register(self.flush)
+        
         self._load_chats()
+    
+    SAVE_DELAY = 0.5
+    MAX_HOT = 20
+    
+    def _touch(self, chat):
+        """Mark chat as recently used; unload the coldest chats beyond MAX_HOT"""
+        hot = self._hot
+        hot[chat.chat_id] = chat
+        hot.move_to_end(chat.chat_id)
+        while len(hot) > self.MAX_HOT:
+            chat_id, cold = hot.popitem(last=False)
+            if chat_id == self.current_chat_id:
+                hot[chat_id] = cold
+                continue
+            cold.unload()
+    
+    def invalidate(self, chat_id):
+        """Forget a chat in the hot set"""
+        self._hot.pop(chat_id, None)
+    
+    def _register(self, chat, log_path):
+        chat.log_path = log_path
+        chat.on_load = self._touch
+        self.sessions[chat.chat_id] = chat
+        if chat.messages_loaded:
+            self._touch(chat)
+    
+    def _log_path(self, chat_id):
+        """The chat's existing message log, or a new one in the configured format"""
+        if msgpack is not None:
+            path = self.chats_dir / f"{chat_id}.mpk"
+            if path.exists():
+                return path
+        path = self.chats_dir / f"{chat_id}.jsonl"
+        if self.use_msgpack and not path.exists():
+            return self.chats_dir / f"{chat_id}.mpk"
+        return path
+    
+    def _existing_index(self):
+        """The index to load: msgpack first (when readable), then JSON"""
+        candidates = ("index.mpk", "index.json") if msgpack is not None else ("index.json",)
+        for name in candidates:
+            path = self.chats_dir / name
+            if path.exists():
+                return path
+        return None
         
     def _load_chats(self):
         try:
-            if os.path.exists(self.chats_file):
-                with open(self.chats_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
+            self.chats_dir.mkdir(parents=True, exist_ok=True)
+            index_file = self._existing_index()
+            if index_file is not None:
+                if index_file.suffix == ".mpk":
+                    data = msgpack.unpackb(index_file.read_bytes(), raw=False)
+                else:
+                    data = _read_json(index_file)
+                
                 for chat_data in data.get("chats", []):
                     chat = ChatSession.from_dict(chat_data)
-                    self.sessions[chat.chat_id] = chat
-                    
-                self.current_chat_id = data.get("current_chat_id")
+                    log_file = chat_data.get("log_file")
+                    self._register(chat, self.chats_dir / log_file if log_file else self._log_path(chat.chat_id))
                 
-                if self.current_chat_id not in self.sessions:
-                    self.create_new_chat()
+                self.current_chat_id = data.get("current_chat_id")
+            elif os.path.exists(self.chats_file):
+                self._migrate_legacy_chats()
+            else:
+                return
+            
+            if self.current_chat_id not in self.sessions:
+                self.create_new_chat()
         except Exception as e:
             self.store.log_error(f"Failed to load chats: {e}", "chat_manager", silent=True)
             self.create_new_chat()
     
+    def _migrate_legacy_chats(self):
+        """Split the old chats.json into an index plus one message log per chat"""
+        data = _read_json(self.chats_file)
+        for chat_data in data.get("chats", []):
+            chat = ChatSession.from_dict(chat_data)
+            self._register(chat, self._log_path(chat.chat_id))
+            chat.compact()
+        self.current_chat_id = data.get("current_chat_id")
+        self._write_index()
+        os.replace(self.chats_file, self.chats_file + ".bak")
+        self.store.log(f"Migrated {len(self.sessions)} chats to {self.chats_dir}", "INFO")
+    
     def save_chats(self):
+        """Schedule an index write; messages are appended to their logs as they arrive"""
+        with self._save_lock:
+            self._dirty = True
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.SAVE_DELAY, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+    
+    def flush(self):
+        """Write the index now if there are unsaved changes"""
+        with self._save_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._dirty:
+                return
+            self._dirty = False
+            self._write_index()
+    
+    def _write_index(self):
         try:
-            data = {
-                "current_chat_id": self.current_chat_id,
-                "chats": [chat.to_dict() for chat in self.sessions.values()]
-            }
-            with open(self.chats_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            chats = list(self.sessions.values())
+            if self.use_msgpack:
+                data = {
+                    "current_chat_id": self.current_chat_id,
+                    "chats": [chat.to_index() for chat in chats]
+                }
+                payload = msgpack.packb(data, use_bin_type=True)
+                stale_index = self.chats_dir / "index.json"
+            else:
+                # Splice each chat's cached entry; only chats changed since the last save are re-encoded
+                payload = b"".join((
+                    b'{\n  "current_chat_id": ', _json_line(self.current_chat_id).rstrip(),
+                    b',\n  "chats": [\n    ',
+                    b",\n    ".join(chat.index_entry() for chat in chats),
+                    b"\n  ]\n}\n"
+                ))
+                stale_index = self.chats_dir / "index.mpk"
+            _atomic_write(self.index_file, payload)
+            # Only one index may exist, or a format switch would load stale metadata
+            if stale_index.exists():
+                os.remove(stale_index)
         except Exception as e:
             self.store.log_error(f"Failed to save chats: {e}", "chat_manager", silent=True)
     
     def create_new_chat(self):
         chat = ChatSession()
-        self.sessions[chat.chat_id] = chat
         self.current_chat_id = chat.chat_id
+        self._register(chat, self._log_path(chat.chat_id))
         self.save_chats()
         self.store.log(f"Created new chat: {chat.chat_id}", "INFO")
         return chat
     
     def switch_to_chat(self, chat_id):
         if chat_id in self.sessions:
+            chat = self.sessions[chat_id]
             self.current_chat_id = chat_id
+            if chat.messages_loaded:
+                self._touch(chat)
+            else:
+                chat.load_messages()
             self.save_chats()
             return True, self.sessions[chat_id]
         return False, f"Chat not found: {chat_id}"
@@ -907,13 +1597,13 @@ class ChatManager:
         return self.create_new_chat()
     
     def list_chats(self, limit=20):
-        chats = list(self.sessions.values())
-        chats.sort(key=lambda x: x.last_activity, reverse=True)
-        return chats[:limit]
+        # Top-k selection: O(N log limit) instead of sorting every session
+        return heapq.nlargest(limit, self.sessions.values(), key=_by_last_activity)
     
     def rename_chat(self, chat_id, new_title):
         if chat_id in self.sessions:
             self.sessions[chat_id].title = new_title[:50]
+            self.sessions[chat_id].invalidate_index()
             self.save_chats()
             return True, f"Chat renamed to: {new_title}"
         return False, f"Chat not found: {chat_id}"
@@ -922,7 +1612,13 @@ class ChatManager:
         if chat_id in self.sessions:
             if chat_id == self.current_chat_id:
                 return False, "Cannot delete current chat."
-            del self.sessions[chat_id]
+            chat = self.sessions.pop(chat_id)
+            self.invalidate(chat_id)
+            chat.close()
+            try:
+                os.remove(chat.log_path)
+            except OSError:
+                pass
             self.save_chats()
             return True, "Chat deleted"
         return False, "Chat not found"
@@ -936,6 +1632,7 @@ class ChatManager:
     def clear_current_chat(self):
         chat = self.get_current_chat()
         chat.messages = []
+        chat.compact()
         self.save_chats()
         return True, "Chat cleared"
     
@@ -945,14 +1642,26 @@ class ChatManager:
         chat = self.sessions[chat_id]
         if format == "json":
             file = f"chat_export_{chat_id}.json"
-            with open(file, "w", encoding="utf-8") as f:
-                json.dump(chat.to_dict(), f, indent=2, ensure_ascii=False)
+            # Written message by message so a long chat is never held twice in memory
+            # Same shape as to_dict(); the index-only keys (message_count, log_file) stay internal
+            meta = chat.to_dict()
+            messages = meta.pop("messages")
+            with open(file, "wb") as f:
+                f.write(b"{\n")
+                for key, value in meta.items():
+                    f.write(b'  "%s": %s,\n' % (key.encode(), _json_line(value).rstrip()))
+                f.write(b'  "messages": [')
+                separator = b"\n    "
+                for msg in messages:
+                    f.write(separator)
+                    f.write(_json_line(msg).rstrip())
+                    separator = b",\n    "
+                f.write(b"\n  ]\n}\n")
             return True, file
         elif format == "txt":
             file = f"chat_export_{chat_id}.txt"
             with open(file, "w", encoding="utf-8") as f:
-                for msg in chat.messages:
-                    f.write(f"{msg['role']}: {msg['parts'][0]}\n\n")
+                f.writelines(f"{msg['role']}: {msg['parts'][0]}\n\n" for msg in chat.messages)
             return True, file
         return False, "Unsupported format"
 
@@ -963,6 +1672,13 @@ class ChatManager:
 class WorkspaceManager:
     """Handles all file operations safely with deep analysis capabilities."""
     
+    _IGNORE_DIRS = frozenset({'.git', '__pycache__', 'venv', 'node_modules', '.idea', '.vscode'})
+    _ENTRY_POINTS = frozenset({'main.py', 'app.py', 'index.js', 'server.js'})
+    _CONFIG_FILES = frozenset({'package.json', 'requirements.txt', 'docker-compose.yml'})
+    _MMAP_THRESHOLD = 1 << 20  # read_file_with_context maps files larger than 1 MiB
+    _LINE_RE = re.compile(r"[^\n]*\n|[^\n]+")
+    _PARALLEL_MIN_SUBDIRS = 8  # analyze_project uses threads from this many top-level dirs
+    
     def __init__(self, persistence: PersistenceLayer):
         self.store = persistence
         initial_ws = self.store.config.get("workspace", os.getcwd())
@@ -970,12 +1686,36 @@ class WorkspaceManager:
             os.chdir(initial_ws)
         else:
             self.store.update_workspace(os.getcwd())
+        
+        # cwd -> (directory mtime_ns, detect_tech_stack result)
+        self._stack_cache = {}
 
     def get_current_path(self):
         return os.getcwd()
 
     def detect_tech_stack(self):
-        files = set(os.listdir(os.getcwd()))
+        cwd = os.getcwd()
+        # The result only depends on the directory's entry names, which bump its mtime
+        mtime = os.stat(cwd).st_mtime_ns
+        cached = self._stack_cache.get(cwd)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        
+        result = self._scan_tech_stack(cwd)
+        self._stack_cache[cwd] = (mtime, result)
+        return result
+
+    def _scan_tech_stack(self, cwd):
+        # One directory pass collects entry names and extensions together
+        files = set()
+        exts = set()
+        with os.scandir(cwd) as it:
+            for entry in it:
+                name = entry.name
+                files.add(name)
+                base, dot, ext = name.rpartition('.')
+                if dot:
+                    exts.add(ext)
         stack = []
         
         if 'package.json' in files: stack.append("Node.js")
@@ -983,12 +1723,61 @@ class WorkspaceManager:
         if 'pyproject.toml' in files: stack.append("Python (Poetry/Flit)")
         if 'docker-compose.yml' in files: stack.append("Docker")
         if '.git' in files: stack.append("Git")
-        if any(f.endswith('.py') for f in files): stack.append("Python Files")
-        if any(f.endswith('.js') for f in files): stack.append("JavaScript")
+        if 'py' in exts: stack.append("Python Files")
+        if 'js' in exts: stack.append("JavaScript")
         
         if not stack: return "Empty/Generic Directory"
         return ", ".join(stack)
 
+    @staticmethod
+    def _scan_dir(root, rel=""):
+        """Split one directory into non-hidden files and descendable subdirectories"""
+        files = []
+        subdirs = []
+        try:
+            it = os.scandir(root)
+        except OSError:
+            # Like os.walk: an unreadable directory is skipped, not fatal to the whole walk
+            return files, subdirs
+        with it:
+            for entry in it:
+                name = entry.name
+                if entry.is_dir():
+                    # Like os.walk: symlinked dirs are neither descended nor counted
+                    if not name.startswith('.') and not entry.is_symlink():
+                        subdirs.append((entry.path, rel + name + os.sep))
+                elif not name.startswith('.'):
+                    files.append((rel + name, name))
+        return files, subdirs
+
+    @staticmethod
+    def _iter_files(root, rel=""):
+        """Yield (relative_path, name) for non-hidden files, skipping hidden dirs"""
+        files, subdirs = WorkspaceManager._scan_dir(root, rel)
+        yield from files
+        for path, sub_rel in subdirs:
+            yield from WorkspaceManager._iter_files(path, sub_rel)
+
+    @staticmethod
+    def _analyze_files(files):
+        """Tally one shard of (relative_path, name) pairs"""
+        total = 0
+        ext_counter = Counter()
+        entry_points = []
+        config_files = []
+        for rel_path, file in files:
+            total += 1
+            
+            ext = os.path.splitext(file)[1]
+            if ext:
+                ext_counter[ext] += 1
+            
+            if file in WorkspaceManager._ENTRY_POINTS:
+                entry_points.append(rel_path)
+            elif file in WorkspaceManager._CONFIG_FILES:
+                config_files.append(rel_path)
+        return total, ext_counter, entry_points, config_files
+
     def analyze_project(self):
         """Deep analysis of project structure"""
         analysis = {
@@ -998,62 +1787,81 @@ class WorkspaceManager:
             "config_files": []
         }
         
+        ext_counter = Counter()
         try:
-            for root, dirs, files in os.walk(os.getcwd()):
-                dirs[:] = [d for d in dirs if not d.startswith('.')]
-                
-                for file in files:
-                    if file.startswith('.'): continue
-                    
-                    analysis["total_files"] += 1
-                    
-                    ext = os.path.splitext(file)[1]
-                    if ext:
-                        analysis["file_types"][ext] = analysis["file_types"].get(ext, 0) + 1
-                    
-                    full_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(full_path, os.getcwd())
-                    
-                    if file in {'main.py', 'app.py', 'index.js', 'server.js'}:
-                        analysis["entry_points"].append(rel_path)
-                    elif file in {'package.json', 'requirements.txt', 'docker-compose.yml'}:
-                        analysis["config_files"].append(rel_path)
+            # Shard by top-level directory; shards are merged in traversal order
+            root_files, subdirs = self._scan_dir(os.getcwd())
+            shards = [root_files] + [self._iter_files(path, rel) for path, rel in subdirs]
+            if len(subdirs) >= self._PARALLEL_MIN_SUBDIRS:
+                # os.scandir releases the GIL, so threads overlap the directory I/O
+                with ThreadPoolExecutor(max_workers=min(len(subdirs), 8)) as pool:
+                    results = list(pool.map(self._analyze_files, shards))
+            else:
+                results = map(self._analyze_files, shards)
+            
+            for total, shard_exts, entry_points, config_files in results:
+                analysis["total_files"] += total
+                ext_counter.update(shard_exts)
+                analysis["entry_points"].extend(entry_points)
+                analysis["config_files"].extend(config_files)
         except Exception as e:
             self.store.log_error(f"Project analysis error: {e}", "workspace", silent=True)
         
+        analysis["file_types"] = dict(ext_counter)
         return analysis
 
     def read_file_with_context(self, file_path, lines_around=3):
         """Read file with surrounding context"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            
-            context = ""
-            for i, line in enumerate(lines):
-                context += f"{i+1:4}: {line}"
+            parts = []
+            if os.path.getsize(file_path) > self._MMAP_THRESHOLD:
+                # Large files: walk the mapping line by line instead of materializing readlines()
+                with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    for raw in iter(mm.readline, b""):
+                        line = raw.decode('utf-8')
+                        # Universal newlines, as in the text-mode branch: \r\n and a lone \r both end a line
+                        lines = (self._LINE_RE.findall(line.replace('\r\n', '\n').replace('\r', '\n'))
+                                 if '\r' in line else (line,))
+                        for line in lines:
+                            parts.append(f"{len(parts) + 1:4}: {line}")
+            else:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    for i, line in enumerate(f, 1):
+                        parts.append(f"{i:4}: {line}")
             
-            return context, len(lines)
+            return "".join(parts), len(parts)
         except:
             return "", 0
 
     def list_files(self, recursive=False, limit=50):
-        ignore_dirs = {'.git', '__pycache__', 'venv', 'node_modules', '.idea', '.vscode'}
+        ignore_dirs = self._IGNORE_DIRS
         file_list = []
         
         try:
             if recursive:
-                for root, dirs, files in os.walk(os.getcwd()):
-                    dirs[:] = [d for d in dirs if d not in ignore_dirs]
-                    for file in files:
-                        if file.startswith('.'): continue
-                        rel_path = os.path.relpath(os.path.join(root, file), os.getcwd())
-                        file_list.append(rel_path)
-                        if len(file_list) >= limit: break
-                    if len(file_list) >= limit: break
+                # Explicit DFS stack in os.walk order; stops as soon as limit is reached
+                stack = [(os.getcwd(), "")]
+                while stack:
+                    path, rel = stack.pop()
+                    subdirs = []
+                    try:
+                        it = os.scandir(path)
+                    except OSError:
+                        continue  # unreadable directory: skipped, as os.walk does
+                    with it:
+                        for entry in it:
+                            name = entry.name
+                            if entry.is_dir():
+                                if name not in ignore_dirs and not entry.is_symlink():
+                                    subdirs.append((entry.path, rel + name + os.sep))
+                            elif name[0] != '.':
+                                file_list.append(rel + name)
+                                if len(file_list) >= limit:
+                                    return file_list
+                    stack.extend(reversed(subdirs))
             else:
                 for item in os.listdir(os.getcwd()):
-                    if item.startswith('.'): continue
+                    if item[0] == '.': continue
                     if item in ignore_dirs: continue
                     file_list.append(item)
                     if len(file_list) >= limit: break
@@ -1073,7 +1881,9 @@ class WorkspaceManager:
 
     def write_file(self, path, content):
         try:
-            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            parent = os.path.dirname(os.path.abspath(path))
+            if parent and not os.path.isdir(parent):
+                os.makedirs(parent, exist_ok=True)
             with open(path, 'w', encoding='utf-8') as f:
                 f.write(content)
             return True
@@ -1095,55 +1905,266 @@ class WorkspaceManager:
 # 4. SILENT AI ENGINES
 # ==============================================================================
 
+# Static instructions first and the failure last, so provider prompt caches see a shared prefix
+_FIX_PROMPT = """Analyze if this is a missing package/command error.
+If yes, provide the exact package installation command.
+
+Examples:
+- If 'npm' not found: 'curl -fsSL https://deb.nodesource.com/setup_lts.x | sudo -E bash - && sudo apt-get install -y nodejs'
+- If 'python3' not found: 'sudo apt update && sudo apt install python3'
+- If package missing: 'pip install package_name' or 'npm install package_name'
+
+Provide ONLY the installation command if needed, or "NO_PACKAGE_FIX" if not.
+
+Command Failed: `{cmd}`
+Error: {err}
+"""
+
+# Run-specific noise in error output: clock times, dates, hex addresses, PIDs
+_VOLATILE_RE = re.compile(
+    r"\b\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?)?"
+    r"|\b\d{1,2}:\d{2}:\d{2}(?:[.,]\d+)?"
+    r"|\b0x[0-9a-fA-F]+"
+    r"|\b(?:pid|PID)[ =:]*\d+"
+)
+_BLANKS_RE = re.compile(r"[ \t]+")  # runs of spaces/tabs; newlines are kept
+
+def _stable_error(error_output):
+    """error_output with run-specific noise masked and line breaks kept, so retries share a cache entry"""
+    return _BLANKS_RE.sub(" ", _VOLATILE_RE.sub("#", error_output)).strip()
+
+_BALANCE_ERROR_RE = re.compile(r"\b(?:402|401|Insufficient Balance|insufficient_quota)\b")
+
 class BaseAIEngine:
     """Base class for all AI engines with silent error handling"""
     
+    CACHE_SIZE = 1024
+    CACHE_TTL = 3600  # seconds a cached response stays valid
+    BACKOFF_BASE = 1.0
+    BACKOFF_CAP = 30.0
+    _TRANSIENT_STATUS = frozenset({408, 409, 429})  # plus every 5xx
+    # SDK exception class names (openai/groq, httpx, google-api-core) worth retrying
+    _TRANSIENT_ERRORS = frozenset({
+        "APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError",
+        "TransportError", "ServiceUnavailable", "DeadlineExceeded", "ResourceExhausted"
+    })
+    HISTORY_TURNS = 10  # prior messages sent with each OpenAI-style chat request
+    _NO_PARTS = ("",)
+    _prompt_lock = threading.Lock()
+    
     def __init__(self, persistence: PersistenceLayer):
         self.store = persistence
         self.engine_name = "base"
         self.model_name = ""
+        self._stat_key = ""  # "engine:model" for model_stats, set once the model is known
         self._configured = False
+        self._cache = OrderedDict()  # prompt digest -> (timestamp, response), LRU order
+        self._cache_lock = threading.Lock()  # guards _cache and _inflight
+        self._inflight = {}  # prompt digest -> Future of the request already on the wire
+        self.cache_hits = 0
+        self._cooldown_until = 0.0  # set from a 429's Retry-After
         
     def _configure_api(self):
         pass
+    
+    def set_model(self, model_name):
+        """Switch to another model on the same client (cached responses are keyed by model)"""
+        self.model_name = model_name
+        self._stat_key = sys.intern(f"{self.engine_name}:{model_name}")
+    
+    def _acquire_key(self, config_key, label):
+        """API key from config, prompting (hidden input) until one is given; saved once"""
+        key = self.store.config.get(config_key)
+        if key or UI.GHOST_MODE:
+            return key
+        # Engines are constructed in parallel; only one may own the terminal at a time
+        with BaseAIEngine._prompt_lock:
+            while not key:
+                UI.print_system(f"{label} Authentication Required")
+                key = getpass.getpass(f"🔑 Please paste your {label} API Key: ").strip()
+            self.store.config[config_key] = key
+            self.store.save()
+        return key
+        
+    def _cache_key(self, prompt):
+        max_tokens = self.store.config.get("max_tokens", 8192)
+        raw = f"{self.engine_name}:{self.model_name}:{max_tokens}:{prompt}".encode('utf-8', 'surrogatepass')
+        return hashlib.blake2b(raw, digest_size=16).digest()
+    
+    def _cache_get(self, key):
+        """Cached response for key if it is younger than CACHE_TTL, else None"""
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] >= self.CACHE_TTL:
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return entry[1]
+    
+    def _cache_put(self, key, result):
+        with self._cache_lock:
+            self._cache[key] = (time.time(), result)
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+    
+    @classmethod
+    def _is_retryable(cls, exc):
+        """True for timeouts, dropped connections, rate limits and server errors"""
+        if isinstance(exc, (TimeoutError, ConnectionError)):
+            return True
+        status = getattr(exc, "status_code", None)
+        if isinstance(status, int):
+            return status in cls._TRANSIENT_STATUS or status >= 500
+        return any(klass.__name__ in cls._TRANSIENT_ERRORS for klass in type(exc).__mro__)
+    
+    @staticmethod
+    def _retry_after(exc):
+        """Seconds from a rate-limit response's Retry-After header, if the SDK exposes it"""
+        headers = getattr(getattr(exc, "response", None), "headers", None)
+        try:
+            return float(headers.get("retry-after"))
+        except (AttributeError, TypeError, ValueError):
+            return None
+    
+    def _cached_generate(self, prompt):
+        """_unsafe_generate behind the response cache"""
+        key = self._cache_key(prompt)
+        result = self._cache_get(key)
+        if result is None:
+            result = self._unsafe_generate(prompt)
+            if result:
+                self._cache_put(key, result)
+        return result
         
     def generate_content(self, prompt, retries=3):
         """Generate content with silent error handling"""
+        key = self._cache_key(prompt)
+        cached = self._cache_get(key)
+        if cached is not None:
+            # A cache hit costs no request or tokens, so it is kept out of model_stats
+            return cached
+        
+        with self._cache_lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = Future()
+        if not leader:
+            # The same prompt is already in flight: share its answer instead of paying twice
+            return flight.result()
+        
+        try:
+            result = self._generate(prompt, retries, key)
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            with self._cache_lock:
+                del self._inflight[key]
+    
+    def _generate(self, prompt, retries, key):
+        """The request/retry loop behind generate_content"""
+        if time.time() < self._cooldown_until:
+            # Still rate limited: fail fast so a fallback engine can answer
+            return None
+        
+        store, engine_name, stat_key = self.store, self.engine_name, self._stat_key
         for attempt in range(retries):
             try:
                 result = self._unsafe_generate(prompt)
                 if result:
+                    self._cache_put(key, result)
                     tokens_used = len(result.split()) * 1.3
-                    self.store.update_model_stat(f"{self.engine_name}:{self.model_name}", True, int(tokens_used))
+                    store.update_model_stat(stat_key, True, int(tokens_used))
                 return result
             except Exception as e:
                 error_msg = str(e)
-                self.store.log_error(f"{self.engine_name} error (attempt {attempt+1}): {error_msg}", prompt[:100], silent=True)
+                store.log_error(f"{engine_name} error (attempt {attempt+1}): {error_msg}", prompt[:100], silent=True)
+                
+                if getattr(e, "status_code", None) == 429:
+                    retry_after = self._retry_after(e)
+                    if retry_after:
+                        self._cooldown_until = time.time() + retry_after
+                        break
+                if not self._is_retryable(e):
+                    # Bad key, no balance, bad request...: another attempt cannot succeed
+                    break
                 
                 if attempt < retries - 1:
-                    wait_time = (attempt + 1) * 2
+                    # Exponential backoff with jitter so parallel callers don't retry in lockstep
+                    wait_time = min(self.BACKOFF_CAP, self.BACKOFF_BASE * 2 ** attempt + random.random())
                     time.sleep(wait_time)
         
-        self.store.update_model_stat(f"{self.engine_name}:{self.model_name}", False, 0)
+        store.update_model_stat(stat_key, False, 0)
         return None
         
     def _unsafe_generate(self, prompt):
         """To be implemented by subclasses"""
         pass
-        
-    def chat(self, user_msg, history):
-        """Chat with silent error handling"""
+    
+    def chat(self, user_msg, history, on_token=None):
+        """Chat with silent error handling; on_token receives each streamed text piece"""
+        if time.time() < self._cooldown_until:
+            return f"⚠️ {self.engine_name} is rate limited, try again shortly.", self.engine_name
+        reply = self.try_chat(user_msg, history, on_token)
+        if reply is None:
+            return f"⚠️ {self.engine_name} is temporarily unavailable.", self.engine_name
+        return reply
+    
+    def try_chat(self, user_msg, history, on_token=None):
+        """chat() that returns None, not a notice, while rate limited or when the request fails"""
+        if time.time() < self._cooldown_until:
+            return None
         try:
-            return self._unsafe_chat(user_msg, history)
+            return self._unsafe_chat(user_msg, history, on_token)
         except Exception as e:
+            if getattr(e, "status_code", None) == 429:
+                self._cooldown_until = time.time() + (self._retry_after(e) or 0)
             self.store.log_error(f"{self.engine_name} chat error: {e}", user_msg[:50], silent=True)
-            self.store.update_model_stat(f"{self.engine_name}:{self.model_name}", False, 0)
-            return f"⚠️ {self.engine_name} is temporarily unavailable.", self.engine_name
+            self.store.update_model_stat(self._stat_key, False, 0)
+            return None
         
-    def _unsafe_chat(self, user_msg, history):
+    def _unsafe_chat(self, user_msg, history, on_token=None):
         """To be implemented by subclasses"""
         pass
-        
+    
+    @staticmethod
+    def _openai_messages(history, user_msg):
+        """Last HISTORY_TURNS history entries in OpenAI role/content form, then user_msg"""
+        start = max(0, len(history) - BaseAIEngine.HISTORY_TURNS)
+        no_parts = BaseAIEngine._NO_PARTS
+        messages = [
+            {"role": "user" if msg.get("role") == "user" else "assistant",
+             "content": msg.get("parts", no_parts)[0]}
+            for msg in itertools.islice(history, start, None)
+        ]
+        messages.append({"role": "user", "content": user_msg})
+        return messages
+    
+    @staticmethod
+    def _collect_stream(stream, on_token):
+        """Join an OpenAI-style chunk stream; returns (text, total_tokens or None)"""
+        pieces = []
+        tokens = None
+        for chunk in stream:
+            if chunk.choices:
+                piece = chunk.choices[0].delta.content
+                if piece:
+                    pieces.append(piece)
+                    if on_token is not None:
+                        on_token(piece)
+            if getattr(chunk, "usage", None):
+                # include_usage puts the totals on the final, choice-less chunk
+                tokens = chunk.usage.total_tokens
+        return "".join(pieces), tokens
+    
     def get_fix_for_error(self, cmd, error_output):
         """Get fix with silent error handling"""
         try:
@@ -1153,8 +2174,8 @@ class BaseAIEngine:
             return None
     
     def _unsafe_get_fix(self, cmd, error_output):
-        """To be implemented by subclasses"""
-        pass
+        fix = self._cached_generate(_FIX_PROMPT.format(cmd=cmd, err=_stable_error(error_output[:500])))
+        return fix.strip() if fix and "NO_PACKAGE_FIX" not in fix.upper() else None
 
 class GeminiEngine(BaseAIEngine):
     """Gemini AI Engine with silent error handling"""
@@ -1163,23 +2184,26 @@ class GeminiEngine(BaseAIEngine):
         super().__init__(persistence)
         self.engine_name = "gemini"
         self.model_name = persistence.config.get("model", "gemini-2.5-flash-lite")
+        self._stat_key = sys.intern(f"{self.engine_name}:{self.model_name}")
         self._configure_api()
         
     def _configure_api(self):
         if not AI_ENGINES.get('gemini', False):
             raise ImportError("google-generativeai not installed")
             
-        key = self.store.config.get("gemini_api_key")
-        while not key and not UI.GHOST_MODE:
-            UI.print_system("Gemini Authentication Required")
-            key = input("🔑 Please paste your Gemini API Key: ").strip()
-            self.store.config["gemini_api_key"] = key
-            self.store.save()
+        key = self._acquire_key("gemini_api_key", "Gemini")
         
         if key:
+            genai = _get_engine('gemini')
             genai.configure(api_key=key)
             self.model = genai.GenerativeModel(self.model_name)
             self._configured = True
+    
+    def set_model(self, model_name):
+        super().set_model(model_name)
+        if self._configured:
+            # The model handle is bound to one model; the configured API key carries over
+            self.model = _get_engine('gemini').GenerativeModel(model_name)
         
     def _unsafe_generate(self, prompt):
         if not self._configured:
@@ -1188,68 +2212,60 @@ class GeminiEngine(BaseAIEngine):
         response = self.model.generate_content(prompt)
         return response.text
         
-    def _unsafe_chat(self, user_msg, history):
+    def _unsafe_chat(self, user_msg, history, on_token=None):
         if not self._configured:
             return "Gemini engine not configured.", "gemini"
             
         chat_session = self.model.start_chat(history=history)
-        response = chat_session.send_message(user_msg)
-        text = response.text
-        
-        tokens_used = len(text.split()) * 1.3
-        self.store.update_model_stat(f"gemini:{self.model_name}", True, int(tokens_used))
+        response = chat_session.send_message(user_msg, stream=True)
+        pieces = []
+        for chunk in response:
+            piece = chunk.text
+            pieces.append(piece)
+            if on_token is not None and piece:
+                on_token(piece)
+        text = "".join(pieces)
+        
+        usage = getattr(response, "usage_metadata", None)
+        tokens_used = usage.total_token_count if usage else len(text) // 4
+        self.store.update_model_stat(self._stat_key, True, tokens_used)
         return text, "gemini"
-            
-    def _unsafe_get_fix(self, cmd, error_output):
-        prompt = f"""
-        Command Failed: `{cmd}`
-        Error: {error_output[:500]}
-        
-        Analyze if this is a missing package/command error.
-        If yes, provide the exact package installation command.
-        
-        Examples:
-        - If 'npm' not found: 'curl -fsSL https://deb.nodesource.com/setup_lts.x | sudo -E bash - && sudo apt-get install -y nodejs'
-        - If 'python3' not found: 'sudo apt update && sudo apt install python3'
-        - If package missing: 'pip install package_name' or 'npm install package_name'
-        
-        Provide ONLY the installation command if needed, or "NO_PACKAGE_FIX" if not.
-        """
-        fix = self._unsafe_generate(prompt)
-        return fix.strip() if fix and "NO_PACKAGE_FIX" not in fix.upper() else None
 
 class DeepSeekEngine(BaseAIEngine):
     """DeepSeek AI Engine with silent error handling"""
+    BALANCE_TTL = 60.0  # seconds a balance answer is reused before probing the API again
     
     def __init__(self, persistence: PersistenceLayer):
         super().__init__(persistence)
         self.engine_name = "deepseek"
         self.model_name = persistence.config.get("deepseek_model", "deepseek-reasoner")
+        self._stat_key = sys.intern(f"{self.engine_name}:{self.model_name}")
         self._configured = False
         self.balance_checked = False
         self.balance_available = True
+        self._balance_checked_at = None  # monotonic time of the last definite balance answer
         self._configure_api()
         
     def _configure_api(self):
         if not AI_ENGINES.get('deepseek', False):
             raise ImportError("openai not installed")
             
-        key = self.store.config.get("deepseek_api_key")
-        while not key and not UI.GHOST_MODE:
-            UI.print_system("DeepSeek Authentication Required")
-            key = input("🔑 Please paste your DeepSeek API Key: ").strip()
-            self.store.config["deepseek_api_key"] = key
-            self.store.save()
+        key = self._acquire_key("deepseek_api_key", "DeepSeek")
         
         if key:
-            self.client = OpenAI(
+            openai = _get_engine('deepseek')
+            self.client = openai.OpenAI(
                 api_key=key,
-                base_url="https://api.deepseek.com"
+                base_url="https://api.deepseek.com",
+                http_client=_shared_http_client()
             )
             self._configured = True
                 
     def check_balance(self):
         """Check DeepSeek account balance silently"""
+        checked_at = self._balance_checked_at
+        if checked_at is not None and time.monotonic() - checked_at < self.BALANCE_TTL:
+            return self.balance_available
         try:
             test_prompt = "Hello"
             response = self.client.chat.completions.create(
@@ -1259,91 +2275,84 @@ class DeepSeekEngine(BaseAIEngine):
             )
             self.balance_available = True
             self.balance_checked = True
+            self._balance_checked_at = time.monotonic()
             return True
         except Exception as e:
-            error_msg = str(e)
-            if "402" in error_msg or "Insufficient Balance" in error_msg:
-                self.balance_available = False
-                self.balance_checked = True
+            if self._record_balance_error(e, "balance_check"):
                 return False
-            elif "401" in error_msg:
-                self.store.log_error("DeepSeek API Key invalid or expired.", "balance_check", silent=True)
-                self.balance_available = False
-                return False
-            else:
-                self.balance_available = True
-                return True
+            self.balance_available = True
+            return True
+    
+    def _record_balance_error(self, exc, context):
+        """Mark the balance unavailable if exc is a 402/401 from DeepSeek; True if it was"""
+        status = getattr(exc, "status_code", None)
+        if status is None:
+            # Older SDKs raise plain exceptions; classify from the message, scanned once
+            match = _BALANCE_ERROR_RE.search(str(exc))
+            status = 401 if match and match.group() == "401" else 402 if match else None
+        if status == 402:
+            self.balance_available = False
+            self.balance_checked = True
+            self._balance_checked_at = time.monotonic()
+            return True
+        if status == 401:
+            self.store.log_error("DeepSeek API Key invalid or expired.", context, silent=True)
+            self.balance_available = False
+            self._balance_checked_at = time.monotonic()
+            return True
+        return False
                 
     def _unsafe_generate(self, prompt):
         if not self._configured:
             return None
-            
-        if not self.balance_checked:
-            if not self.check_balance():
-                self.store.log_error("DeepSeek: Insufficient Balance", "generate", silent=True)
-                return None
         
+        # No probe request: the balance is learned from the real call's 402
         if not self.balance_available:
             self.store.log_error("DeepSeek: Insufficient Balance", "generate", silent=True)
             return None
-            
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=self.store.config.get("max_tokens", 8192)
-        )
+        
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=self.store.config.get("max_tokens", 8192)
+            )
+        except Exception as e:
+            self._record_balance_error(e, "generate")
+            raise
+        self.balance_checked = True
         
         return response.choices[0].message.content
         
-    def _unsafe_chat(self, user_msg, history):
+    def _unsafe_chat(self, user_msg, history, on_token=None):
         if not self._configured:
             return "DeepSeek engine not configured.", "deepseek"
             
-        if not self.balance_checked:
-            if not self.check_balance():
-                error_msg = "❌ DeepSeek: Insufficient Balance"
-                self.store.log_error(error_msg, "chat", silent=True)
-                return error_msg, "deepseek"
-        
         if not self.balance_available:
             error_msg = "❌ DeepSeek: Insufficient Balance"
             return error_msg, "deepseek"
             
-        messages = []
-        for msg in history[-10:]:
-            role = "user" if msg.get("role") == "user" else "assistant"
-            messages.append({"role": role, "content": msg.get("parts", [""])[0]})
-        
-        messages.append({"role": "user", "content": user_msg})
+        messages = self._openai_messages(history, user_msg)
         
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=messages,
-            max_tokens=self.store.config.get("max_tokens", 8192)
-        )
+        try:
+            stream = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                max_tokens=self.store.config.get("max_tokens", 8192),
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+        except Exception as e:
+            if self._record_balance_error(e, "chat"):
+                error_msg = "❌ DeepSeek: Insufficient Balance"
+                self.store.log_error(error_msg, "chat", silent=True)
+                return error_msg, "deepseek"
+            raise
+        self.balance_checked = True
         
-        text = response.choices[0].message.content
-        tokens_used = response.usage.total_tokens if response.usage else len(text.split()) * 1.3
-        self.store.update_model_stat(f"deepseek:{self.model_name}", True, int(tokens_used))
+        text, tokens_used = self._collect_stream(stream, on_token)
+        self.store.update_model_stat(self._stat_key, True, tokens_used or len(text) // 4)
         return text, "deepseek"
-            
-    def _unsafe_get_fix(self, cmd, error_output):
-        prompt = f"""
-        Command Failed: `{cmd}`
-        Error: {error_output[:500]}
-        
-        Analyze if this is a missing package/command error.
-        If yes, provide the exact package installation command.
-        
-        Examples:
-        - If 'npm' not found: 'curl -fsSL https://deb.nodesource.com/setup_lts.x | sudo -E bash - && sudo apt-get install -y nodejs'
-        - If 'python3' not found: 'sudo apt update && sudo apt install python3'
-        - If package missing: 'pip install package_name' or 'npm install package_name'
-        
-        Provide ONLY the installation command if needed, or "NO_PACKAGE_FIX" if not.
-        """
-        fix = self._unsafe_generate(prompt)
-        return fix.strip() if fix and "NO_PACKAGE_FIX" not in fix.upper() else None
 
 class GroqEngine(BaseAIEngine):
     """Groq AI Engine with silent error handling"""
@@ -1352,6 +2361,7 @@ class GroqEngine(BaseAIEngine):
         super().__init__(persistence)
         self.engine_name = "groq"
         self.model_name = persistence.config.get("groq_model", "mixtral-8x7b-32768")
+        self._stat_key = sys.intern(f"{self.engine_name}:{self.model_name}")
         self._configured = False
         self._configure_api()
         
@@ -1359,16 +2369,12 @@ class GroqEngine(BaseAIEngine):
         if not AI_ENGINES.get('groq', False):
             raise ImportError("groq library not installed")
             
-        key = self.store.config.get("groq_api_key")
-        while not key and not UI.GHOST_MODE:
-            UI.print_system("Groq Authentication Required")
-            key = input("🔑 Please paste your Groq API Key: ").strip()
-            self.store.config["groq_api_key"] = key
-            self.store.save()
+        key = self._acquire_key("groq_api_key", "Groq")
         
         if key:
             try:
-                self.client = groq.Groq(api_key=key)
+                groq = _get_engine('groq')
+                self.client = groq.Groq(api_key=key, http_client=_shared_http_client())
                 self._configured = True
             except Exception as e:
                 self.store.log_error(f"Failed to initialize Groq client: {e}", "config", silent=True)
@@ -1378,60 +2384,38 @@ class GroqEngine(BaseAIEngine):
         if not self._configured:
             return None
             
+        config = self.store.config
         response = self.client.chat.completions.create(
             model=self.model_name,
             messages=[{"role": "user", "content": prompt}],
-            temperature=self.store.config.get("temperature", 0.7),
-            max_tokens=self.store.config.get("max_tokens", 8192),
+            temperature=config.get("temperature", 0.7),
+            max_tokens=config.get("max_tokens", 8192),
             top_p=1,
             stream=False
         )
         
         return response.choices[0].message.content
         
-    def _unsafe_chat(self, user_msg, history):
+    def _unsafe_chat(self, user_msg, history, on_token=None):
         if not self._configured:
             return "Groq engine not configured.", "groq"
             
-        messages = []
-        
-        for msg in history[-10:]:
-            role = "user" if msg.get("role") == "user" else "assistant"
-            messages.append({"role": role, "content": msg.get("parts", [""])[0]})
-        
-        messages.append({"role": "user", "content": user_msg})
+        messages = self._openai_messages(history, user_msg)
         
+        config = self.store.config
         response = self.client.chat.completions.create(
             model=self.model_name,
             messages=messages,
-            temperature=self.store.config.get("temperature", 0.7),
-            max_tokens=self.store.config.get("max_tokens", 8192),
+            temperature=config.get("temperature", 0.7),
+            max_tokens=config.get("max_tokens", 8192),
             top_p=1,
-            stream=False
+            stream=True,
+            stream_options={"include_usage": True}
         )
         
-        text = response.choices[0].message.content
-        tokens_used = response.usage.total_tokens if response.usage else len(text.split()) * 1.3
-        self.store.update_model_stat(f"groq:{self.model_name}", True, int(tokens_used))
+        text, tokens_used = self._collect_stream(response, on_token)
+        self.store.update_model_stat(self._stat_key, True, tokens_used or len(text) // 4)
         return text, "groq"
-            
-    def _unsafe_get_fix(self, cmd, error_output):
-        prompt = f"""
-        Command Failed: `{cmd}`
-        Error: {error_output[:500]}
-        
-        Analyze if this is a missing package/command error.
-        If yes, provide the exact package installation command.
-        
-        Examples:
-        - If 'npm' not found: 'curl -fsSL https://deb.nodesource.com/setup_lts.x | sudo -E bash - && sudo apt-get install -y nodejs'
-        - If 'python3' not found: 'sudo apt update && sudo apt install python3'
-        - If package missing: 'pip install package_name' or 'npm install package_name'
-        
-        Provide ONLY the installation command if needed, or "NO_PACKAGE_FIX" if not.
-        """
-        fix = self._unsafe_generate(prompt)
-        return fix.strip() if fix and "NO_PACKAGE_FIX" not in fix.upper() else None
         
     def get_available_models(self):
         """Get list of available Groq models"""
@@ -1447,12 +2431,18 @@ class GroqEngine(BaseAIEngine):
 class MultiAIEngine:
     """Manages multiple AI engines with fallback support and silent error handling"""
     
+    _LATENCY_ALPHA = 0.3  # weight of the newest sample in the per-engine latency EMA
+    _FREE_ENGINES = frozenset({'groq', 'gemini'})  # no per-request billing; safe to hedge with
+    
     def __init__(self, persistence: PersistenceLayer):
         self.store = persistence
         self.engines = {}
         self.active_engine_name = persistence.config.get("active_engine", "groq")
+        self._latency_ema = {}
         self._init_engines()
         self.fallback_order = self._determine_fallback_order()
+        # Losing racers finish in the background, so keep spare workers for the next call
+        self._pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="xeda-ai")
         
     def _determine_fallback_order(self):
         """Determine smart fallback order based on availability and balance"""
@@ -1465,40 +2455,34 @@ class MultiAIEngine:
             order.append('gemini')
         
         if 'deepseek' in self.engines:
-            deepseek_engine = self.engines['deepseek']
-            if not deepseek_engine.balance_checked:
-                if deepseek_engine.check_balance():
-                    order.append('deepseek')
-            elif deepseek_engine.balance_available:
+            # Assumed funded until a real request comes back 402
+            if self.engines['deepseek'].balance_available:
                 order.append('deepseek')
         
         return order
     
+    _ENGINE_CLASSES = (
+        ('groq', 'Groq', GroqEngine),
+        ('gemini', 'Gemini', GeminiEngine),
+        ('deepseek', 'DeepSeek', DeepSeekEngine),
+    )
+    
     def _init_engines(self):
-        """Initialize all available engines"""
-        if AI_ENGINES.get('groq', False):
-            try:
-                self.engines['groq'] = GroqEngine(self.store)
-                UI.print_success(f"✓ Groq engine loaded: {self.engines['groq'].model_name}", silent=True)
-                if not self.active_engine_name or self.active_engine_name not in self.engines:
-                    self.active_engine_name = 'groq'
-                    self.store.config["active_engine"] = 'groq'
-            except Exception as e:
-                self.store.log_error(f"Failed to load Groq: {e}", "engine_init", silent=True)
-                
-        if AI_ENGINES.get('gemini', False):
-            try:
-                self.engines['gemini'] = GeminiEngine(self.store)
-                UI.print_success(f"✓ Gemini engine loaded: {self.engines['gemini'].model_name}", silent=True)
-            except Exception as e:
-                self.store.log_error(f"Failed to load Gemini: {e}", "engine_init", silent=True)
-                
-        if AI_ENGINES.get('deepseek', False):
-            try:
-                self.engines['deepseek'] = DeepSeekEngine(self.store)
-                UI.print_success(f"✓ DeepSeek engine loaded: {self.engines['deepseek'].model_name}", silent=True)
-            except Exception as e:
-                self.store.log_error(f"Failed to load DeepSeek: {e}", "engine_init", silent=True)
+        """Initialize all available engines; SDK imports and client setup run in parallel"""
+        wanted = [entry for entry in self._ENGINE_CLASSES if AI_ENGINES.get(entry[0], False)]
+        if wanted:
+            with ThreadPoolExecutor(max_workers=len(wanted)) as pool:
+                futures = [(name, label, pool.submit(engine_cls, self.store)) for name, label, engine_cls in wanted]
+            # Results are read in the fixed groq/gemini/deepseek order so output and defaults stay stable
+            for name, label, future in futures:
+                try:
+                    self.engines[name] = future.result()
+                    UI.print_success(f"✓ {label} engine loaded: {self.engines[name].model_name}", silent=True)
+                    if name == 'groq' and (not self.active_engine_name or self.active_engine_name not in self.engines):
+                        self.active_engine_name = 'groq'
+                        self.store.config["active_engine"] = 'groq'
+                except Exception as e:
+                    self.store.log_error(f"Failed to load {label}: {e}", "engine_init", silent=True)
                 
         if not self.engines:
             if not UI.SILENT_ERRORS:
@@ -1521,6 +2505,69 @@ class MultiAIEngine:
         """Get specific engine by name"""
         return self.engines.get(engine_name)
         
+    def _hedge_delay(self, engine_name):
+        """Seconds to wait on an engine before racing fallbacks: 1.5x its usual latency"""
+        ema = self._latency_ema.get(engine_name)
+        if ema is None:
+            return self.store.config.get("hedge_delay", 2.0)
+        return max(0.5, ema * 1.5)
+    
+    def _timed_generate(self, engine, prompt, retries):
+        start = time.monotonic()
+        result = engine.generate_content(prompt, retries)
+        if result:
+            elapsed = time.monotonic() - start
+            previous = self._latency_ema.get(engine.engine_name, elapsed)
+            self._latency_ema[engine.engine_name] = previous + self._LATENCY_ALPHA * (elapsed - previous)
+        return result
+    
+    def _race(self, prompt, retries, primary, fallbacks):
+        """Primary first, then fallbacks; returns (result, engine, whether primary failed).
+        
+        With hedge_requests on, a primary slower than its hedge delay is raced against
+        the free-tier fallbacks. Paid engines are only asked once everything else failed.
+        """
+        pending = {}
+        free = [engine for engine in fallbacks if engine.engine_name in self._FREE_ENGINES]
+        paid = [engine for engine in fallbacks if engine.engine_name not in self._FREE_ENGINES]
+        
+        def submit(engines):
+            if engines and not UI.GHOST_MODE:
+                UI.update_progress(f"Trying {', '.join(e.engine_name.upper() for e in engines)}...")
+            for engine in engines:
+                pending[self._pool.submit(self._timed_generate, engine, prompt, retries)] = engine
+        
+        primary_failed = primary is None
+        if primary is not None:
+            future = self._pool.submit(self._timed_generate, primary, prompt, retries)
+            pending[future] = primary
+            hedge = self.store.config.get("hedge_requests", False)
+            done, _ = wait(pending, timeout=self._hedge_delay(primary.engine_name) if hedge else None)
+            if done:
+                result = future.result()
+                if result:
+                    return result, primary, False
+                del pending[future]
+                primary_failed = True
+        submit(free)
+        
+        while pending or paid:
+            if not pending:
+                submit(paid)
+                paid = []
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                engine = pending.pop(future)
+                result = future.result()
+                if result:
+                    # Queued losers are dropped; ones already running finish unobserved
+                    for loser in pending:
+                        loser.cancel()
+                    return result, engine, primary_failed
+                if engine is primary:
+                    primary_failed = True
+        return None, None, True
+    
     def generate_content(self, prompt, retries=3, force_engine=None):
         """Generate content with intelligent fallback support and silent error handling"""
         if force_engine and force_engine in self.engines:
@@ -1532,45 +2579,74 @@ class MultiAIEngine:
                 if result:
                     return result, engine.engine_name
         
-        engine = self.get_active_engine()
-        if engine:
-            if engine.engine_name == 'deepseek' and not engine.balance_available:
-                self.store.log_error(f"DeepSeek has insufficient balance", "generate", silent=True)
-            else:
-                result = engine.generate_content(prompt, retries)
-                if result:
-                    return result, engine.engine_name
-                
+        primary = self.get_active_engine()
+        if primary and primary.engine_name == 'deepseek' and not primary.balance_available:
+            self.store.log_error(f"DeepSeek has insufficient balance", "generate", silent=True)
+            primary = None
+        
+        fallbacks = []
         if self.store.config.get("fallback_enabled", True):
             self.fallback_order = self._determine_fallback_order()
-            
             for engine_name in self.fallback_order:
-                if engine_name != self.active_engine_name:
-                    fallback_engine = self.engines[engine_name]
-                    
-                    if engine_name == 'deepseek' and not fallback_engine.balance_available:
-                        continue
-                        
-                    if not UI.GHOST_MODE:
-                        UI.update_progress(f"Trying {engine_name.upper()}...")
-                    
-                    result = fallback_engine.generate_content(prompt, retries)
-                    if result:
-                        self.switch_engine(engine_name)
-                        if not UI.GHOST_MODE:
-                            UI.update_progress(f"Auto-switched to {engine_name.upper()}")
-                            time.sleep(0.5)
-                        return result, fallback_engine.engine_name
-                        
-        return None, None
+                if engine_name == self.active_engine_name:
+                    continue
+                fallback_engine = self.engines[engine_name]
+                if engine_name == 'deepseek' and not fallback_engine.balance_available:
+                    continue
+                fallbacks.append(fallback_engine)
+        
+        result, engine, primary_failed = self._race(prompt, retries, primary, fallbacks)
+        if engine is None:
+            return None, None
+        if engine is not primary and primary_failed:
+            # A hedge that merely beat a slow primary answers this call but keeps the user's choice
+            self.switch_engine(engine.engine_name)
+            if not UI.GHOST_MODE:
+                UI.update_progress(f"Auto-switched to {engine.engine_name.upper()}")
+                time.sleep(0.5)
+        return result, engine.engine_name
+        
+    def generate_content_stream(self, prompt, on_token):
+        """Stream the active engine's answer through on_token; falls back to generate_content"""
+        engine = self.get_active_engine()
+        if (engine is not None and getattr(engine, "_configured", False)
+                and getattr(engine, "balance_available", True)):
+            reply = engine.try_chat(prompt, [], on_token)
+            # DeepSeek reports a 402 as a message rather than raising
+            if reply is not None and reply[0] and getattr(engine, "balance_available", True):
+                return reply[0], engine.engine_name
+        return self.generate_content(prompt)
+    
+    async def agenerate_content(self, prompt, retries=3, force_engine=None):
+        """Awaitable generate_content so callers can overlap independent requests"""
+        return await asyncio.to_thread(self.generate_content, prompt, retries, force_engine)
+    
+    def batch_generate_content(self, prompts, max_concurrency=None):
+        """Run independent prompts concurrently; returns (text, engine_name) per prompt, in order"""
+        limit = max(1, int(max_concurrency or self.store.config.get("max_concurrency", 4)))
+        
+        async def generate_all():
+            gate = asyncio.Semaphore(limit)
+            
+            async def generate(prompt):
+                async with gate:
+                    return await self.agenerate_content(prompt)
+            
+            return await asyncio.gather(*(generate(prompt) for prompt in prompts), return_exceptions=True)
+        
+        results = asyncio.run(generate_all())
+        for result in results:
+            if isinstance(result, Exception):
+                self.store.log_error(f"Batch generation error: {result}", "batch", silent=True)
+        return [(None, None) if isinstance(result, Exception) else result for result in results]
         
-    def chat(self, user_msg, history):
+    def chat(self, user_msg, history, on_token=None):
         """Chat with active engine"""
         engine = self.get_active_engine()
         if engine:
-            return engine.chat(user_msg, history)
+            return engine.chat(user_msg, history, on_token)
         return "No AI engine available.", None
-        
+    
     def get_fix_for_error(self, cmd, error_output):
         """Get fix with active engine"""
         engine = self.get_active_engine()
@@ -1582,13 +2658,431 @@ class MultiAIEngine:
 # 5. ENHANCED AGENT BRAIN WITH DEEP THINKING
 # ==============================================================================
 
+# Classifier rubric is sent first and byte-identical every call so provider prefix caches hit;
+# only the user input at the end varies
+_ROUTER_PROMPT = """You are a STRICT Intent Classifier for a developer assistant.
+
+Your task:
+Classify the user's input into EXACTLY ONE category based on INTENT, not wording.
+
+CATEGORIES:
+
+1. CHAT
+- Casual conversation, greetings, opinions, or non-technical talk.
+- No request to explain, build, fix, or run anything.
+- Examples:
+"hello"
+"thanks"
+"احسن لغة ايه؟"
+
+2. QUESTION
+- Asking for explanations, concepts, comparisons, or how something works.
+- NO request to execute, install, modify, or create anything.
+- Examples:
+"what is JWT?"
+"explain REST vs GraphQL"
+"npm بيشتغل ازاي؟"
+
+3. MODIFY_PROJECT
+- Requests to CHANGE or UPDATE an EXISTING project or codebase.
+- Mentions current files, code, structure, or features to modify.
+- Examples:
+"add auth to my app"
+"update package.json"
+"refactor this function"
+
+4. CREATE_PROJECT
+- Requests to CREATE something NEW from scratch.
+- Includes scaffolding, boilerplate, initialization, or full setup.
+- Examples:
+"create a Next.js app"
+"start a FastAPI project"
+"generate a CLI tool"
+
+5. DEBUG
+- Fixing errors, crashes, failed commands, or unexpected behavior.
+- Includes error messages, logs, stack traces, or words like:
+error, failed, not working, crash.
+- Examples:
+"npm install failed"
+"this command gives error"
+"fix this bug"
+
+6. RUN_ONLY
+- Requests whose PRIMARY intent is to EXECUTE, INSTALL, DOWNLOAD, START, STOP, or RUN something.
+- Even if written in natural language, slang, or Arabic.
+- NO explanation requested.
+- NO code modification or project creation.
+- The expected response is a SHELL COMMAND ONLY.
+
+Examples that MUST be classified as RUN_ONLY:
+
+- "install node"
+- "حملي npm"
+- "نزل git"
+- "عاوز انزل docker"
+- "شغل السيرفر"
+- "run tests"
+- "start redis"
+- "وقف الكونتينر"
+- "update node version"
+- "ثبت الباكج بتاع fastapi"
+
+IMPORTANT DISTINCTION:
+- If the user wants an explanation → QUESTION
+- If the user wants execution or installation → RUN_ONLY
+- If the user wants to fix a failure → DEBUG
+- If the user wants to build something new → CREATE_PROJECT
+- If the user wants to change existing code → MODIFY_PROJECT
+
+PRIORITY RULES (STRICT ORDER):
+1. If input contains an ERROR, FAILURE, or crash → DEBUG
+2. If input requests changing existing code/files → MODIFY_PROJECT
+3. If input requests creating a new project → CREATE_PROJECT
+4. If input requests installing, downloading, running, starting, stopping anything → RUN_ONLY
+5. If input is informational only → QUESTION
+6. Otherwise → CHAT
+
+OUTPUT RULES:
+- Output ONLY ONE category name.
+- NO explanations.
+- NO punctuation.
+- NO extra text.
+- Output must be EXACTLY one of:
+    CHAT
+    QUESTION
+    MODIFY_PROJECT
+    CREATE_PROJECT
+    DEBUG
+    RUN_ONLY
+
+User Input:
+"""
+
+_INTENTS = frozenset({"CHAT", "QUESTION", "MODIFY_PROJECT", "CREATE_PROJECT", "DEBUG", "RUN_ONLY"})
+_WORD_RE = re.compile(r"\w+")
+# Arabic harakat, tanween and shadda: combining marks that \w does not match, so "ثبّت" would split in two
+_DIACRITICS_RE = re.compile("[\u064B-\u0652]")
+
+# Inputs the rubric decides on wording alone, classified locally without a model call.
+# Priority rule 1: error/failure/crash wording is DEBUG.
+_DEBUG_WORDS_RE = re.compile(
+    r"\b(?:errors?|failed|failing|fails|crash(?:ed|es|ing)?|not working|traceback|exception|"
+    r"خطأ|خطا|ايرور|إيرور|مش شغال|بيضرب)\b"
+)
+# Whole-input greetings and thanks are CHAT
+_GREETINGS = frozenset({
+    "hi", "hello", "hey", "thanks", "thank you", "thx", "good morning", "good night",
+    "مرحبا", "اهلا", "أهلا", "السلام عليكم", "شكرا", "صباح الخير", "مساء الخير"
+})
+
+# Static parts of the planning and codegen prompts, built once; only the context above them varies
+_PLAN_PROMPT_TAIL = """
+Goal: Create a detailed Step-by-Step execution plan with DEEP ANALYSIS.
+
+Requirements:
+1. Assign a Confidence Score (0-100) with justification.
+2. Analyze the risk (Low, Medium, High) with explanation.
+3. Provide DEEP TECHNICAL ANALYSIS of the approach.
+4. List any DEPENDENCIES required.
+5. Offer a 'suggestion' (AI-as-a-Teammate) for architecture improvements.
+6. Provide steps with actions: CREATE, MODIFY, DELETE, COMMAND, ANALYZE.
+7. For each step, include REASONING explaining why it's necessary.
+
+Constraint: Return ONLY a valid JSON object.
+
+JSON Format Example:
+{
+    "confidence": 92,
+    "confidence_reason": "Task is straightforward and matches existing patterns in the project",
+    "risk": "Low",
+    "risk_reason": "Only modifies configuration files, no core logic changes",
+    "analysis": "This task requires adding a new endpoint to the existing API. The project uses Flask framework and follows MVC pattern. Need to create model, view, and controller components.",
+    "dependencies": ["flask", "sqlalchemy"],
+    "suggestion": "Consider adding input validation and error handling to the new endpoint.",
+    "steps": [
+        {
+            "action": "analyze",
+            "target": "app.py",
+            "description": "Review main application structure",
+            "reasoning": "Need to understand the current Flask app structure before adding new endpoints"
+        },
+        {
+            "action": "create",
+            "path": "models/new_model.py",
+            "description": "Create new database model",
+            "reasoning": "Required for the new feature's data structure"
+        },
+        {
+            "action": "modify",
+            "path": "app.py",
+            "description": "Add new route endpoint",
+            "reasoning": "Main application file needs the new route definition"
+        },
+        {
+            "action": "command",
+            "command": "pip install flask sqlalchemy",
+            "description": "Install required dependencies",
+            "reasoning": "These packages are needed for the new functionality"
+        }
+    ]
+}
+"""
+
+_CODEGEN_PROMPT_TAIL = """
+Requirements:
+1. Generate COMPLETE, WORKING code.
+2. Follow best practices and coding standards.
+3. Add comments for complex logic.
+4. Handle edge cases appropriately.
+5. Ensure code is well-structured and maintainable.
+
+Output: ONLY the complete code content. No markdown blocks, no explanations.
+"""
+
+# Markdown fence lines around a JSON answer
+_JSON_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.M)
+# Body of the first ```json block, else of the first ``` block (an unclosed fence runs to the end)
+_JSON_BLOCK_RE = re.compile(r"```json(.*?)(?:```|\Z)", re.S)
+_ANY_BLOCK_RE = re.compile(r"```(.*?)(?:```|\Z)", re.S)
+# Opening fence line (any language tag) or closing fence at a line end
+_CODE_FENCE_RE = re.compile(r"^```[\w+-]*[ \t]*\n?|\n?```[ \t]*$", re.M)
+# Plan header fields worth showing while the rest of the plan is still streaming;
+# a value only matches once its closing quote (or the comma/brace after a bare value) has arrived
+_PLAN_FIELD_RE = re.compile(r'"(confidence|risk)"\s*:\s*(?:"([^"\\\n]{1,40})"|(\w+)\s*[,}])')
+
+# Offline fallback for intent_backend "local": the rubric's priority rules as cue words, checked in order
+_MODIFY_CUES = frozenset({
+    "add", "update", "change", "refactor", "modify", "edit", "rename", "remove", "replace",
+    "ضيف", "اضف", "أضف", "عدل", "غير", "حدث", "احذف", "شيل"
+})
+_PROJECT_OBJECTS = frozenset({
+    "my", "this", "existing", "file", "files", "code", "function", "class", "app", "project",
+    "route", "component", "json", "py", "js", "ts", "الكود", "الملف", "المشروع", "الدالة"
+})
+_CREATE_CUES = frozenset({
+    "create", "generate", "scaffold", "init", "initialize", "new", "build", "make",
+    "اعمل", "انشئ", "أنشئ", "ابني", "جديد"
+})
+_RUN_CUES = frozenset({
+    "install", "download", "run", "start", "stop", "restart", "launch", "execute", "kill", "update", "upgrade",
+    "نزل", "حمل", "حملي", "ثبت", "شغل", "شغلي", "وقف", "انزل"
+})
+_QUESTION_CUES = frozenset({
+    "what", "why", "how", "explain", "difference", "vs", "which", "when",
+    "ايه", "إيه", "ازاي", "إزاي", "ليه", "اشرح", "يعني", "الفرق"
+})
+_INTENT_CUES = (
+    ("MODIFY_PROJECT", _MODIFY_CUES, _PROJECT_OBJECTS),
+    ("CREATE_PROJECT", _CREATE_CUES, None),
+    ("RUN_ONLY", _RUN_CUES, None),
+    ("QUESTION", _QUESTION_CUES, None),
+)
+# Things an imperative create request builds ("create a flask app", "اعمل مشروع")
+_BUILD_OBJECTS = frozenset({
+    "file", "project", "app", "application", "api", "cli", "tool", "script", "website", "site",
+    "server", "service", "bot", "component", "module", "package", "library",
+    "ملف", "مشروع", "تطبيق", "موقع", "سكريبت", "اداة", "أداة"
+})
+_FIX_VERBS = frozenset({"fix", "debug", "صلح", "اصلح", "أصلح"})
+_CHANGE_CUES = _MODIFY_CUES | _CREATE_CUES
+# Words that make a run-verb command ambiguous enough to still ask the model
+_RUN_AMBIGUOUS = _MODIFY_CUES | _PROJECT_OBJECTS | _CREATE_CUES | _QUESTION_CUES
+_RUN_MAX_WORDS = 4
+
 class AgentBrain:
     """The intelligence layer that decides WHAT to do using AI, not Keywords."""
     
+    INTENT_CACHE_SIZE = 256
+    THINKING_INTERVAL = 0.3  # seconds per thinking step on the progress line
+    
+    # أنماط للكلمات الدالة (باللغتين العربية والإنجليزية)
+    _INSTALL_WORD_RE = re.compile("|".join(map(re.escape, [
+        'download', 'install', 'get', 'setup', 'fetch', 'pull',
+        'تحميل', 'نزّل', 'نزل', 'حمّل', 'حملي', 'ثبّت', 'شغّل',
+        'شغلي', 'عاوز', 'أريد', 'ابغى', 'نبي', 'محتاج', 'احتاج',
+        'configure', 'run', 'start'
+    ])))
+    
+    # اكتشاف مدير الحزم بناءً على السياق
+    _MANAGER_KEYWORDS = {
+        # Node.js / JavaScript
+        'npm': [
+            'npm', 'node', 'nodejs', 'node.js',
+            'نود', 'نودجيس', 'نودجي اس', 'نود جي اس'
+        ],
+        'windowsterminal': [
+            'windowsterminal', 'windowsterminal', 'windowsterminal', 'windowsterminal',
+            'wt', 'windowsterminal', 'windowsterminal', 'windowsterminal'
+        ],
+        'yarn': [
+            'yarn', 'يارن'
+        ],
+        'pnpm': [
+            'pnpm', 'بي ان بي ام'
+        ],
+
+        # Python
+        'pip': [
+            'pip', 'pip3', 'python', 'python3',
+            'بايثون', 'بايب', 'بايب3'
+        ],
+        'conda': [
+            'conda', 'anaconda', 'miniconda',
+            'كوندا', 'اناكوندا'
+        ],
+        'poetry': [
+            'poetry', 'بوترى', 'بويتري'
+        ],
+
+        # Containers / DevOps
+        'docker': [
+            'docker', 'docker-compose',
+            'دوكر', 'كونتينر', 'حاوية'
+        ],
+        'kubectl': [
+            'kubectl', 'kubernetes', 'k8s',
+            'كيوب', 'كيوبرنيتس'
+        ],
+        'helm': [
+            'helm', 'هيلم'
+        ],
+
+        # Version control
+        'git': [
+            'git', 'github', 'gitlab',
+            'جيت', 'جيتهاب', 'ريبو', 'مستودع'
+        ],
+
+        # Linux package managers
+        'apt': [
+            'apt', 'apt-get', 'ubuntu', 'debian',
+            'أبت', 'يوبنتو', 'ديبيان'
+        ],
+        'dnf': [
+            'dnf', 'fedora', 'redhat',
+            'فيدورا', 'ريد هات'
+        ],
+        'yum': [
+            'yum', 'centos',
+            'يام', 'سينت او اس'
+        ],
+        'pacman': [
+            'pacman', 'arch',
+            'باكمان', 'آرتش'
+        ],
+        'zypper': [
+            'zypper', 'opensuse',
+            'زيبر', 'سوزي'
+        ],
+
+        # macOS
+        'brew': [
+            'brew', 'homebrew', 'macos', 'mac',
+            'برو', 'هوم برو', 'ماك'
+        ],
+        'port': [
+            'macports', 'port',
+            'ماك بورتس'
+        ],
+
+        # Windows
+        'winget': [
+            'winget', 'windows', 'msstore',
+            'ويندوز', 'وينجت'
+        ],
+        'choco': [
+            'choco', 'chocolatey',
+            'شوكولاتي', 'تشوكو'
+        ],
+        'scoop': [
+            'scoop',
+            'سكوب'
+        ],
+
+        # Languages / Build tools
+        'cargo': [
+            'cargo', 'rust',
+            'كارغو', 'راست'
+        ],
+        'go': [
+            'go', 'golang',
+            'جو', 'جولانج'
+        ],
+        'maven': [
+            'maven', 'java',
+            'مافن', 'جافا'
+        ],
+        'gradle': [
+            'gradle',
+            'جرادل'
+        ],
+        'composer': [
+            'composer', 'php',
+            'كومبوزر', 'بي اتش بي'
+        ],
+        'nuget': [
+            'nuget', '.net', 'dotnet',
+            'نيوجيت', 'دوت نت'
+        ]
+    }
+    
+    # قائمة بالحزم الشائعة
+    _COMMON_PACKAGES = {
+        'npm': ['npm', 'node', 'express', 'react', 'vue', 'angular'],
+        'pip': ['pip', 'python', 'django', 'flask', 'tensorflow', 'pandas'],
+        'docker': ['docker', 'docker-ce', 'docker-desktop'],
+        'git': ['git', 'git-bash', 'git-for-windows'],
+        'wt':["wt","windowsterminal"],
+    }
+    
+    # One scan per lookup instead of an `in` test per keyword. Each alternative sits in a
+    # lookahead so every start position is tried, and alternatives are in table order, so the
+    # lowest group index hit is the same first match the nested loops used to find.
+    _MANAGER_NAMES = tuple(_MANAGER_KEYWORDS)
+    _MANAGER_RE = re.compile("(?=(?:" + "|".join(
+        # dict.fromkeys drops repeated keywords (some tables list one several times) but keeps order
+        f"(?P<g{i}>{'|'.join(map(re.escape, dict.fromkeys(keywords)))})"
+        for i, keywords in enumerate(_MANAGER_KEYWORDS.values())
+    ) + "))")
+    _COMMON_PACKAGE_RES = {
+        manager: re.compile("(?=(?:" + "|".join(
+            f"(?P<g{i}>{re.escape(pkg)})" for i, pkg in enumerate(packages)
+        ) + "))")
+        for manager, packages in _COMMON_PACKAGES.items()
+    }
+    
+    # أنماط regex لاستخراج أسماء الحزم
+    _PACKAGE_NAME_PATTERNS = [re.compile(pattern) for pattern in (
+        r'(?:download|install|get|setup)\s+(?:the\s+)?([a-zA-Z0-9@\-\._]+)(?:\s+package|\s+tool|\s+for)?',
+        r'([a-zA-Z0-9@\-\._]+)(?:\s+package|\s+library|\s+tool|\s+software)',
+        r'package\s+([a-zA-Z0-9@\-\._]+)',
+        r'تحميل\s+([^\s]+)',
+        r'نزل\s+([^\s]+)',
+        r'حمّل\s+([^\s]+)',
+        r'install\s+([^\s]+)',
+        r'download\s+([^\s]+)'
+    )]
+    
+    _GLOBAL_WORD_RE = re.compile("|".join(map(re.escape, ['global', 'system', '-g', 'عام', 'على الجهاز', 'للجهاز'])))
+    
     def __init__(self, ai: MultiAIEngine, workspace: WorkspaceManager):
         self.ai = ai
         self.ws = workspace
         self.last_model_used = None
+        # normalized input -> category, LRU order; carried across runs in intent_cache.json
+        self._intent_cache = OrderedDict(
+            (pair[0], pair[1]) for pair in ai.store.load_intent_cache()[-self.INTENT_CACHE_SIZE:]
+            if isinstance(pair, list) and len(pair) == 2 and pair[1] in _INTENTS
+        )
+        self._intent_dirty = False
+        atexit.register(self._save_intent_cache)
+        self._plan_status = ""  # shown next to the thinking animation while a plan streams
+        self._ws_cache = {}  # "sig" -> workspace signature, "data" -> (files, tech_stack, project_analysis)
+        self._ws_generation = 0  # bumped on invalidation so an in-flight scan can't store stale data
+        self._ws_future = None  # background scan started while the intent is being classified
+        self._ws_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="xeda-ws")
+        atexit.register(self._ws_pool.shutdown, wait=False, cancel_futures=True)
         self.thinking_steps = [
             "Analyzing task requirements...",
             "Examining project structure...",
@@ -1598,113 +3092,84 @@ class AgentBrain:
             "Creating detailed plan..."
         ]
 
+    @staticmethod
+    def _local_intent(words):
+        """Category for unambiguous inputs (normalized words), or None to ask the model"""
+        if words in _GREETINGS:
+            return "CHAT"
+        tokens = words.split()
+        # Error wording is DEBUG unless it is a question ("what is an exception") or a change
+        # request ("add error handling"); those are the model's call
+        if (_DEBUG_WORDS_RE.search(words) and _QUESTION_CUES.isdisjoint(tokens)
+                and _CHANGE_CUES.isdisjoint(tokens)):
+            return "DEBUG"
+        # Short imperative commands ("install node", "start redis", "نزل git")
+        if (tokens and len(tokens) <= _RUN_MAX_WORDS and tokens[0] in _RUN_CUES
+                and _RUN_AMBIGUOUS.isdisjoint(tokens[1:])):
+            return "RUN_ONLY"
+        # Imperative project requests; MODIFY/CREATE/DEBUG all start the same agent workflow,
+        # so only questions ("how do I refactor ...") need to be kept away from these rules
+        if tokens and _QUESTION_CUES.isdisjoint(tokens):
+            verb = tokens[0]
+            if verb in _FIX_VERBS:
+                return "DEBUG"
+            if verb in _MODIFY_CUES and not _PROJECT_OBJECTS.isdisjoint(tokens):
+                return "MODIFY_PROJECT"
+            if verb in _CREATE_CUES and not _BUILD_OBJECTS.isdisjoint(tokens):
+                return "CREATE_PROJECT"
+        return None
+    
+    @staticmethod
+    def _rule_intent(words):
+        """Best-effort category from cue words alone, for classifying without a model call"""
+        tokens = set(words.split())
+        for intent, cues, objects in _INTENT_CUES:
+            if not tokens.isdisjoint(cues) and (objects is None or not tokens.isdisjoint(objects)):
+                return intent
+        return "CHAT"
+
     def deep_router(self, prompt):
         if len(prompt.strip()) < 3: return "CHAT"
         
-        sys_prompt = f"""
-                    You are a STRICT Intent Classifier for a developer assistant.
-
-                    Your task:
-                    Classify the user's input into EXACTLY ONE category based on INTENT, not wording.
-
-                    CATEGORIES:
-
-                    1. CHAT
-                    - Casual conversation, greetings, opinions, or non-technical talk.
-                    - No request to explain, build, fix, or run anything.
-                    - Examples:
-                    "hello"
-                    "thanks"
-                    "احسن لغة ايه؟"
-
-                    2. QUESTION
-                    - Asking for explanations, concepts, comparisons, or how something works.
-                    - NO request to execute, install, modify, or create anything.
-                    - Examples:
-                    "what is JWT?"
-                    "explain REST vs GraphQL"
-                    "npm بيشتغل ازاي؟"
-
-                    3. MODIFY_PROJECT
-                    - Requests to CHANGE or UPDATE an EXISTING project or codebase.
-                    - Mentions current files, code, structure, or features to modify.
-                    - Examples:
-                    "add auth to my app"
-                    "update package.json"
-                    "refactor this function"
-
-                    4. CREATE_PROJECT
-                    - Requests to CREATE something NEW from scratch.
-                    - Includes scaffolding, boilerplate, initialization, or full setup.
-                    - Examples:
-                    "create a Next.js app"
-                    "start a FastAPI project"
-                    "generate a CLI tool"
-
-                    5. DEBUG
-                    - Fixing errors, crashes, failed commands, or unexpected behavior.
-                    - Includes error messages, logs, stack traces, or words like:
-                    error, failed, not working, crash.
-                    - Examples:
-                    "npm install failed"
-                    "this command gives error"
-                    "fix this bug"
-
-                    6. RUN_ONLY
-                    - Requests whose PRIMARY intent is to EXECUTE, INSTALL, DOWNLOAD, START, STOP, or RUN something.
-                    - Even if written in natural language, slang, or Arabic.
-                    - NO explanation requested.
-                    - NO code modification or project creation.
-                    - The expected response is a SHELL COMMAND ONLY.
-
-                    Examples that MUST be classified as RUN_ONLY:
-                    
-                    - "install node"
-                    - "حملي npm"
-                    - "نزل git"
-                    - "عاوز انزل docker"
-                    - "شغل السيرفر"
-                    - "run tests"
-                    - "start redis"
-                    - "وقف الكونتينر"
-                    - "update node version"
-                    - "ثبت الباكج بتاع fastapi"
-
-                    IMPORTANT DISTINCTION:
-                    - If the user wants an explanation → QUESTION
-                    - If the user wants execution or installation → RUN_ONLY
-                    - If the user wants to fix a failure → DEBUG
-                    - If the user wants to build something new → CREATE_PROJECT
-                    - If the user wants to change existing code → MODIFY_PROJECT
-
-                    PRIORITY RULES (STRICT ORDER):
-                    1. If input contains an ERROR, FAILURE, or crash → DEBUG
-                    2. If input requests changing existing code/files → MODIFY_PROJECT
-                    3. If input requests creating a new project → CREATE_PROJECT
-                    4. If input requests installing, downloading, running, starting, stopping anything → RUN_ONLY
-                    5. If input is informational only → QUESTION
-                    6. Otherwise → CHAT
-
-                    OUTPUT RULES:
-                    - Output ONLY ONE category name.
-                    - NO explanations.
-                    - NO punctuation.
-                    - NO extra text.
-                    - Output must be EXACTLY one of:
-                        CHAT
-                        QUESTION
-                        MODIFY_PROJECT
-                        CREATE_PROJECT
-                        DEBUG
-                        RUN_ONLY
-                    
-                    User Input:
-                    "{prompt}"
-                    """
+        # Same words in any case/spacing/punctuation ("Install node!" / "install  node") reuse the label
+        key = " ".join(_WORD_RE.findall(_DIACRITICS_RE.sub("", prompt.casefold())))
+        intent = self._intent_cache.get(key)
+        if intent is not None:
+            self._intent_cache.move_to_end(key)
+            return intent
+        
+        intent = self._local_intent(key)
+        if intent is not None:
+            return intent
+        if self.ai.store.config.get("intent_backend", "llm") == "local":
+            return self._rule_intent(key)
+        
+        # Likely plan requests scan the workspace during the round-trip; greetings and questions
+        # end in a chat answer, so they don't pay for a full recursive scan
+        tokens = key.split()
+        if tokens and tokens[0] not in _GREETINGS and _QUESTION_CUES.isdisjoint(tokens):
+            self.prefetch_workspace()
+        sys_prompt = f'{_ROUTER_PROMPT}"{prompt}"\n'
 
         result, model_name = self.ai.generate_content(sys_prompt)
         self.last_model_used = model_name
-        return result.strip().upper() if result else "CHAT"
+        intent = result.strip().upper() if result else "CHAT"
+        if intent in _INTENTS:
+            self._intent_cache[key] = intent
+            self._intent_dirty = True
+            if len(self._intent_cache) > self.INTENT_CACHE_SIZE:
+                self._intent_cache.popitem(last=False)
+        return intent
+
+    def _save_intent_cache(self):
+        if self._intent_dirty:
+            self._intent_dirty = False
+            self.ai.store.save_intent_cache(list(self._intent_cache.items()))
+
+    def clear_intent_cache(self):
+        """Forget learned labels (e.g. after switching engine)"""
+        self._intent_cache.clear()
+        self._intent_dirty = True
 
     def detect_intent(self, prompt):
         intent = self.deep_router(prompt)
@@ -1712,17 +3177,81 @@ class AgentBrain:
             return "AGENT"
         return "CHAT"
 
+    def _animate_thinking(self, stop_event):
+        """Cycle the thinking steps on the progress line until stop_event is set"""
+        # Ticks are scheduled from a fixed monotonic origin, so drawing time doesn't accumulate as drift
+        start = time.monotonic()
+        for tick, step in enumerate(itertools.cycle(self.thinking_steps), 1):
+            UI.update_progress(f"{step}  {self._plan_status}" if self._plan_status else step)
+            if stop_event.wait(max(0.0, start + tick * self.THINKING_INTERVAL - time.monotonic())):
+                return
+
+    @staticmethod
+    def _ws_signature():
+        """Cheap change marker: cwd plus the newest mtime among it and its visible top-level entries"""
+        cwd = os.getcwd()
+        newest = os.stat(cwd).st_mtime_ns
+        with os.scandir(cwd) as it:
+            for entry in it:
+                if entry.name[0] != '.':
+                    newest = max(newest, entry.stat(follow_symlinks=False).st_mtime_ns)
+        return cwd, newest
+
+    def _workspace_snapshot(self):
+        """(files, tech_stack, project_analysis) for planning, rescanned only when the workspace changed"""
+        try:
+            sig = self._ws_signature()
+        except OSError:
+            sig = None
+        if sig is not None and self._ws_cache.get("sig") == sig:
+            return self._ws_cache["data"]
+        
+        generation = self._ws_generation
+        # The three workspace scans are independent filesystem walks
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            files_future = pool.submit(self.ws.list_files, recursive=True, limit=30)
+            stack_future = pool.submit(self.ws.detect_tech_stack)
+            analysis_future = pool.submit(self.ws.analyze_project)
+        data = (files_future.result(), stack_future.result(), analysis_future.result())
+        if generation == self._ws_generation:
+            self._ws_cache = {"sig": sig, "data": data}
+        return data
+
+    def prefetch_workspace(self):
+        """Start the planning scan in the background so it overlaps a model round-trip"""
+        if self._ws_future is None or self._ws_future.done():
+            self._ws_future = self._ws_pool.submit(self._workspace_snapshot)
+
+    def invalidate_workspace_cache(self):
+        """Force the next plan to rescan; changes deep in subdirectories don't move the signature"""
+        self._ws_generation += 1
+        self._ws_cache = {}
+
     def create_plan(self, task_description):
         """Enhanced planning with deep analysis"""
+        # The animation runs alongside the workspace scan and the model call instead of before them
+        stop_event = threading.Event()
+        self._plan_status = ""
+        animator = None
         if not UI.GHOST_MODE:
-            for step in self.thinking_steps:
-                UI.update_progress(step)
-                time.sleep(0.3)
-        
-        files = self.ws.list_files(recursive=True, limit=30)
+            animator = threading.Thread(target=self._animate_thinking, args=(stop_event,), daemon=True)
+            animator.start()
+        try:
+            return self._create_plan(task_description)
+        finally:
+            stop_event.set()
+            if animator is not None:
+                animator.join(timeout=0.5)
+
+    def _create_plan(self, task_description):
+        future = self._ws_future
+        if future is not None:
+            # Let a prefetch that is still scanning finish and fill the cache instead of scanning twice
+            wait([future])
+        files, tech_stack, project_analysis = self._workspace_snapshot()
         files_str = "\n".join(files[:15]) if files else "(Empty Directory)"
-        tech_stack = self.ws.detect_tech_stack()
-        project_analysis = self.ws.analyze_project()
+        # The five most common extensions, picked without building or sorting the full list
+        top_types = heapq.nlargest(5, project_analysis['file_types'].items(), key=operator.itemgetter(1))
         
         prompt = f"""
         Role: Senior DevOps & Software Architect.
@@ -1734,70 +3263,34 @@ class AgentBrain:
         - Total Files: {project_analysis['total_files']}
         - Entry Points: {project_analysis['entry_points']}
         - Config Files: {project_analysis['config_files']}
-        - File Types: {', '.join([f'{k}: {v}' for k, v in project_analysis['file_types'].items()][:5])}
+        - File Types: {', '.join(f'{k}: {v}' for k, v in top_types)}
         
         CURRENT WORKSPACE FILES (Top 15):
         {files_str}
+        """ + _PLAN_PROMPT_TAIL
         
-        Goal: Create a detailed Step-by-Step execution plan with DEEP ANALYSIS.
-        
-        Requirements:
-        1. Assign a Confidence Score (0-100) with justification.
-        2. Analyze the risk (Low, Medium, High) with explanation.
-        3. Provide DEEP TECHNICAL ANALYSIS of the approach.
-        4. List any DEPENDENCIES required.
-        5. Offer a 'suggestion' (AI-as-a-Teammate) for architecture improvements.
-        6. Provide steps with actions: CREATE, MODIFY, DELETE, COMMAND, ANALYZE.
-        7. For each step, include REASONING explaining why it's necessary.
-        
-        Constraint: Return ONLY a valid JSON object.
-        
-        JSON Format Example:
-        {{
-            "confidence": 92,
-            "confidence_reason": "Task is straightforward and matches existing patterns in the project",
-            "risk": "Low",
-            "risk_reason": "Only modifies configuration files, no core logic changes",
-            "analysis": "This task requires adding a new endpoint to the existing API. The project uses Flask framework and follows MVC pattern. Need to create model, view, and controller components.",
-            "dependencies": ["flask", "sqlalchemy"],
-            "suggestion": "Consider adding input validation and error handling to the new endpoint.",
-            "steps": [
-                {{
-                    "action": "analyze",
-                    "target": "app.py",
-                    "description": "Review main application structure",
-                    "reasoning": "Need to understand the current Flask app structure before adding new endpoints"
-                }},
-                {{
-                    "action": "create",
-                    "path": "models/new_model.py",
-                    "description": "Create new database model",
-                    "reasoning": "Required for the new feature's data structure"
-                }},
-                {{
-                    "action": "modify",
-                    "path": "app.py",
-                    "description": "Add new route endpoint",
-                    "reasoning": "Main application file needs the new route definition"
-                }},
-                {{
-                    "action": "command",
-                    "command": "pip install flask sqlalchemy",
-                    "description": "Install required dependencies",
-                    "reasoning": "These packages are needed for the new functionality"
-                }}
-            ]
-        }}
-        """
+        # Confidence and risk arrive near the top of the answer; surface them as soon as they stream in
+        fields = {}
+        tail = ""
         
-        response, model_name = self.ai.generate_content(prompt)
+        def on_token(piece):
+            nonlocal tail
+            if len(fields) == 2:
+                return
+            tail = (tail + piece)[-128:]
+            for match in _PLAN_FIELD_RE.finditer(tail):
+                fields.setdefault(match.group(1), match.group(2) or match.group(3))
+            if fields:
+                self._plan_status = " | ".join(f"{name.title()}: {value}" for name, value in fields.items())
+        
+        response, model_name = self.ai.generate_content_stream(prompt, on_token)
         self.last_model_used = model_name
         
         if not response: return None, None
         
-        clean_json = response.replace('```json', '').replace('```', '').strip()
+        clean_json = _JSON_FENCE_RE.sub('', response).strip()
         try:
-            plan_data = json.loads(clean_json)
+            plan_data = _json_loads(clean_json)
             if 'steps' not in plan_data: return None, None
             
             if 'analysis' not in plan_data:
@@ -1813,6 +3306,12 @@ class AgentBrain:
         except json.JSONDecodeError as e:
             self.ai.store.log_error(f"Failed to parse AI plan: {e}", clean_json[:200], silent=True)
             return None, None
+    @staticmethod
+    def _first_hit(pattern, text):
+        """Lowest group index of a lookahead keyword table found anywhere in text, or None"""
+        hits = [int(match.lastgroup[1:]) for match in pattern.finditer(text)]
+        return min(hits) if hits else None
+
     def detect_installation_request(self, prompt: str) -> tuple:
         """
         اكتشاف طلبات التثبيت/التحميل من وصف المستخدم
@@ -1820,201 +3319,34 @@ class AgentBrain:
         """
         prompt_lower = prompt.lower()
         
-        # أنماط للكلمات الدالة (باللغتين العربية والإنجليزية)
-        install_patterns = [
-            'download', 'install', 'get', 'setup', 'fetch', 'pull',
-            'تحميل', 'نزّل', 'نزل', 'حمّل', 'حملي', 'ثبّت', 'شغّل', 
-            'شغلي', 'عاوز', 'أريد', 'ابغى', 'نبي', 'محتاج', 'احتاج',
-            'setup', 'configure', 'configure', 'run', 'start'
-        ]
-        
         # تحقق إذا كان الطلب عن تثبيت
-        is_install_request = any(pattern in prompt_lower for pattern in install_patterns)
-        
-        if not is_install_request:
+        if not self._INSTALL_WORD_RE.search(prompt_lower):
             return None, None, False
         
-        # اكتشاف نظام التشغيل المذكور
-        os_keywords = {
-            'windows': ['windows', 'win', 'ويندوز', 'ويندو'],
-            'linux': ['linux', 'ubuntu', 'debian', 'لينكس', 'يوبنتو'],
-            'mac': ['mac', 'macos', 'apple', 'ماك', 'مَاك']
-        }
-        
-        # اكتشاف مدير الحزم بناءً على السياق
-        managers = {
-                # Node.js / JavaScript
-                'npm': [
-                    'npm', 'node', 'nodejs', 'node.js',
-                    'نود', 'نودجيس', 'نودجي اس', 'نود جي اس'
-                ],
-                'windowsterminal': [
-                    'windowsterminal', 'windowsterminal', 'windowsterminal', 'windowsterminal',
-                    'wt', 'windowsterminal', 'windowsterminal', 'windowsterminal'
-                ],
-                'yarn': [
-                    'yarn', 'يارن'
-                ],
-                'pnpm': [
-                    'pnpm', 'بي ان بي ام'
-                ],
-
-                # Python
-                'pip': [
-                    'pip', 'pip3', 'python', 'python3',
-                    'بايثون', 'بايب', 'بايب3'
-                ],
-                'conda': [
-                    'conda', 'anaconda', 'miniconda',
-                    'كوندا', 'اناكوندا'
-                ],
-                'poetry': [
-                    'poetry', 'بوترى', 'بويتري'
-                ],
-
-                # Containers / DevOps
-                'docker': [
-                    'docker', 'docker-compose',
-                    'دوكر', 'كونتينر', 'حاوية'
-                ],
-                'kubectl': [
-                    'kubectl', 'kubernetes', 'k8s',
-                    'كيوب', 'كيوبرنيتس'
-                ],
-                'helm': [
-                    'helm', 'هيلم'
-                ],
-
-                # Version control
-                'git': [
-                    'git', 'github', 'gitlab',
-                    'جيت', 'جيتهاب', 'ريبو', 'مستودع'
-                ],
-
-                # Linux package managers
-                'apt': [
-                    'apt', 'apt-get', 'ubuntu', 'debian',
-                    'أبت', 'يوبنتو', 'ديبيان'
-                ],
-                'dnf': [
-                    'dnf', 'fedora', 'redhat',
-                    'فيدورا', 'ريد هات'
-                ],
-                'yum': [
-                    'yum', 'centos',
-                    'يام', 'سينت او اس'
-                ],
-                'pacman': [
-                    'pacman', 'arch',
-                    'باكمان', 'آرتش'
-                ],
-                'zypper': [
-                    'zypper', 'opensuse',
-                    'زيبر', 'سوزي'
-                ],
-
-                # macOS
-                'brew': [
-                    'brew', 'homebrew', 'macos', 'mac',
-                    'برو', 'هوم برو', 'ماك'
-                ],
-                'port': [
-                    'macports', 'port',
-                    'ماك بورتس'
-                ],
-
-                # Windows
-                'winget': [
-                    'winget', 'windows', 'msstore',
-                    'ويندوز', 'وينجت'
-                ],
-                'choco': [
-                    'choco', 'chocolatey',
-                    'شوكولاتي', 'تشوكو'
-                ],
-                'scoop': [
-                    'scoop',
-                    'سكوب'
-                ],
-
-                # Languages / Build tools
-                'cargo': [
-                    'cargo', 'rust',
-                    'كارغو', 'راست'
-                ],
-                'go': [
-                    'go', 'golang',
-                    'جو', 'جولانج'
-                ],
-                'maven': [
-                    'maven', 'java',
-                    'مافن', 'جافا'
-                ],
-                'gradle': [
-                    'gradle',
-                    'جرادل'
-                ],
-                'composer': [
-                    'composer', 'php',
-                    'كومبوزر', 'بي اتش بي'
-                ],
-                'nuget': [
-                    'nuget', '.net', 'dotnet',
-                    'نيوجيت', 'دوت نت'
-                ]
-            }
-
-        
         # اكتشاف الحزمة
         package_name = None
         detected_manager = None
         
         # أولاً: اكتشاف مدير الحزم المذكور
-        for manager, keywords in managers.items():
-            for keyword in keywords:
-                if keyword in prompt_lower:
-                    detected_manager = manager
-                    break
-            if detected_manager:
-                break
+        index = self._first_hit(self._MANAGER_RE, prompt_lower)
+        if index is not None:
+            detected_manager = self._MANAGER_NAMES[index]
         
         # ثانياً: اكتشاف الحزمة
-        # قائمة بالحزم الشائعة
-        common_packages = {
-            'npm': ['npm', 'node', 'express', 'react', 'vue', 'angular'],
-            'pip': ['pip', 'python', 'django', 'flask', 'tensorflow', 'pandas'],
-            'docker': ['docker', 'docker-ce', 'docker-desktop'],
-            'git': ['git', 'git-bash', 'git-for-windows'],
-            'wt':["wt","windowsterminal"],
-        }
-        
         # بحث عن حزم معروفة
-        if detected_manager and detected_manager in common_packages:
-            for pkg in common_packages[detected_manager]:
-                if pkg in prompt_lower:
-                    package_name = pkg
-                    break
+        if detected_manager and detected_manager in self._COMMON_PACKAGES:
+            index = self._first_hit(self._COMMON_PACKAGE_RES[detected_manager], prompt_lower)
+            if index is not None:
+                package_name = self._COMMON_PACKAGES[detected_manager][index]
         
         # إذا لم نجد حزمة معروفة، حاول استخراج الاسم
         if not package_name:
-            # أنماط regex لاستخراج أسماء الحزم
-            patterns = [
-                r'(?:download|install|get|setup)\s+(?:the\s+)?([a-zA-Z0-9@\-\._]+)(?:\s+package|\s+tool|\s+for)?',
-                r'([a-zA-Z0-9@\-\._]+)(?:\s+package|\s+library|\s+tool|\s+software)',
-                r'package\s+([a-zA-Z0-9@\-\._]+)',
-                r'تحميل\s+([^\s]+)',
-                r'نزل\s+([^\s]+)',
-                r'حمّل\s+([^\s]+)',
-                r'install\s+([^\s]+)',
-                r'download\s+([^\s]+)'
-            ]
-            
-            for pattern in patterns:
-                match = re.search(pattern, prompt_lower)
+            for pattern in self._PACKAGE_NAME_PATTERNS:
+                match = pattern.search(prompt_lower)
                 if match:
                     potential_package = match.group(1)
                     # تأكد أن هذا ليس مدير حزم
-                    if potential_package not in managers.keys() and len(potential_package) > 1:
+                    if potential_package not in self._MANAGER_KEYWORDS and len(potential_package) > 1:
                         package_name = potential_package
                         break
             
@@ -2025,43 +3357,345 @@ class AgentBrain:
                     package_name = detected_manager
         
         # تحديد إذا كان تثبيت عام
-        is_global = any(word in prompt_lower for word in ['global', 'system', '-g', 'عام', 'على الجهاز', 'للجهاز'])
+        is_global = self._GLOBAL_WORD_RE.search(prompt_lower) is not None
         
         return package_name, detected_manager, is_global
-    def execute_code_generation(self, path, instruction, is_modification=False):
-        """Enhanced code generation with context"""
-        existing_code = self.ws.read_file(path)
-        context = f"Existing File Content ({len(existing_code.splitlines())} lines):\n{existing_code}\n\n" if is_modification else "New File Creation.\n"
+    @staticmethod
+    def _code_generation_prompt(path, instruction, existing_code, is_modification):
+        """Expert-coder prompt for one file"""
+        context = f"Existing File Content ({_count_lines(existing_code)} lines):\n{existing_code}\n\n" if is_modification else "New File Creation.\n"
 
-        prompt = f"""
+        return f"""
         Role: Expert Coder.
         File: {path}
         Instruction: {instruction}
         
         {context}
-        
-        Requirements:
-        1. Generate COMPLETE, WORKING code.
-        2. Follow best practices and coding standards.
-        3. Add comments for complex logic.
-        4. Handle edge cases appropriately.
-        5. Ensure code is well-structured and maintainable.
-        
-        Output: ONLY the complete code content. No markdown blocks, no explanations.
-        """
+        """ + _CODEGEN_PROMPT_TAIL
+    
+    @staticmethod
+    def _strip_code_fences(code):
+        """Remove markdown fences the model adds despite being asked not to"""
+        if not code or '```' not in code:
+            return code.strip() if code else code
+        return _CODE_FENCE_RE.sub('', code).strip()
+    
+    def execute_code_generation(self, path, instruction, is_modification=False):
+        """Enhanced code generation with context"""
+        existing_code = self.ws.read_file(path) if is_modification else ""
+        prompt = self._code_generation_prompt(path, instruction, existing_code, is_modification)
         
         code, model_name = self.ai.generate_content(prompt)
         self.last_model_used = model_name
         
-        if code:
-            code = code.replace('```python', '').replace('```sh', '').replace('```', '').strip()
-        return code, model_name
+        return self._strip_code_fences(code), model_name
+    
+    def execute_code_generation_batch(self, specs, max_concurrency=None):
+        """Generate several files at once; specs are (path, instruction, is_modification) tuples"""
+        if not specs:
+            return []
+        # قراءة الملفات المراد تعديلها فقط، وبالتوازي
+        with ThreadPoolExecutor(max_workers=min(8, len(specs))) as pool:
+            existing = list(pool.map(lambda spec: self.ws.read_file(spec[0]) if spec[2] else "", specs))
+        
+        prompts = [
+            self._code_generation_prompt(path, instruction, code, is_mod)
+            for (path, instruction, is_mod), code in zip(specs, existing)
+        ]
+        # A prompt repeated within the batch (same path, instruction and context) is sent once
+        slots = {}
+        for prompt in prompts:
+            slots.setdefault(prompt, len(slots))
+        unique_results = self.ai.batch_generate_content(list(slots), max_concurrency)
+        results = [unique_results[slots[prompt]] for prompt in prompts]
+        if results and results[-1][1]:
+            self.last_model_used = results[-1][1]
+        return [(self._strip_code_fences(code), model_name) for code, model_name in results]
 
 # ==============================================================================
 # 6. MAIN APPLICATION WITH AUTO-INSTALLATION
 # ==============================================================================
 
+# Name of the missing dependency in common shell/runtime errors (matched against lowercased stderr)
+_MISSING_DEP_RES = tuple(re.compile(pattern) for pattern in (
+    r"command not found: ([\w.+-]+)",
+    r"([\w.+-]+): (?:command )?not found",
+    r"'([\w.+-]+)' is not recognized",
+    r"no module named '?([\w.]+)",
+    r"([\w.+-]+\.so[\w.]*): cannot open shared object file",
+    r"library not found for -l([\w.+-]+)",
+))
+
+# Everything but the three slots is fixed text, formatted in once per failed command
+_AI_INSTALL_PROMPT = """
+A command has FAILED due to a missing dependency or executable.
+
+FAILED COMMAND:
+{failed_cmd}
+
+ERROR OUTPUT (truncated):
+{error_output}
+
+OPERATING SYSTEM:
+{os_info}
+
+Your task:
+Identify the ROOT missing dependency (tool, runtime, library, compiler, or package manager)
+and generate the EXACT shell command needed to install it.
+
+Important:
+- The missing dependency may be:
+• a CLI tool (e.g. git, curl, ffmpeg, docker)
+• a language runtime (python, node, java, go, ruby, php, dotnet)
+• a compiler or build tool (gcc, make, cmake, clang)
+• a system library (openssl, zlib, libssl, libc++)
+• a package manager itself (npm, pip, yarn, pnpm, poetry)
+• a cloud / dev tool (aws, gcloud, az, kubectl)
+- The name may NOT be explicitly mentioned.
+- You must infer it from the error message.
+
+Rules (STRICT):
+1. Output ONLY ONE valid shell command — no explanations.
+2. The command MUST work on the OS specified.
+3. Use the most STANDARD package manager for that OS:
+- Ubuntu/Debian → apt
+- Fedora/RHEL → dnf
+- Arch → pacman
+- macOS → brew
+- Windows → winget (preferred), choco if needed
+4. Include required privileges (sudo, admin).
+5. Install the MAIN dependency, not plugins or versions.
+6. Do NOT install unrelated tools.
+7. If the dependency is already part of a meta-package, install the meta-package.
+8. If installation requires multiple chained commands, return them as ONE line joined with &&.
+9. If the dependency cannot be installed automatically, install the closest official package.
+
+Common inference patterns:
+- "command not found" → missing executable
+- "No module named X" → missing language package manager or runtime
+- "cannot open shared object file" → missing system library
+- "gcc: command not found" → missing build-essential / gcc
+- "npm: not found" → Node.js runtime missing
+- "pip: command not found" → python-pip missing
+- "ld: library not found" → missing system dev library
+- "make: not found" → missing build tools
+
+Examples:
+- Ubuntu error: "gcc: command not found"
+→ sudo apt update && sudo apt install build-essential
+
+- macOS error: "zsh: command not found: ffmpeg"
+→ brew install ffmpeg
+
+- Windows error: "'python' is not recognized"
+→ winget install Python.Python.3
+
+- Ubuntu error: "No module named pip"
+→ sudo apt install python3-pip
+
+- Fedora error: "git: command not found"
+→ sudo dnf install git
+
+Output format:
+<INSTALL COMMAND ONLY>
+"""
+
+# Install-request prompt; only the three slots change per request (braces in the JSON are doubled)
+_INSTALL_REQUEST_PROMPT = """
+You are an expert system administrator and package manager expert.
+
+USER REQUEST: "{user_request}"
+
+SYSTEM INFORMATION:
+- OS: {system}
+- Available package managers: {managers}
+
+TASK:
+Based on the user's request, generate the CORRECT installation command.
+
+IMPORTANT RULES:
+1. Generate ONE single command that can be executed directly in the terminal.
+2. The command MUST work on the current OS ({system}).
+3. Choose the MOST APPROPRIATE package manager for the task.
+4. Include all necessary flags (like -y for apt, --accept-package-agreements for winget).
+5. If multiple commands are needed, chain them with &&.
+6. For Windows: Prefer winget if available, then chocolatey, then manual download.
+7. For Linux: Prefer apt for Debian/Ubuntu, yum/dnf for Fedora/RHEL, pacman for Arch.
+8. For macOS: Use brew.
+9. If the package name is ambiguous, choose the most popular/mainstream one.
+
+OUTPUT FORMAT:
+Return a JSON object with this exact structure:
+{{
+    "package": "name_of_package",
+    "manager": "package_manager_used",
+    "command": "full_shell_command_to_execute",
+    "explanation": "brief_explanation_in_english",
+    "risk_level": "low/medium/high",
+    "notes": "any_important_notes"
+}}
+
+EXAMPLES:
+
+Example 1 (Windows):
+Request: "download rust for windows"
+Available: winget
+Response: {{
+    "package": "Rust.Rustup",
+    "manager": "winget",
+    "command": "winget install --id Rust.Rustup --accept-package-agreements",
+    "explanation": "Installs Rust programming language via Rustup (recommended installer)",
+    "risk_level": "low",
+    "notes": "Rustup will install both rustc and cargo"
+}}
+
+Example 2 (Linux - Ubuntu):
+Request: "install python on ubuntu"
+Available: apt
+Response: {{
+    "package": "python3",
+    "manager": "apt",
+    "command": "sudo apt update && sudo apt install python3 -y",
+    "explanation": "Installs Python 3 from Ubuntu repositories",
+    "risk_level": "low",
+    "notes": "Python 3 is pre-installed on most Ubuntu versions"
+}}
+
+Example 3 (macOS):
+Request: "install docker on mac"
+Available: brew
+Response: {{
+    "package": "docker",
+    "manager": "brew",
+    "command": "brew install --cask docker",
+    "explanation": "Installs Docker Desktop for macOS",
+    "risk_level": "medium",
+    "notes": "Docker Desktop requires manual setup after installation"
+}}
+
+Example 4 (Arabic):
+Request: "حملي npm"
+Available: winget
+Response: {{
+    "package": "OpenJS.NodeJS",
+    "manager": "winget",
+    "command": "winget install OpenJS.NodeJS",
+    "explanation": "Installs Node.js which includes npm",
+    "risk_level": "low",
+    "notes": "Node.js installer includes npm by default"
+}}
+
+Now, generate the command for the user's request.
+"""
+
 class TerminalApp:
+    INSTALL_CMD_CACHE_SIZE = 128
+    STDERR_TAIL = 8192  # characters of a failed command's stderr kept for AI analysis
+    INSTALL_OUTPUT_TAIL = 200  # lines of install output kept for the result/error report
+    
+    # Characters that need a real shell (pipes, chaining, redirects, expansion, cmd.exe escapes)
+    _SHELL_CHARS = frozenset('&|<>;$`*?~(){}[]!%^\n')
+    
+    # Line starts that mark a shell command in a non-JSON install answer (plain prefixes, as before)
+    _COMMAND_PREFIXES = ('winget', 'sudo', 'apt', 'brew', 'npm', 'pip', 'choco')
+    
+    # Post-install hints, keyed by a substring of the installed package name
+    _NEXT_STEPS = {
+        'rust': (
+            "Run 'rustc --version' to verify installation",
+            "Run 'cargo --version' to check Cargo package manager",
+            "Create a test project: 'cargo new hello_world'"
+        ),
+        'node': (
+            "Run 'node --version' to check Node.js",
+            "Run 'npm --version' to check npm",
+            "Create a test file: 'console.log(\"Hello Node\")'"
+        ),
+        'python': (
+            "Run 'python --version' or 'python3 --version'",
+            "Run 'pip --version' to check pip",
+            "Try: 'python -c \"print('Hello Python')\"'"
+        ),
+        'docker': (
+            "Run 'docker --version' to verify",
+            "Try: 'docker run hello-world'",
+            "Check if Docker service is running"
+        ),
+        'git': (
+            "Run 'git --version'",
+            "Configure git: 'git config --global user.name \"Your Name\"'",
+            "Try: 'git init' in a test directory"
+        )
+    }
+    
+    # Built once when the class is created; do_help just writes it
+    _HELP_TEXT = f"""
+        {Color.CYAN}XEDA v9.3 - Enhanced Commands:{Color.RESET}
+
+        {Color.GREEN}Core Features:{Color.RESET}
+          • Auto-package installation 📦
+          • Post-execution summary 📊
+          • Silent error handling 🔇
+          • Deep thinking workflow 🤔
+
+        {Color.YELLOW}Commands:{Color.RESET}
+          <task>              : Auto-route to agent or chat
+          summary             : Show last execution summary
+          engines             : List AI engines
+          engine <name>       : Switch engine
+          auto                : Toggle auto-execution
+          ghost [on/off]      : Toggle ghost mode
+          silent              : Toggle error visibility
+          replay              : Re-execute last plan
+          refreshpm           : Re-detect package managers
+        {Color.YELLOW}Chat Commands:{Color.RESET}
+            chats              : List all chat sessions
+            chat <ID/num>      : Switch to specific chat
+            newchat [title]    : Start new chat session
+            currentchat        : Show current chat info
+            renamechat <title> : Rename current chat
+            deletechat <ID>    : Delete a chat session
+            exportchat [format]: Export chat (json/txt)
+            clearchat          : Clear current chat messages
+
+        {Color.BLUE}System:{Color.RESET}
+          cd [path]           : Change directory
+          clear/cls           : Clear screen
+          help                : This message
+          exit/quit           : Exit
+
+        {Color.MAGENTA}Status Icons:{Color.RESET}
+          ✅ Success    ❌ Failure    ⚠️  Warning
+          🔄 Retrying  🛠️  Fixing    📦 Installing
+          ⏭️  Skipped   ⏸️  Paused    ✨ Excellent
+        
+"""
+    
+    # Prompt tag color per engine; anything else is white
+    _ENGINE_COLORS = {"GEMINI": Color.GREEN, "DEEPSEEK": Color.CYAN, "GROQ": Color.YELLOW}
+    # Install-plan risk level color; unknown levels are white
+    _RISK_COLORS = {'low': Color.GREEN, 'medium': Color.YELLOW, 'high': Color.RED}
+    # Success-rate color by tens digit: under 70% red, 70-89% yellow, 90% and up green
+    _RATE_COLORS = (Color.RED,) * 7 + (Color.YELLOW,) * 2 + (Color.GREEN,)
+    
+    # Substring matches, as before; one compiled scan each instead of a Python loop per word
+    _INSTALL_HINT_RE = re.compile("|".join(map(re.escape, [
+        'download', 'install', 'get', 'setup',
+        'تحميل', 'نزّل', 'نزل', 'حمّل', 'حملي', 'ثبّت',
+        'شغّل', 'شغلي', 'عاوز', 'أريد', 'نبي'
+    ])), re.IGNORECASE)
+    # stderr wording that points at a missing package/executable; one case-insensitive scan, no lower() copy
+    _PACKAGE_ERROR_RE = re.compile("|".join(map(re.escape, [
+        'command not found', 'not found', 'module not found',
+        'could not find', 'npm: not found', 'node: not found',
+        'pip: not found', 'python: not found'
+    ])), re.IGNORECASE)
+    # قائمة بكلمات تشير إلى أدوات/حزم (يمكن توسيعها)
+    _TOOL_HINT_RE = re.compile("|".join(map(re.escape, [
+        'npm', 'node', 'python', 'rust', 'docker', 'git',
+        'package', 'tool', 'software', 'برنامج', 'أداة'
+    ])), re.IGNORECASE)
+    
     def __init__(self):
 
         self.persistence = PersistenceLayer()
@@ -2071,7 +3705,9 @@ class TerminalApp:
         self.auto_mode = False
         self.package_manager = PackageManager()
         self.chat_manager = ChatManager(self.persistence)
-        self.internal_commands = {
+        # (os, missing dependency, command) -> install command, or None when the AI said UNKNOWN_PACKAGE
+        self._install_cmd_cache = OrderedDict()
+        self.internal_commands: Dict[str, Callable[[str], None]] = {
             'exit': self.do_exit, 'quit': self.do_exit, 'clear': self.do_clear,
             'cls': self.do_clear, 'help': self.do_help, 'workspace': self.do_workspace,
             'history': self.do_history, 'model': self.do_change_model, 
@@ -2081,6 +3717,7 @@ class TerminalApp:
             'fallback': self.do_toggle_fallback, 'check_balance': self.do_check_balance,
             'groq_models': self.do_list_groq_models, 'silent': self.do_toggle_silent,
             'summary': self.do_show_summary,
+            'refreshpm': self.do_refresh_managers,
             'chats': self.do_list_chats,
             'chat': self.do_switch_chat,
             'newchat': self.do_new_chat,
@@ -2093,16 +3730,21 @@ class TerminalApp:
             'clearchat': self.do_clear_chat,
         }
 
-        self.fixed_terminal_commands = {
+        self.fixed_terminal_commands: FrozenSet[str] = frozenset({
             'ls', 'dir', 'mkdir', 'rm', 'del', 'cp', 'mv', 
             'git', 'python', 'python3', 'pip', 'npm', 'node', 
             'docker', 'grep', 'cat', 'type', 'echo', 'ping', 
             'curl', 'wget', 'ps', 'kill', 'whoami', 'pwd'
-        }
+        })
+        
+        # First word -> (handler, clear progress first); internal commands take precedence over cd,
+        # and cd over the pass-through terminal commands, as the checks in process_input used to
+        self._dispatch: Dict[str, Tuple[Callable[[str], None], bool]] = dict.fromkeys(self.fixed_terminal_commands, (self.run_system_command, False))
+        self._dispatch['cd'] = (self.handle_cd_command, False)
+        self._dispatch.update((word, (handler, True)) for word, handler in self.internal_commands.items())
 
     def start(self):
         self.do_clear()
-        import shutil
         
         columns = shutil.get_terminal_size().columns
         box_width = min(columns - 2, 90)
@@ -2112,11 +3754,14 @@ class TerminalApp:
         box_width = max(box_width, len(title) + 4)
         inner_width = box_width - 2
         
-        print(f"{Color.CYAN}")
-        print("╔" + "═" * inner_width + "╗")
-        print(f"║{title.center(inner_width)}║")
-        print("╚" + "═" * inner_width + "╝")
-        print(f"{Color.DIM}{subtitle.center(box_width)}{Color.RESET}\n")
+        rule = "═" * inner_width
+        print(
+            f"{Color.CYAN}\n"
+            f"╔{rule}╗\n"
+            f"║{title.center(inner_width)}║\n"
+            f"╚{rule}╝\n"
+            f"{Color.DIM}{subtitle.center(box_width)}{Color.RESET}\n"
+        )
         
         self.do_list_engines(None)
         
@@ -2129,8 +3774,8 @@ class TerminalApp:
         UI.print_system(f"AI routing  ▸ {Color.GREEN}[Active]{Color.RESET}")
         chat = self.chat_manager.get_current_chat()
         chat_display = chat.title
-        if len(chat.messages) > 0:
-            chat_display += f" ({len(chat.messages)} messages)"
+        if chat.message_count:
+            chat_display += f" ({chat.message_count} messages)"
 
         UI.print_system(f"Current Chat  ▸ {Color.GREEN}{chat_display}{Color.RESET}")
         UI.print_system(f"Chat ID       ▸ {Color.DIM}{chat.chat_id}{Color.RESET}")
@@ -2145,14 +3790,7 @@ class TerminalApp:
                 
                 if self.ai:
                     active_engine = self.ai.active_engine_name.upper()
-                    if active_engine == "GEMINI":
-                        engine_color = Color.GREEN
-                    elif active_engine == "DEEPSEEK":
-                        engine_color = Color.CYAN
-                    elif active_engine == "GROQ":
-                        engine_color = Color.YELLOW
-                    else:
-                        engine_color = Color.WHITE
+                    engine_color = self._ENGINE_COLORS.get(active_engine, Color.WHITE)
                     engine_state = f"{engine_color}[{active_engine}]{Color.RESET} "
                 else:
                     engine_state = ""
@@ -2177,20 +3815,15 @@ class TerminalApp:
                 if not UI.SILENT_ERRORS:
                     UI.print_error(f"Critical Loop Error: {e}")
 
-    def process_input(self, text):
-        first_word = text.split()[0].lower() if text else ""
-
-        if first_word in self.internal_commands:
-            UI.clear_progress()
-            self.internal_commands[first_word](text)
-            return
-            
-        if first_word == "cd":
-            self.handle_cd_command(text)
-            return
+    def process_input(self, text: str) -> None:
+        first_word = text.split(None, 1)[0].lower() if text else ""
 
-        if first_word in self.fixed_terminal_commands:
-            self.run_system_command(text)
+        entry = self._dispatch.get(first_word)
+        if entry is not None:
+            handler, clear_progress = entry
+            if clear_progress:
+                UI.clear_progress()
+            handler(text)
             return
 
         if not self.agent or not self.ai:
@@ -2221,24 +3854,8 @@ class TerminalApp:
 
     def _looks_like_install_request(self, text: str) -> bool:
         """تحقق بسيط إذا كان النص يبدو كطلب تثبيت"""
-        text_lower = text.lower()
-        
-        install_keywords = [
-            'download', 'install', 'get', 'setup',
-            'تحميل', 'نزّل', 'نزل', 'حمّل', 'حملي', 'ثبّت',
-            'شغّل', 'شغلي', 'عاوز', 'أريد', 'نبي'
-        ]
-        
         # تحقق إذا كان يحتوي على كلمة تثبيت + اسم حزمة/أداة
-        has_install_word = any(word in text_lower for word in install_keywords)
-        
-        # قائمة بكلمات تشير إلى أدوات/حزم (يمكن توسيعها)
-        tool_words = ['npm', 'node', 'python', 'rust', 'docker', 'git',
-                    'package', 'tool', 'software', 'برنامج', 'أداة']
-        
-        has_tool_word = any(word in text_lower for word in tool_words)
-        
-        return has_install_word and has_tool_word
+        return bool(self._INSTALL_HINT_RE.search(text) and self._TOOL_HINT_RE.search(text))
     def run_chat_mode(self, text):
         active_engine = self.ai.active_engine_name if self.ai else "N/A"
         
@@ -2248,14 +3865,28 @@ class TerminalApp:
         UI.update_progress("Thinking...")
         
         history = chat.get_messages_for_ai(limit=20)
-        response, model_name = self.ai.chat(text, history)
+        streamed = []
         
+        def on_token(piece):
+            if not streamed:
+                UI.start_agent_stream(active_engine)
+            streamed.append(piece)
+            UI.stream_agent_text(piece)
+        
+        response, model_name = self.ai.chat(text, history, on_token)
+        
+        if streamed:
+            UI.end_agent_stream()
+        else:
+            UI.clear_progress()
+        if not streamed or response != "".join(streamed):
+            # Nothing streamed, or the stream broke and chat() returned an error notice
+            UI.print_agent(response, model_name or active_engine)
+        
+        # Persist after the reply is on screen; the index write itself is coalesced on a timer thread
         chat.add_message("model", response)
         self.chat_manager.save_chats()
         
-        UI.clear_progress()
-        UI.print_agent(response, model_name or active_engine)
-        
         self.persistence.log(
             f"Chat: {chat.title} ({chat.chat_id}) - User: {text[:50]}...",
             "CHAT"
@@ -2293,12 +3924,11 @@ class TerminalApp:
         if confidence < 40:
             if not UI.SILENT_ERRORS:
                 UI.print_warning("📉 Low confidence (<40%)")
-                if input(f"{Color.YELLOW}Continue? (y/n): {Color.RESET}").lower().strip() != 'y':
+                if UI.ask(f"{Color.YELLOW}Continue? (y/n): {Color.RESET}") != 'y':
                     UI.print_system("⏹️  Cancelled")
                     return
         elif not self.auto_mode and not UI.GHOST_MODE:
-            print(f"{Color.YELLOW}Execute {len(plan_data.get('steps', []))} steps? (y/n/auto): {Color.RESET}", end="", flush=True)
-            confirm = input().lower().strip()
+            confirm = UI.ask(f"{Color.YELLOW}Execute {len(plan_data.get('steps', []))} steps? (y/n/auto): {Color.RESET}")
             
             if confirm == 'auto': 
                 self.do_toggle_auto(None)
@@ -2308,11 +3938,35 @@ class TerminalApp:
 
         self.execute_plan_with_progress(plan_data.get('steps', []), model_name or active_engine)
 
+    def _prefetch_independent_files(self, steps: List[Dict]):
+        """Generate code for create steps that no other step touches, concurrently"""
+        touched = Counter(
+            step.get('path', '') for step in steps
+            if step.get('action', '').lower() in ('create', 'modify', 'delete')
+        )
+        independent = [
+            step for step in steps
+            if step.get('action', '').lower() == 'create' and step.get('path') and touched[step['path']] == 1
+        ]
+        if len(independent) < 2:
+            return {}
+        
+        UI.update_progress(f"Generating {len(independent)} files in parallel...")
+        results = self.agent.execute_code_generation_batch(
+            [(step['path'], step.get('description', ''), False) for step in independent],
+            self.persistence.config.get("max_concurrency", 4)
+        )
+        return {step['path']: result for step, result in zip(independent, results) if result[0]}
+
     def execute_plan_with_progress(self, steps: List[Dict], model_name="AI"):
         """Execute plan with auto-installation support"""
         total = len(steps)
         completed_steps = 0
         
+        # Without per-step confirmation every create step will run, so independent files can be generated up front
+        interactive = not self.auto_mode and not UI.GHOST_MODE and not UI.SILENT_ERRORS
+        prefetched = {} if interactive else self._prefetch_independent_files(steps)
+        
         for i, step in enumerate(steps, 1):
             action = step.get('action', '').lower()
             path = step.get('path', '')
@@ -2324,29 +3978,28 @@ class TerminalApp:
             UI.update_progress(progress)
             
             if not self.auto_mode and not UI.GHOST_MODE and not UI.SILENT_ERRORS:
-                UI.clear_progress()
-                choice = input(f"{Color.YELLOW}Allow step {i}/{total}? (y/n/skip): {Color.RESET}").lower().strip()
+                choice = UI.ask(f"{Color.YELLOW}Allow step {i}/{total}? (y/n/skip): {Color.RESET}")
                 if choice == 'n': 
                     UI.print_warning("Execution stopped by user.")
-                    UI.add_to_summary("Stopped by user", f"Step {i}", "⏸️", "User interrupted")
+                    UI.add_to_summary("Stopped by user", f"Step {i}", STATUS_STOPPED, "User interrupted")
                     break
                 if choice == 'skip': 
                     UI.update_progress(f"⏭️  Skipped: {target}")
-                    UI.add_to_summary("Skipped", target, "⏭️", "User skipped")
+                    UI.add_to_summary("Skipped", target, STATUS_SKIPPED, "User skipped")
                     continue
 
             try:
                 if action in ['create', 'modify']:
-                    self._handle_file_action(action, path, desc, model_name)
+                    self._handle_file_action(action, path, desc, model_name, prefetched.pop(path, None) if action == 'create' else None)
                     completed_steps += 1
                     
                 elif action == 'delete':
                     if self.workspace.delete_file(path):
                         UI.update_progress(f"🗑️  Deleted: {path}")
-                        UI.add_to_summary("Deleted file", path, "✅")
+                        UI.add_to_summary("Deleted file", path, STATUS_OK)
                     else:
                         UI.update_progress(f"❌ Failed to delete: {path}")
-                        UI.add_to_summary("Failed to delete", path, "❌")
+                        UI.add_to_summary("Failed to delete", path, STATUS_FAIL)
                     completed_steps += 1
                     
                 elif action == 'command':
@@ -2354,24 +4007,27 @@ class TerminalApp:
                     if success:
                         completed_steps += 1
                     else:
-                        UI.add_to_summary("Failed command", cmd.split()[0], "❌", "Command failed")
+                        UI.add_to_summary("Failed command", cmd.split(None, 1)[0], STATUS_FAIL, "Command failed")
                     
                 elif action == 'analyze':
                     UI.update_progress(f"🔍 Analyzed: {path}")
                     time.sleep(0.3)
                     completed_steps += 1
-                    UI.add_to_summary("Analyzed", path, "🔍")
+                    UI.add_to_summary("Analyzed", path, STATUS_ANALYZED)
 
                 self.persistence.log(f"Action: {action} | Target: {path or cmd}")
 
             except Exception as e:
                 self.persistence.log_error(f"Execution Error in step {i}: {e}", f"Action: {action}", silent=True)
-                UI.add_to_summary("Error in step", f"Step {i}", "❌", str(e)[:100])
+                UI.add_to_summary("Error in step", f"Step {i}", STATUS_FAIL, str(e)[:100])
                 
                 if not UI.SILENT_ERRORS:
                     UI.update_progress(f"⚠️  Step failed (continuing)")
                 time.sleep(0.5)
         
+        # Steps may have written anywhere in the tree
+        self.agent.invalidate_workspace_cache()
+        
         success_rate = (completed_steps / total * 100) if total > 0 else 0
         
         if success_rate >= 90:
@@ -2396,6 +4052,41 @@ class TerminalApp:
         
         UI.show_summary()
 
+    def _run_streamed(self, cmd):
+        """Run cmd echoing stdout as it arrives; returns (returncode, last STDERR_TAIL chars of stderr)"""
+        proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                text=True, errors='replace', bufsize=1)
+        tail = deque()
+        tail_size = 0
+        
+        def drain_stderr():
+            # Memory stays bounded however much a build or test run writes to stderr
+            nonlocal tail_size
+            for line in proc.stderr:
+                tail.append(line)
+                tail_size += len(line)
+                while tail_size > self.STDERR_TAIL and len(tail) > 1:
+                    tail_size -= len(tail.popleft())
+        
+        reader = threading.Thread(target=drain_stderr, daemon=True)
+        reader.start()
+        
+        echo = not UI.GHOST_MODE
+        started = False
+        for line in proc.stdout:
+            if echo:
+                if not started:
+                    UI.clear_progress()
+                    sys.stdout.write(Color.GREEN)
+                    started = True
+                sys.stdout.write(line)
+                sys.stdout.flush()
+        if started:
+            sys.stdout.write(Color.RESET)
+        proc.wait()
+        reader.join()
+        return proc.returncode, "".join(tail)[-self.STDERR_TAIL:]
+
     def run_command_with_ai_install(self, cmd, max_retries=3):
         """Run command with AI-assisted package installation"""
         current_cmd = cmd
@@ -2409,27 +4100,19 @@ class TerminalApp:
             else:
                 UI.update_progress(f"🔄 AI Retry {attempt}/{max_retries}...")
             
-            proc = subprocess.run(current_cmd, shell=True, capture_output=True, text=True)
+            UI.flush_progress()
+            returncode, error_output = self._run_streamed(current_cmd)
             
-            if proc.returncode == 0:
+            if returncode == 0:
                 # النجاح
-                if not UI.GHOST_MODE and proc.stdout.strip():
-                    UI.clear_progress()
-                    print(f"{Color.GREEN}{proc.stdout[:500]}{Color.RESET}")
                 return True
             
-            error_output = proc.stderr
             
             if attempt < max_retries:
                 UI.clear_progress()
                 
                 # تحقق إذا كان الخطأ بسبب باكج مفقود
-                is_package_error = any(
-                    pattern in error_output.lower() 
-                    for pattern in ['command not found', 'not found', 'module not found', 
-                                'could not find', 'npm: not found', 'node: not found',
-                                'pip: not found', 'python: not found']
-                )
+                is_package_error = self._PACKAGE_ERROR_RE.search(error_output) is not None
                 
                 if is_package_error:
                     # ⭐⭐ الجزء الجديد: استخدم AI لتوليد أمر التثبيت ⭐⭐
@@ -2442,34 +4125,34 @@ class TerminalApp:
                         if UI.GHOST_MODE:
                             # في وضع ghost، نفذ مباشرة
                             UI.update_progress(f"📦 Auto-installing via AI...")
-                            result = subprocess.run(install_cmd, shell=True, capture_output=True, text=True)
+                            returncode, output = self._run_install_command(install_cmd)
                             
-                            if result.returncode == 0:
+                            if returncode == 0:
                                 UI.print_success(f"✅ AI-installed successfully")
                                 time.sleep(2)
                                 UI.update_progress("🔄 Retrying original command...")
                                 continue
                             else:
-                                UI.print_error(f"❌ AI installation failed: {result.stderr[:100]}")
+                                UI.print_error(f"❌ AI installation failed: {output[-100:]}")
                                 break
                         else:
                             # اسأل المستخدم
-                            response = input(f"{Color.YELLOW}Execute AI-generated install command? (y/n): {Color.RESET}").lower()
+                            response = UI.ask(f"{Color.YELLOW}Execute AI-generated install command? (y/n): {Color.RESET}")
                             if response == 'y':
                                 UI.update_progress(f"📦 Executing AI install command...")
-                                result = subprocess.run(install_cmd, shell=True, capture_output=True, text=True)
+                                returncode, output = self._run_install_command(install_cmd)
                                 
-                                if result.returncode == 0:
+                                if returncode == 0:
                                     UI.clear_progress()
                                     UI.print_success(f"✅ AI-installed successfully")
-                                    UI.add_to_summary("AI-installed", cmd.split()[0], "✅", f"via {install_cmd[:50]}")
+                                    UI.add_to_summary("AI-installed", cmd.split(None, 1)[0], STATUS_OK, f"via {install_cmd[:50]}")
                                     
                                     time.sleep(2)
                                     UI.update_progress("🔄 Retrying original command...")
                                     continue
                                 else:
                                     UI.clear_progress()
-                                    UI.print_error(f"❌ AI installation failed: {result.stderr[:100]}")
+                                    UI.print_error(f"❌ AI installation failed: {output[-100:]}")
                                     break
                             else:
                                 UI.print_warning("⏸️  Installation declined")
@@ -2494,127 +4177,89 @@ class TerminalApp:
                     error_output[:200], 
                     silent=True
                 )
-                UI.add_to_summary("Failed command", original_cmd.split()[0], "❌", error_output[:100])
+                UI.add_to_summary("Failed command", original_cmd.split(None, 1)[0], STATUS_FAIL, error_output[:100])
                 break
         
         return False
 
+    @staticmethod
+    def _missing_dependency(error_output):
+        """Name of the missing tool/module/library in error_output, or None if unrecognized"""
+        error_lower = error_output.lower()
+        for pattern in _MISSING_DEP_RES:
+            match = pattern.search(error_lower)
+            if match:
+                return match.group(1)
+        return None
+
     def _get_ai_install_command(self, failed_cmd, error_output):
-        """Ask AI to generate OS-specific install command"""
-        
-        # التعرف على نظام التشغيل
-        import platform
-        system = platform.system().lower()
-        
+        """Ask AI to generate OS-specific install command, reusing answers for the same missing dependency"""
+        system = PackageManager._SYSTEM
+        dependency = self._missing_dependency(error_output)
+        key = (system, dependency, failed_cmd.split(None, 1)[0]) if dependency and failed_cmd.strip() else None
+        if key is not None and key in self._install_cmd_cache:
+            self._install_cmd_cache.move_to_end(key)
+            return self._install_cmd_cache[key]
+        
+        install_cmd, answered = self._ask_ai_install_command(failed_cmd, error_output)
+        if key is not None and answered:
+            self._install_cmd_cache[key] = install_cmd
+            if len(self._install_cmd_cache) > self.INSTALL_CMD_CACHE_SIZE:
+                self._install_cmd_cache.popitem(last=False)
+        return install_cmd
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _os_install_info():
+        """OS description for install prompts (cached for the session)"""
+        system = PackageManager._SYSTEM
         if system == 'windows':
-            os_info = "Windows (use winget, chocolatey, or scoop)"
-            package_managers = "winget install, choco install, or scoop install"
-        elif system == 'linux':
-            # اكتشاف توزيعة لينكس
-            try:
-                with open('/etc/os-release', 'r') as f:
-                    content = f.read()
-                    if 'ubuntu' in content.lower() or 'debian' in content.lower():
-                        os_info = "Ubuntu/Debian (use apt)"
-                        package_managers = "sudo apt install"
-                    elif 'fedora' in content.lower():
-                        os_info = "Fedora (use dnf)"
-                        package_managers = "sudo dnf install"
-                    elif 'arch' in content.lower():
-                        os_info = "Arch Linux (use pacman)"
-                        package_managers = "sudo pacman -S"
-                    else:
-                        os_info = "Linux (generic)"
-                        package_managers = "appropriate package manager"
-            except:
-                os_info = "Linux (generic)"
-                package_managers = "appropriate package manager"
-        elif system == 'darwin':
-            os_info = "macOS (use Homebrew)"
-            package_managers = "brew install"
-        else:
-            os_info = f"Unknown OS: {system}"
-            package_managers = "appropriate package manager"
+            return "Windows (use winget, chocolatey, or scoop)"
+        if system == 'darwin':
+            return "macOS (use Homebrew)"
+        if system != 'linux':
+            return f"Unknown OS: {system}"
+        # اكتشاف توزيعة لينكس
+        try:
+            with open('/etc/os-release', 'r') as f:
+                content = f.read().lower()
+        except OSError:
+            return "Linux (generic)"
+        if 'ubuntu' in content or 'debian' in content:
+            return "Ubuntu/Debian (use apt)"
+        if 'fedora' in content:
+            return "Fedora (use dnf)"
+        if 'arch' in content:
+            return "Arch Linux (use pacman)"
+        return "Linux (generic)"
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _available_install_managers():
+        """Package managers on PATH for install prompts (cached for the session)"""
+        windows = PackageManager._SYSTEM == 'windows'
+        # A PATH lookup instead of spawning `<tool> --version` for each one
+        candidates = (('winget', 'winget', windows), ('chocolatey', 'choco', True),
+                      ('npm', 'npm', True), ('pip', 'pip', True),
+                      ('brew', 'brew', not windows), ('apt', 'apt', not windows),
+                      ('dnf', 'dnf', not windows), ('pacman', 'pacman', not windows))
+        found = PackageManager.find_executables(executable for _, executable, applies in candidates if applies)
+        return tuple(label for label, executable, applies in candidates if applies and executable in found)
+
+    def _ask_ai_install_command(self, failed_cmd, error_output):
+        """(install command or None, whether the AI gave a definite answer)"""
+        os_info = self._os_install_info()
         
         # بناء prompt للـ AI
-        prompt = f"""
-                A command has FAILED due to a missing dependency or executable.
-
-                FAILED COMMAND:
-                {failed_cmd}
-
-                ERROR OUTPUT (truncated):
-                {error_output[:600]}
-
-                OPERATING SYSTEM:
-                {os_info}
-
-                Your task:
-                Identify the ROOT missing dependency (tool, runtime, library, compiler, or package manager)
-                and generate the EXACT shell command needed to install it.
-
-                Important:
-                - The missing dependency may be:
-                • a CLI tool (e.g. git, curl, ffmpeg, docker)
-                • a language runtime (python, node, java, go, ruby, php, dotnet)
-                • a compiler or build tool (gcc, make, cmake, clang)
-                • a system library (openssl, zlib, libssl, libc++)
-                • a package manager itself (npm, pip, yarn, pnpm, poetry)
-                • a cloud / dev tool (aws, gcloud, az, kubectl)
-                - The name may NOT be explicitly mentioned.
-                - You must infer it from the error message.
-
-                Rules (STRICT):
-                1. Output ONLY ONE valid shell command — no explanations.
-                2. The command MUST work on the OS specified.
-                3. Use the most STANDARD package manager for that OS:
-                - Ubuntu/Debian → apt
-                - Fedora/RHEL → dnf
-                - Arch → pacman
-                - macOS → brew
-                - Windows → winget (preferred), choco if needed
-                4. Include required privileges (sudo, admin).
-                5. Install the MAIN dependency, not plugins or versions.
-                6. Do NOT install unrelated tools.
-                7. If the dependency is already part of a meta-package, install the meta-package.
-                8. If installation requires multiple chained commands, return them as ONE line joined with &&.
-                9. If the dependency cannot be installed automatically, install the closest official package.
-
-                Common inference patterns:
-                - "command not found" → missing executable
-                - "No module named X" → missing language package manager or runtime
-                - "cannot open shared object file" → missing system library
-                - "gcc: command not found" → missing build-essential / gcc
-                - "npm: not found" → Node.js runtime missing
-                - "pip: command not found" → python-pip missing
-                - "ld: library not found" → missing system dev library
-                - "make: not found" → missing build tools
-
-                Examples:
-                - Ubuntu error: "gcc: command not found"
-                → sudo apt update && sudo apt install build-essential
-
-                - macOS error: "zsh: command not found: ffmpeg"
-                → brew install ffmpeg
-
-                - Windows error: "'python' is not recognized"
-                → winget install Python.Python.3
-
-                - Ubuntu error: "No module named pip"
-                → sudo apt install python3-pip
-
-                - Fedora error: "git: command not found"
-                → sudo dnf install git
-
-                Output format:
-                <INSTALL COMMAND ONLY>
-                """
+        prompt = _AI_INSTALL_PROMPT.format(failed_cmd=failed_cmd, error_output=_stable_error(error_output[:600]), os_info=os_info)
 
         
         # استخدام AI لتوليد الأمر
         result, model_name = self.ai.generate_content(prompt)
         
-        if result and "UNKNOWN_PACKAGE" not in result.upper():
+        if not result:
+            return None, False
+        if "UNKNOWN_PACKAGE" not in result.upper():
             # تنظيف النتيجة
             clean_cmd = result.strip()
             clean_cmd = clean_cmd.replace('```bash', '').replace('```sh', '').replace('```', '').strip()
@@ -2623,29 +4268,28 @@ class TerminalApp:
             # تسجيل في السجل
             self.persistence.log(f"AI generated install command: {clean_cmd}", "INFO", model_name)
             
-            return clean_cmd
+            return clean_cmd, True
         
-        return None
-    def _handle_file_action(self, action, path, desc, model_name):
+        return None, True
+    def _handle_file_action(self, action, path, desc, model_name, generated=None):
         """Handle file creation/modification with summary tracking"""
         is_mod = (action == 'modify')
         
-        new_content, gen_model = self.agent.execute_code_generation(path, desc, is_mod)
+        new_content, gen_model = generated or self.agent.execute_code_generation(path, desc, is_mod)
         
         if new_content:
             old_content = self.workspace.read_file(path) if is_mod else ""
             
             if not UI.GHOST_MODE and is_mod and old_content and not UI.SILENT_ERRORS:
                 UI.clear_progress()
-                old_lines = len(old_content.splitlines())
-                new_lines = len(new_content.splitlines())
+                old_lines = _count_lines(old_content)
+                new_lines = _count_lines(new_content)
                 print(f"\n{Color.YELLOW}📄 {path}: {old_lines} → {new_lines} lines{Color.RESET}")
                 
                 if not self.auto_mode:
-                    UI.clear_progress()
-                    if input(f"{Color.YELLOW}Apply changes? (y/n): {Color.RESET}").lower() != 'y':
+                    if UI.ask(f"{Color.YELLOW}Apply changes? (y/n): {Color.RESET}") != 'y':
                         UI.update_progress("⏭️  Modification skipped")
-                        UI.add_to_summary("Skipped modification", path, "⏭️", "User declined")
+                        UI.add_to_summary("Skipped modification", path, STATUS_SKIPPED, "User declined")
                         return
             
             res = self.workspace.write_file(path, new_content)
@@ -2653,12 +4297,12 @@ class TerminalApp:
                 action_text = "Modified" if is_mod else "Created"
                 UI.update_progress(f"{'✏️ ' if is_mod else '📄'} {action_text}: {path}")
                 
-                lines = len(new_content.splitlines())
+                lines = _count_lines(new_content)
                 details = f"{lines} lines via {gen_model or model_name}"
                 UI.add_to_summary(
                     f"{action_text} file", 
                     path, 
-                    "✅", 
+                    STATUS_OK, 
                     details
                 )
                 
@@ -2666,13 +4310,15 @@ class TerminalApp:
             else:
                 self.persistence.log_error(f"Write Failed for {path}: {res}", "file_ops", silent=True)
                 UI.update_progress(f"❌ Failed to write: {path}")
-                UI.add_to_summary(f"Failed to {action}", path, "❌", str(res)[:100])
+                UI.add_to_summary(f"Failed to {action}", path, STATUS_FAIL, str(res)[:100])
 
     def run_system_command(self, cmd):
         try:
             UI.update_progress(f"Executing: {cmd[:50]}...")
             subprocess.run(cmd, shell=True)
             UI.clear_progress()
+            if self.agent:
+                self.agent.invalidate_workspace_cache()
         except Exception as e:
             self.persistence.log_error(f"Command failed: {e}", "system", silent=True)
             UI.clear_progress()
@@ -2699,143 +4345,17 @@ class TerminalApp:
 
     def _build_ai_install_prompt(self, user_request: str) -> str:
         """بناء الـ prompt المناسب للذكاء الاصطناعي"""
-        import platform
-        import subprocess
-        
-        system = platform.system().lower()
-        
-        # جمع معلومات عن النظام
-        system_info = f"Operating System: {system}"
-        
-        # التحقق من مديري الحزم المتاحين
-        available_managers = []
-        
-        # التحقق من winget (Windows)
-        if system == 'windows':
-            try:
-                result = subprocess.run('winget --version', shell=True, 
-                                    capture_output=True, text=True)
-                if result.returncode == 0:
-                    available_managers.append('winget')
-            except:
-                pass
-        
-        # التحقق من chocolatey
-        try:
-            result = subprocess.run('choco --version', shell=True, 
-                                capture_output=True, text=True)
-            if result.returncode == 0:
-                available_managers.append('chocolatey')
-        except:
-            pass
-        
-        # التحقق من npm
-        try:
-            result = subprocess.run('npm --version', shell=True, 
-                                capture_output=True, text=True)
-            if result.returncode == 0:
-                available_managers.append('npm')
-        except:
-            pass
+        system = PackageManager._SYSTEM
         
-        # التحقق من pip
-        try:
-            result = subprocess.run('pip --version', shell=True, 
-                                capture_output=True, text=True)
-            if result.returncode == 0:
-                available_managers.append('pip')
-        except:
-            pass
+        # مديرو الحزم المتاحون (يُحسب مرة واحدة في الجلسة)
+        available_managers = self._available_install_managers()
         
         # بناء الـ prompt
-        prompt = f"""
-        You are an expert system administrator and package manager expert.
-        
-        USER REQUEST: "{user_request}"
-        
-        SYSTEM INFORMATION:
-        - OS: {system}
-        - Available package managers: {', '.join(available_managers) if available_managers else 'Unknown'}
-        
-        TASK:
-        Based on the user's request, generate the CORRECT installation command.
-        
-        IMPORTANT RULES:
-        1. Generate ONE single command that can be executed directly in the terminal.
-        2. The command MUST work on the current OS ({system}).
-        3. Choose the MOST APPROPRIATE package manager for the task.
-        4. Include all necessary flags (like -y for apt, --accept-package-agreements for winget).
-        5. If multiple commands are needed, chain them with &&.
-        6. For Windows: Prefer winget if available, then chocolatey, then manual download.
-        7. For Linux: Prefer apt for Debian/Ubuntu, yum/dnf for Fedora/RHEL, pacman for Arch.
-        8. For macOS: Use brew.
-        9. If the package name is ambiguous, choose the most popular/mainstream one.
-        
-        OUTPUT FORMAT:
-        Return a JSON object with this exact structure:
-        {{
-            "package": "name_of_package",
-            "manager": "package_manager_used",
-            "command": "full_shell_command_to_execute",
-            "explanation": "brief_explanation_in_english",
-            "risk_level": "low/medium/high",
-            "notes": "any_important_notes"
-        }}
-        
-        EXAMPLES:
-        
-        Example 1 (Windows):
-        Request: "download rust for windows"
-        Available: winget
-        Response: {{
-            "package": "Rust.Rustup",
-            "manager": "winget",
-            "command": "winget install --id Rust.Rustup --accept-package-agreements",
-            "explanation": "Installs Rust programming language via Rustup (recommended installer)",
-            "risk_level": "low",
-            "notes": "Rustup will install both rustc and cargo"
-        }}
-        
-        Example 2 (Linux - Ubuntu):
-        Request: "install python on ubuntu"
-        Available: apt
-        Response: {{
-            "package": "python3",
-            "manager": "apt",
-            "command": "sudo apt update && sudo apt install python3 -y",
-            "explanation": "Installs Python 3 from Ubuntu repositories",
-            "risk_level": "low",
-            "notes": "Python 3 is pre-installed on most Ubuntu versions"
-        }}
-        
-        Example 3 (macOS):
-        Request: "install docker on mac"
-        Available: brew
-        Response: {{
-            "package": "docker",
-            "manager": "brew",
-            "command": "brew install --cask docker",
-            "explanation": "Installs Docker Desktop for macOS",
-            "risk_level": "medium",
-            "notes": "Docker Desktop requires manual setup after installation"
-        }}
-        
-        Example 4 (Arabic):
-        Request: "حملي npm"
-        Available: winget
-        Response: {{
-            "package": "OpenJS.NodeJS",
-            "manager": "winget",
-            "command": "winget install OpenJS.NodeJS",
-            "explanation": "Installs Node.js which includes npm",
-            "risk_level": "low",
-            "notes": "Node.js installer includes npm by default"
-        }}
-        
-        Now, generate the command for the user's request.
-        """
-        
-        return prompt
+        return _INSTALL_REQUEST_PROMPT.format_map({
+            'user_request': user_request,
+            'system': system,
+            'managers': ', '.join(available_managers) if available_managers else 'Unknown'
+        })
 
     def _process_ai_installation_response(self, response: str, model_name: str, original_request: str):
         """معالجة الرد من الذكاء الاصطناعي"""
@@ -2844,13 +4364,12 @@ class TerminalApp:
             clean_response = response.strip()
             
             # إزالة markdown code blocks
-            if '```json' in clean_response:
-                clean_response = clean_response.split('```json')[1].split('```')[0].strip()
-            elif '```' in clean_response:
-                clean_response = clean_response.split('```')[1].split('```')[0].strip()
+            if '```' in clean_response:
+                block = _JSON_BLOCK_RE.search(clean_response) or _ANY_BLOCK_RE.search(clean_response)
+                clean_response = block.group(1).strip()
             
             # تحليل JSON
-            install_info = json.loads(clean_response)
+            install_info = _json_loads(clean_response)
             
             package = install_info.get('package')
             manager = install_info.get('manager')
@@ -2866,28 +4385,25 @@ class TerminalApp:
             UI.clear_progress()
             
             # تلوين مستوى الخطورة
-            risk_color = {
-                'low': Color.GREEN,
-                'medium': Color.YELLOW,
-                'high': Color.RED
-            }.get(risk_level.lower(), Color.WHITE)
+            risk_color = self._RISK_COLORS.get(risk_level.lower(), Color.WHITE)
             
-            print(f"\n{Color.CYAN}🤖 AI Installation Plan:{Color.RESET}")
-            print(f"{Color.DIM}{'='*60}{Color.RESET}")
-            print(f"{Color.BOLD}Package:{Color.RESET}    {package}")
-            print(f"{Color.BOLD}Manager:{Color.RESET}    {manager}")
-            print(f"{Color.BOLD}Risk:{Color.RESET}       {risk_color}{risk_level.upper()}{Color.RESET}")
-            print(f"{Color.BOLD}Command:{Color.RESET}    {Color.GREEN}{command}{Color.RESET}")
+            UI._emit(f"\n{Color.CYAN}🤖 AI Installation Plan:{Color.RESET}")
+            UI._emit(f"{Color.DIM}{'='*60}{Color.RESET}")
+            UI._emit(f"{Color.BOLD}Package:{Color.RESET}    {package}")
+            UI._emit(f"{Color.BOLD}Manager:{Color.RESET}    {manager}")
+            UI._emit(f"{Color.BOLD}Risk:{Color.RESET}       {risk_color}{risk_level.upper()}{Color.RESET}")
+            UI._emit(f"{Color.BOLD}Command:{Color.RESET}    {Color.GREEN}{command}{Color.RESET}")
             
             if explanation:
-                print(f"\n{Color.BOLD}Explanation:{Color.RESET}")
-                print(f"{Color.DIM}{explanation}{Color.RESET}")
+                UI._emit(f"\n{Color.BOLD}Explanation:{Color.RESET}")
+                UI._emit(f"{Color.DIM}{explanation}{Color.RESET}")
             
             if notes:
-                print(f"\n{Color.BOLD}Notes:{Color.RESET}")
-                print(f"{Color.DIM}📝 {notes}{Color.RESET}")
+                UI._emit(f"\n{Color.BOLD}Notes:{Color.RESET}")
+                UI._emit(f"{Color.DIM}📝 {notes}{Color.RESET}")
             
-            print(f"{Color.DIM}{'='*60}{Color.RESET}")
+            UI._emit(f"{Color.DIM}{'='*60}{Color.RESET}")
+            UI.flush()
             
             # تسجيل في السجل
             self.persistence.log(
@@ -2917,11 +4433,11 @@ class TerminalApp:
         for line in lines:
             line = line.strip()
             # تحقق إذا كان السطر يبدو كأمر
-            if (line.startswith('winget') or line.startswith('sudo') or 
-                line.startswith('apt') or line.startswith('brew') or
-                line.startswith('npm') or line.startswith('pip') or
-                line.startswith('choco') or 'install' in line.lower()):
+            if line.startswith(self._COMMAND_PREFIXES) or 'install' in line.lower():
                 potential_commands.append(line)
+                # Only three are shown, and a single hit is what gets offered for execution
+                if len(potential_commands) == 3:
+                    break
         
         if potential_commands:
             UI.print_warning("AI didn't return proper JSON, but found potential command:")
@@ -2944,8 +4460,7 @@ class TerminalApp:
             self._execute_ai_installation(command, package, manager, model_name)
         else:
             # طلب التأكيد
-            print(f"\n{Color.YELLOW}Execute this command? (y/n/explain): {Color.RESET}", end="")
-            response = input().lower().strip()
+            response = UI.ask(f"\n{Color.YELLOW}Execute this command? (y/n/explain): {Color.RESET}")
             
             if response == 'y':
                 UI.update_progress(f"📦 Installing {package}...")
@@ -2956,6 +4471,46 @@ class TerminalApp:
             else:
                 UI.print_system("Installation cancelled")
         
+    @staticmethod
+    def _direct_argv(command):
+        """argv to run command without a shell, or None when it needs one"""
+        if not command or not TerminalApp._SHELL_CHARS.isdisjoint(command):
+            return None
+        windows = PackageManager._SYSTEM == 'windows'
+        if windows and '"' in command:
+            return None
+        try:
+            argv = shlex.split(command, posix=not windows)
+        except ValueError:
+            return None
+        if not argv or '=' in argv[0]:
+            return None
+        # Shell builtins, and .cmd/.bat shims such as npm on Windows, still go through the shell
+        executable = shutil.which(argv[0])
+        if executable is None or (windows and executable.lower().endswith(('.cmd', '.bat'))):
+            return None
+        argv[0] = executable
+        return argv
+
+    @staticmethod
+    def _run_install_command(command):
+        """Run an AI-generated install command, showing its output live; returns (returncode, output tail)"""
+        # No shell when it is a plain program + args
+        argv = TerminalApp._direct_argv(command)
+        proc = subprocess.Popen(command if argv is None else argv, shell=argv is None,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                text=True, errors='replace', bufsize=1)
+        # Long installs can print megabytes; only the last lines are kept
+        tail = deque(maxlen=TerminalApp.INSTALL_OUTPUT_TAIL)
+        for line in proc.stdout:
+            line = line.rstrip()
+            if line:
+                tail.append(line)
+                UI.update_progress(line[:120])
+        proc.wait()
+        UI.clear_progress()
+        return proc.returncode, "\n".join(tail)
+
     def _execute_ai_installation(self, command: str, package: str, manager: str, model_name: str):
         """تنفيذ أمر التثبيت الذي ولده AI"""
         try:
@@ -2963,37 +4518,37 @@ class TerminalApp:
             UI.print_note(f"Executing: {command}")
             
             # تنفيذ الأمر
-            result = subprocess.run(command, shell=True, capture_output=True, text=True)
+            returncode, output = self._run_install_command(command)
             
-            if result.returncode == 0:
+            if returncode == 0:
                 UI.print_success(f"✅ Successfully installed {package}")
                 
                 # تسجيل النجاح
                 self.persistence.track_installation(package, manager, True)
-                UI.add_to_summary(f"AI-installed {package}", manager, "✅", f"via {model_name}")
+                UI.add_to_summary(f"AI-installed {package}", manager, STATUS_OK, f"via {model_name}")
                 
                 # عرض الإخراج إذا كان موجودًا
-                if result.stdout.strip():
+                if output:
                     print(f"\n{Color.GREEN}Output:{Color.RESET}")
-                    print(f"{Color.DIM}{result.stdout[:500]}{Color.RESET}")
+                    print(f"{Color.DIM}{output[-500:]}{Color.RESET}")
                 
                 # اقتراح الخطوة التالية
                 self._suggest_next_steps(package, manager)
                 
             else:
                 # الفشل
-                error_msg = result.stderr
+                error_msg = output
                 
                 UI.print_error(f"❌ Installation failed for {package}", silent=False)
                 
                 # عرض تفاصيل الخطأ
                 if error_msg:
                     print(f"\n{Color.RED}Error details:{Color.RESET}")
-                    print(f"{Color.DIM}{error_msg[:400]}{Color.RESET}")
+                    print(f"{Color.DIM}{error_msg[-400:]}{Color.RESET}")
                 
                 # تسجيل الفشل
                 self.persistence.track_installation(package, manager, False)
-                UI.add_to_summary(f"Failed to install {package}", manager, "❌", error_msg[:100])
+                UI.add_to_summary(f"Failed to install {package}", manager, STATUS_FAIL, error_msg[-100:])
                 
                 # طلب مساعدة AI لحل المشكلة
                 self._ask_ai_for_fix(command, error_msg, package)
@@ -3031,8 +4586,7 @@ class TerminalApp:
             print(f"{Color.DIM}{'='*60}{Color.RESET}")
             
             # العودة للسؤال عن التنفيذ
-            print(f"\n{Color.YELLOW}Execute the command now? (y/n): {Color.RESET}", end="")
-            response = input().lower().strip()
+            response = UI.ask(f"\n{Color.YELLOW}Execute the command now? (y/n): {Color.RESET}")
             if response == 'y':
                 UI.update_progress(f"📦 Installing {package}...")
                 self._execute_ai_installation(command, package, "unknown", model_name)
@@ -3042,8 +4596,7 @@ class TerminalApp:
         if UI.GHOST_MODE:
             return
         
-        print(f"\n{Color.YELLOW}Ask AI for a fix? (y/n): {Color.RESET}", end="")
-        response = input().lower().strip()
+        response = UI.ask(f"\n{Color.YELLOW}Ask AI for a fix? (y/n): {Color.RESET}")
         
         if response != 'y':
             return
@@ -3054,7 +4607,7 @@ class TerminalApp:
         Installation command failed:
         
         Command: {failed_command}
-        Error: {error_output[:500]}
+        Error: {_stable_error(error_output[:500])}
         Package: {package}
         
         Suggest a fix. This could be:
@@ -3077,59 +4630,30 @@ class TerminalApp:
 
     def _suggest_next_steps(self, package: str, manager: str):
         """اقتراح الخطوات التالية بعد التثبيت الناجح"""
-        suggestions = {
-            'rust': [
-                "Run 'rustc --version' to verify installation",
-                "Run 'cargo --version' to check Cargo package manager",
-                "Create a test project: 'cargo new hello_world'"
-            ],
-            'node': [
-                "Run 'node --version' to check Node.js",
-                "Run 'npm --version' to check npm",
-                "Create a test file: 'console.log(\"Hello Node\")'"
-            ],
-            'python': [
-                "Run 'python --version' or 'python3 --version'",
-                "Run 'pip --version' to check pip",
-                "Try: 'python -c \"print('Hello Python')\"'"
-            ],
-            'docker': [
-                "Run 'docker --version' to verify",
-                "Try: 'docker run hello-world'",
-                "Check if Docker service is running"
-            ],
-            'git': [
-                "Run 'git --version'",
-                "Configure git: 'git config --global user.name \"Your Name\"'",
-                "Try: 'git init' in a test directory"
-            ]
-        }
-        
-        # البحث عن اقتراحات
+        # البحث عن اقتراحات: exact name first, then the first key contained in it (e.g. Rust.Rustup)
         package_lower = package.lower()
-        for key, steps in suggestions.items():
-            if key in package_lower:
-                print(f"\n{Color.GREEN}🚀 Next steps for {package}:{Color.RESET}")
-                for step in steps:
-                    print(f"  • {step}")
-                break
+        steps = self._NEXT_STEPS.get(package_lower)
+        if steps is None:
+            steps = next((hints for key, hints in self._NEXT_STEPS.items() if key in package_lower), None)
+        if steps:
+            print(f"\n{Color.GREEN}🚀 Next steps for {package}:{Color.RESET}")
+            for step in steps:
+                print(f"  • {step}")
     def handle_cd_command(self, text):
         parts = text.split(maxsplit=1)
         if len(parts) > 1:
             try:
                 os.chdir(parts[1])
-                self.persistence.update_workspace(os.getcwd())
-                UI.update_progress(f"Changed to: {os.getcwd()}")
-                time.sleep(0.3)
-                UI.clear_progress()
+                cwd = os.getcwd()
+                self.persistence.update_workspace(cwd)
+                UI.print_system(f"Changed to: {cwd}")
             except Exception as e:
                 self.persistence.log_error(f"CD failed: {e}", parts[1], silent=True)
 
     def do_toggle_silent(self, text):
         """Toggle silent error mode"""
         UI.SILENT_ERRORS = not UI.SILENT_ERRORS
-        self.persistence.config["silent_errors"] = UI.SILENT_ERRORS
-        self.persistence.save()
+        self.persistence.set_config("silent_errors", UI.SILENT_ERRORS)
         state = "ENABLED" if UI.SILENT_ERRORS else "DISABLED"
         color = Color.BLUE if UI.SILENT_ERRORS else Color.YELLOW
         UI.print_system(f"Silent Error Mode: {color}{state}{Color.RESET}")
@@ -3149,12 +4673,19 @@ class TerminalApp:
     
     def do_toggle_fallback(self, text):
         current = self.persistence.config.get("fallback_enabled", True)
-        self.persistence.config["fallback_enabled"] = not current
-        self.persistence.save()
+        self.persistence.set_config("fallback_enabled", not current)
         state = "ENABLED" if not current else "DISABLED"
         color = Color.GREEN if not current else Color.RED
         UI.print_system(f"Auto-Fallback: {color}{state}{Color.RESET}")
     
+    def do_refresh_managers(self, text):
+        """Re-probe package managers after one was installed or removed"""
+        TerminalApp._available_install_managers.cache_clear()
+        PackageManager.is_package_manager_installed.cache_clear()
+        self._install_cmd_cache.clear()
+        managers = self._available_install_managers()
+        UI.print_system(f"Package managers: {', '.join(managers) if managers else 'none found'}")
+    
     def do_check_balance(self, text):
         """Check DeepSeek account balance"""
         if not self.ai:
@@ -3185,20 +4716,15 @@ class TerminalApp:
             return
         
         current_id = self.chat_manager.current_chat_id
+        row_separator = "    " + UI._RULE
         
-        print(f"\n{Color.CYAN}💬 Available Chats:{Color.RESET}")
-        print(f"{Color.DIM}{'='*80}{Color.RESET}")
+        UI._emit(f"\n{Color.CYAN}💬 Available Chats:{Color.RESET}")
+        UI._emit(f"{Color.DIM}{'='*80}{Color.RESET}")
         
         for i, chat in enumerate(chats, 1):
-            # Parse dates for display
-            try:
-                created_dt = datetime.fromisoformat(chat.created_at.replace('Z', '+00:00'))
-                last_dt = datetime.fromisoformat(chat.last_activity.replace('Z', '+00:00'))
-                created_str = created_dt.strftime("%Y-%m-%d %H:%M")
-                last_str = last_dt.strftime("%Y-%m-%d %H:%M")
-            except:
-                created_str = chat.created_at[:16]
-                last_str = chat.last_activity[:16]
+            # Stored as local ISO timestamps, so "YYYY-MM-DD HH:MM" is just the first 16 characters
+            created_str = chat.created_at[:16].replace('T', ' ')
+            last_str = chat.last_activity[:16].replace('T', ' ')
             
             # Mark current chat
             is_current = " ⭐ CURRENT" if chat.chat_id == current_id else ""
@@ -3208,24 +4734,25 @@ class TerminalApp:
             if len(title_display) > 30:
                 title_display = title_display[:27] + "..."
             
-            print(f"{i:2}. {Color.BOLD}{title_display:<30}{Color.RESET}")
-            print(f"    {Color.DIM}ID: {chat.chat_id}{is_current}{Color.RESET}")
-            print(f"    {Color.DIM}Created: {created_str} | Last: {last_str} | Messages: {len(chat.messages)}{Color.RESET}")
+            UI._emit(f"{i:2}. {Color.BOLD}{title_display:<30}{Color.RESET}")
+            UI._emit(f"    {Color.DIM}ID: {chat.chat_id}{is_current}{Color.RESET}")
+            UI._emit(f"    {Color.DIM}Created: {created_str} | Last: {last_str} | Messages: {chat.message_count}{Color.RESET}")
             
-            # Show first message if available
-            if chat.messages and i <= 5:
+            # Show first message if available (loads only the first few chats)
+            if i <= 5 and chat.message_count:
                 first_msg = chat.messages[0]['parts'][0]
                 preview = first_msg[:60] + "..." if len(first_msg) > 60 else first_msg
-                print(f"    {Color.DIM}First: \"{preview}\"{Color.RESET}")
+                UI._emit(f"    {Color.DIM}First: \"{preview}\"{Color.RESET}")
             
-            print(f"    {Color.DIM}{'-'*40}{Color.RESET}")
-        
-        print(f"\n{Color.BLUE}Commands:{Color.RESET}")
-        print(f"  • {Color.YELLOW}chat <ID or number>{Color.RESET} - Switch to chat")
-        print(f"  • {Color.YELLOW}newchat{Color.RESET} - Start new chat")
-        print(f"  • {Color.YELLOW}deletechat <ID>{Color.RESET} - Delete chat")
-        print(f"  • {Color.YELLOW}renamechat <ID> <new title>{Color.RESET} - Rename chat")
-        print(f"  • {Color.YELLOW}exportchat <ID> [json/txt]{Color.RESET} - Export chat")
+            UI._emit(row_separator)
+        
+        UI._emit(f"\n{Color.BLUE}Commands:{Color.RESET}")
+        UI._emit(f"  • {Color.YELLOW}chat <ID or number>{Color.RESET} - Switch to chat")
+        UI._emit(f"  • {Color.YELLOW}newchat{Color.RESET} - Start new chat")
+        UI._emit(f"  • {Color.YELLOW}deletechat <ID>{Color.RESET} - Delete chat")
+        UI._emit(f"  • {Color.YELLOW}renamechat <ID> <new title>{Color.RESET} - Rename chat")
+        UI._emit(f"  • {Color.YELLOW}exportchat <ID> [json/txt]{Color.RESET} - Export chat")
+        UI.flush()
     
     def do_switch_chat(self, text):
         """Switch to a specific chat by ID or number"""
@@ -3236,7 +4763,7 @@ class TerminalApp:
             print(f"\n{Color.CYAN}Current Chat:{Color.RESET}")
             print(f"  ID: {Color.BOLD}{chat.chat_id}{Color.RESET}")
             print(f"  Title: {Color.GREEN}{chat.title}{Color.RESET}")
-            print(f"  Messages: {len(chat.messages)}")
+            print(f"  Messages: {chat.message_count}")
             print(f"  Created: {chat.created_at[:19]}")
             return
         
@@ -3244,8 +4771,9 @@ class TerminalApp:
         
         # Check if it's a number from the list
         if target.isdigit():
-            chats = self.chat_manager.list_chats(limit=100)
             index = int(target) - 1
+            # Only the chats up to the requested number need selecting
+            chats = self.chat_manager.list_chats(limit=min(index + 1, 100)) if index >= 0 else []
             if 0 <= index < len(chats):
                 target = chats[index].chat_id
             else:
@@ -3257,7 +4785,7 @@ class TerminalApp:
         if success:
             chat = result
             UI.print_success(f"Switched to chat: {Color.BOLD}{chat.title}{Color.RESET}")
-            UI.print_note(f"Chat ID: {chat.chat_id} | Messages: {len(chat.messages)}")
+            UI.print_note(f"Chat ID: {chat.chat_id} | Messages: {chat.message_count}")
             
             # Show last few messages
             if chat.messages:
@@ -3265,7 +4793,8 @@ class TerminalApp:
                 for msg in chat.messages[-3:]:
                     role_icon = "👤" if msg['role'] == 'user' else "🤖"
                     role_color = Color.BLUE if msg['role'] == 'user' else Color.GREEN
-                    preview = msg['parts'][0][:80] + "..." if len(msg['parts'][0]) > 80 else msg['parts'][0]
+                    body = msg['parts'][0]
+                    preview = body[:80] + "..." if len(body) > 80 else body
                     print(f"  {role_icon} {role_color}{preview}{Color.RESET}")
         else:
             UI.print_error(f"Failed to switch chat: {result}", silent=True)
@@ -3290,7 +4819,7 @@ class TerminalApp:
         """Save current chat (auto-saved, just shows info)"""
         chat = self.chat_manager.get_current_chat()
         UI.print_success(f"Chat auto-saved: {chat.title}")
-        UI.print_note(f"ID: {chat.chat_id} | Messages: {len(chat.messages)}")
+        UI.print_note(f"ID: {chat.chat_id} | Messages: {chat.message_count}")
         UI.print_note("Chats are automatically saved after each message.")
     
     def do_load_chat(self, text):
@@ -3337,7 +4866,7 @@ class TerminalApp:
         if not UI.GHOST_MODE:
             chat = self.chat_manager.sessions.get(chat_id)
             if chat:
-                confirm = input(f"{Color.RED}Delete chat '{chat.title}'? (y/N): {Color.RESET}").lower()
+                confirm = UI.ask(f"{Color.RED}Delete chat '{chat.title}'? (y/N): {Color.RESET}")
                 if confirm != 'y':
                     UI.print_system("Deletion cancelled")
                     return
@@ -3370,27 +4899,29 @@ class TerminalApp:
         """Show current chat information"""
         chat = self.chat_manager.get_current_chat()
         
-        print(f"\n{Color.CYAN}📱 Current Chat Session:{Color.RESET}")
-        print(f"{Color.DIM}{'='*60}{Color.RESET}")
-        print(f"{Color.BOLD}Title:{Color.RESET}    {chat.title}")
-        print(f"{Color.BOLD}ID:{Color.RESET}        {chat.chat_id}")
-        print(f"{Color.BOLD}Created:{Color.RESET}   {chat.created_at[:19]}")
-        print(f"{Color.BOLD}Last:{Color.RESET}      {chat.last_activity[:19]}")
-        print(f"{Color.BOLD}Messages:{Color.RESET}  {len(chat.messages)}")
+        UI._emit(f"\n{Color.CYAN}📱 Current Chat Session:{Color.RESET}")
+        UI._emit(f"{Color.DIM}{'='*60}{Color.RESET}")
+        UI._emit(f"{Color.BOLD}Title:{Color.RESET}    {chat.title}")
+        UI._emit(f"{Color.BOLD}ID:{Color.RESET}        {chat.chat_id}")
+        UI._emit(f"{Color.BOLD}Created:{Color.RESET}   {chat.created_at[:19]}")
+        UI._emit(f"{Color.BOLD}Last:{Color.RESET}      {chat.last_activity[:19]}")
+        UI._emit(f"{Color.BOLD}Messages:{Color.RESET}  {len(chat.messages)}")
         
         if chat.messages:
-            print(f"\n{Color.DIM}Recent Messages:{Color.RESET}")
+            UI._emit(f"\n{Color.DIM}Recent Messages:{Color.RESET}")
             for msg in chat.messages[-5:]:
                 role = "👤 User" if msg['role'] == 'user' else "🤖 AI"
                 timestamp = msg.get('timestamp', '')[:16]
-                content_preview = msg['parts'][0][:60] + "..." if len(msg['parts'][0]) > 60 else msg['parts'][0]
-                print(f"  {Color.DIM}{timestamp}{Color.RESET} {role}: {content_preview}")
-        
-        print(f"\n{Color.BLUE}Quick Commands:{Color.RESET}")
-        print(f"  {Color.YELLOW}newchat [title]{Color.RESET} - Start new chat")
-        print(f"  {Color.YELLOW}chats{Color.RESET} - List all chats")
-        print(f"  {Color.YELLOW}exportchat{Color.RESET} - Export this chat")
-        print(f"  {Color.YELLOW}clearchat{Color.RESET} - Clear messages (keep chat)")
+                body = msg['parts'][0]
+                content_preview = body[:60] + "..." if len(body) > 60 else body
+                UI._emit(f"  {Color.DIM}{timestamp}{Color.RESET} {role}: {content_preview}")
+        
+        UI._emit(f"\n{Color.BLUE}Quick Commands:{Color.RESET}")
+        UI._emit(f"  {Color.YELLOW}newchat [title]{Color.RESET} - Start new chat")
+        UI._emit(f"  {Color.YELLOW}chats{Color.RESET} - List all chats")
+        UI._emit(f"  {Color.YELLOW}exportchat{Color.RESET} - Export this chat")
+        UI._emit(f"  {Color.YELLOW}clearchat{Color.RESET} - Clear messages (keep chat)")
+        UI.flush()
     
     def do_clear_chat(self, text):
         """Clear all messages in current chat"""
@@ -3401,7 +4932,7 @@ class TerminalApp:
             return
         
         if not UI.GHOST_MODE:
-            confirm = input(f"{Color.YELLOW}Clear all {len(chat.messages)} messages in '{chat.title}'? (y/N): {Color.RESET}").lower()
+            confirm = UI.ask(f"{Color.YELLOW}Clear all {len(chat.messages)} messages in '{chat.title}'? (y/N): {Color.RESET}")
             if confirm != 'y':
                 UI.print_system("Clearing cancelled")
                 return
@@ -3427,6 +4958,8 @@ class TerminalApp:
                 if success:
                     UI.print_success(message)
                     self.agent.ai = self.ai
+                    self._install_cmd_cache.clear()
+                    self.agent.clear_intent_cache()
                 else:
                     UI.print_error(message, silent=True)
             else:
@@ -3442,40 +4975,33 @@ class TerminalApp:
             UI.print_warning("No AI engines initialized")
             return
             
-        print(f"\n{Color.CYAN}🤖 Available AI Engines:{Color.RESET}")
-        print(f"{Color.DIM}{'='*50}{Color.RESET}")
+        model_stats = self.persistence.config.get("model_stats", {})
+        
+        UI._emit(f"\n{Color.CYAN}🤖 Available AI Engines:{Color.RESET}")
+        UI._emit(UI._RULE_50)
         
         for engine_name, engine in self.ai.engines.items():
             is_active = (engine_name == self.ai.active_engine_name)
-            if engine_name == "gemini":
-                status_color = Color.GREEN
-            elif engine_name == "deepseek":
-                status_color = Color.CYAN
-            elif engine_name == "groq":
-                status_color = Color.YELLOW
-            else:
-                status_color = Color.WHITE
-                
-            if is_active:
-                status_color = Color.BOLD + status_color
-                
-            active_marker = " ⭐ ACTIVE" if is_active else ""
+            engine_label = engine_name.upper()
+            status_color = self._ENGINE_COLORS.get(engine_label, Color.WHITE)
+            # Bold and the marker only for the active engine; no per-row color concatenation
+            bold, active_marker = (Color.BOLD, " ⭐ ACTIVE") if is_active else ("", "")
             
-            print(f"  {status_color}{engine_name.upper():<10}{Color.RESET} → {engine.model_name}{active_marker}")
+            UI._emit(f"  {bold}{status_color}{engine_label:<10}{Color.RESET} → {engine.model_name}{active_marker}")
             
             if engine_name == 'deepseek':
                 if engine.balance_checked:
                     balance_status = f"{Color.GREEN}✓ Balance OK{Color.RESET}" if engine.balance_available else f"{Color.RED}✗ Insufficient Balance{Color.RESET}"
-                    print(f"    {balance_status}")
+                    UI._emit(f"    {balance_status}")
             
-            stat_key = f"{engine_name}:{engine.model_name}"
-            stats = self.persistence.config.get("model_stats", {}).get(stat_key)
+            stats = model_stats.get(engine._stat_key)
             if stats:
                 success_rate = (stats['successes'] / stats['requests'] * 100) if stats['requests'] > 0 else 0
-                print(f"    {Color.DIM}Requests: {stats['requests']} | Success: {success_rate:.1f}% | Tokens: {stats['tokens_used']:,}{Color.RESET}")
+                UI._emit(f"    {Color.DIM}Requests: {stats['requests']} | Success: {success_rate:.1f}% | Tokens: {stats['tokens_used']:,}{Color.RESET}")
         
-        print(f"{Color.DIM}{'='*50}{Color.RESET}")
-        print(f"{Color.BLUE}Use: 'engine <name>' to switch{Color.RESET}")
+        UI._emit(UI._RULE_50)
+        UI._emit(f"{Color.BLUE}Use: 'engine <name>' to switch{Color.RESET}")
+        UI.flush()
 
     def do_list_groq_models(self, _):
         """List available Groq models"""
@@ -3486,18 +5012,19 @@ class TerminalApp:
         groq_engine = self.ai.engines['groq']
         models = groq_engine.get_available_models()
         
-        print(f"\n{Color.YELLOW}🚀 Available Groq Models:{Color.RESET}")
-        print(f"{Color.DIM}{'='*50}{Color.RESET}")
+        UI._emit(f"\n{Color.YELLOW}🚀 Available Groq Models:{Color.RESET}")
+        UI._emit(UI._RULE_50)
         
         for model in models:
             is_active = (model == groq_engine.model_name)
             if is_active:
-                print(f"  {Color.GREEN}✓ {model:<25}{Color.RESET} ← Current")
+                UI._emit(f"  {Color.GREEN}✓ {model:<25}{Color.RESET} ← Current")
             else:
-                print(f"  {Color.WHITE}  {model:<25}{Color.RESET}")
+                UI._emit(f"  {Color.WHITE}  {model:<25}{Color.RESET}")
         
-        print(f"{Color.DIM}{'='*50}{Color.RESET}")
-        print(f"{Color.YELLOW}Use: 'model groq <model_name>' to switch models{Color.RESET}")
+        UI._emit(UI._RULE_50)
+        UI._emit(f"{Color.YELLOW}Use: 'model groq <model_name>' to switch models{Color.RESET}")
+        UI.flush()
 
     def do_model_stats(self, _):
         stats = self.persistence.config.get("model_stats", {})
@@ -3505,8 +5032,8 @@ class TerminalApp:
             UI.print_warning("No model statistics available yet.")
             return
             
-        print(f"\n{Color.CYAN}📊 AI Model Statistics:{Color.RESET}")
-        print(f"{Color.DIM}{'='*60}{Color.RESET}")
+        UI._emit(f"\n{Color.CYAN}📊 AI Model Statistics:{Color.RESET}")
+        UI._emit(UI._RULE_60)
         
         total_requests = 0
         total_tokens = 0
@@ -3520,23 +5047,23 @@ class TerminalApp:
             
             success_rate = (successes / requests * 100) if requests > 0 else 0
             
-            if success_rate >= 90:
-                rate_color = Color.GREEN
-            elif success_rate >= 70:
-                rate_color = Color.YELLOW
-            else:
-                rate_color = Color.RED
+            rate_color = self._RATE_COLORS[min(int(success_rate) // 10, 9)]
                 
-            print(f"  {Color.BOLD}{model_name}{Color.RESET}")
-            print(f"    Requests: {requests} | {rate_color}Success: {success_rate:.1f}%{Color.RESET}")
-            print(f"    Tokens Used: {tokens:,} | Last Used: {last_used[:16]}")
-            print(f"    {Color.DIM}{'-'*40}{Color.RESET}")
+            UI._emit(f"  {Color.BOLD}{model_name}{Color.RESET}")
+            UI._emit(f"    Requests: {requests} | {rate_color}Success: {success_rate:.1f}%{Color.RESET}")
+            UI._emit(f"    Tokens Used: {tokens:,} | Last Used: {last_used[:16]}")
+            UI._emit("    " + UI._RULE)
             
             total_requests += requests
             total_tokens += tokens
             
-        print(f"\n{Color.BOLD}Totals:{Color.RESET} {total_requests:,} requests | {total_tokens:,} tokens")
-        print(f"{Color.DIM}{'='*60}{Color.RESET}")
+        UI._emit(f"\n{Color.BOLD}Totals:{Color.RESET} {total_requests:,} requests | {total_tokens:,} tokens")
+        # Cache hits cost no request, so they are not in model_stats; the cache is in-memory only
+        cache_hits = sum(engine.cache_hits for engine in self.ai.engines.values()) if self.ai else 0
+        if cache_hits:
+            UI._emit(f"{Color.DIM}Answered from cache this session: {cache_hits:,}{Color.RESET}")
+        UI._emit(UI._RULE_60)
+        UI.flush()
 
     def do_change_model(self, text):
         parts = text.split(maxsplit=2)
@@ -3553,43 +5080,48 @@ class TerminalApp:
             model_name = parts[2].strip()
             
             if engine_name == "gemini":
-                self.persistence.config["model"] = model_name
-                self.persistence.save()
+                self.persistence.set_config("model", model_name)
                 if self.ai and 'gemini' in self.ai.engines:
                     try:
-                        self.ai.engines['gemini'] = GeminiEngine(self.persistence)
+                        self._apply_model('gemini', GeminiEngine, model_name)
                         UI.print_success(f"Gemini model updated to: {model_name}")
                     except Exception as e:
                         UI.print_error(f"Failed to reload Gemini: {e}", silent=True)
                         
             elif engine_name == "deepseek":
-                self.persistence.config["deepseek_model"] = model_name
-                self.persistence.save()
+                self.persistence.set_config("deepseek_model", model_name)
                 if self.ai and 'deepseek' in self.ai.engines:
                     try:
-                        self.ai.engines['deepseek'] = DeepSeekEngine(self.persistence)
+                        self._apply_model('deepseek', DeepSeekEngine, model_name)
                         UI.print_success(f"DeepSeek model updated to: {model_name}")
                     except Exception as e:
                         UI.print_error(f"Failed to reload DeepSeek: {e}", silent=True)
                         
             elif engine_name == "groq":
-                self.persistence.config["groq_model"] = model_name
-                self.persistence.save()
+                self.persistence.set_config("groq_model", model_name)
                 if self.ai and 'groq' in self.ai.engines:
                     try:
-                        self.ai.engines['groq'] = GroqEngine(self.persistence)
+                        self._apply_model('groq', GroqEngine, model_name)
                         UI.print_success(f"Groq model updated to: {model_name}")
                     except Exception as e:
                         UI.print_error(f"Failed to reload Groq: {e}", silent=True)
             else:
                 UI.print_error(f"Unknown engine: {engine_name}", silent=True)
 
+    def _apply_model(self, engine_name, engine_cls, model_name):
+        """Point a running engine at another model; rebuild it only if that fails"""
+        try:
+            self.ai.engines[engine_name].set_model(model_name)
+        except Exception:
+            self.ai.engines[engine_name] = engine_cls(self.persistence)
+
     def do_workspace(self, text):
         print(f"Current: {self.workspace.get_current_path()}")
 
     def do_history(self, text):
         for i, item in enumerate(self.persistence.history[-5:]):
-             print(f"{i}. {item['role']}: {str(item['parts'])[:50]}...")
+            UI._emit(f"{i}. {item['role']}: {_preview(item['parts'])}...")
+        UI.flush()
     
     def do_show_summary(self, _):
         """Show last execution summary"""
@@ -3599,48 +5131,14 @@ class TerminalApp:
             UI.print_warning("No execution summary available yet.")
 
     def do_clear(self, _=None):
-        os.system('cls' if os.name == 'nt' else 'clear')
+        # Escape codes instead of spawning clear/cls; VT processing is enabled on Windows at startup
+        UI.clear_progress()
+        sys.stdout.write(UI._CLEAR_SCREEN)
+        sys.stdout.flush()
 
     def do_help(self, _=None):
-        print(f"""
-        {Color.CYAN}XEDA v9.3 - Enhanced Commands:{Color.RESET}
-
-        {Color.GREEN}Core Features:{Color.RESET}
-          • Auto-package installation 📦
-          • Post-execution summary 📊
-          • Silent error handling 🔇
-          • Deep thinking workflow 🤔
-
-        {Color.YELLOW}Commands:{Color.RESET}
-          <task>              : Auto-route to agent or chat
-          summary             : Show last execution summary
-          engines             : List AI engines
-          engine <name>       : Switch engine
-          auto                : Toggle auto-execution
-          ghost [on/off]      : Toggle ghost mode
-          silent              : Toggle error visibility
-          replay              : Re-execute last plan
-        {Color.YELLOW}Chat Commands:{Color.RESET}
-            chats              : List all chat sessions
-            chat <ID/num>      : Switch to specific chat
-            newchat [title]    : Start new chat session
-            currentchat        : Show current chat info
-            renamechat <title> : Rename current chat
-            deletechat <ID>    : Delete a chat session
-            exportchat [format]: Export chat (json/txt)
-            clearchat          : Clear current chat messages
-
-        {Color.BLUE}System:{Color.RESET}
-          cd [path]           : Change directory
-          clear/cls           : Clear screen
-          help                : This message
-          exit/quit           : Exit
-
-        {Color.MAGENTA}Status Icons:{Color.RESET}
-          ✅ Success    ❌ Failure    ⚠️  Warning
-          🔄 Retrying  🛠️  Fixing    📦 Installing
-          ⏭️  Skipped   ⏸️  Paused    ✨ Excellent
-        """)
+        sys.stdout.write(self._HELP_TEXT)
+        sys.stdout.flush()
 
     def do_exit(self, _=None):
         UI.print_system("Saving & Shutting down...")
@@ -3651,24 +5149,11 @@ class TerminalApp:
 # 7. INSTALLATION CHECK & MAIN
 # ==============================================================================
 
+@functools.lru_cache(maxsize=1)
 def check_dependencies():
-    """Check if required dependencies are installed"""
-    missing = []
-    
-    try:
-        import google.generativeai
-    except ImportError:
-        missing.append("google-generativeai")
-    
-    try:
-        from openai import OpenAI
-    except ImportError:
-        missing.append("openai")
-    
-    try:
-        import groq
-    except ImportError:
-        missing.append("groq")
+    """Check if required dependencies are installed (asks at most once per process)"""
+    # find_spec only; importing the SDKs here would undo the lazy loading in _get_engine()
+    missing = [package for engine, package in _ENGINE_PACKAGES.items() if not AI_ENGINES[engine]]
     
     if missing:
         print(f"\n{Color.YELLOW}⚠️  Missing AI dependencies:{Color.RESET}")
@@ -3681,7 +5166,6 @@ def check_dependencies():
         response = input(f"\n{Color.YELLOW}Install now? (y/n): {Color.RESET}").lower()
         if response == 'y':
             try:
-                import subprocess
                 subprocess.run([sys.executable, "-m", "pip", "install"] + missing)
                 print(f"{Color.GREEN}✅ Dependencies installed!{Color.RESET}")
                 return True